@@ -1,6 +1,7 @@
 #!/bin/sh
 
 python manage.py migrate
+python manage.py expire_uploads
 python manage.py collectstatic --no-input --clear
 
 
@@ -0,0 +1,136 @@
+"""
+Compare the fasta parser in browser/Fasta.py with the line based parser it replaced.
+
+Run from the ribograph folder, ideally on a real transcriptome such as
+gencode.v38.transcripts.fa.gz:
+
+    python -m benchmarks.fasta /path/to/transcripts.fa.gz
+
+Without a path, a synthetic gzipped transcriptome of human size is generated.
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser.Fasta import FastaFile
+
+
+class LegacyFastaFile:
+    """
+    The previous implementation of FastaFile: a line by line parser over a text stream.
+    """
+
+    def __init__(self, file):
+        myopen = gzip.open if file.endswith(".gz") else open
+        self.f = myopen(file, "rt")
+        self.current_header = ""
+        self.current_sequence = list()
+
+    def __getitem__(self, index):
+        for raw_line in self.f:
+            line = raw_line.strip()
+            if not line:
+                continue
+
+            if line[0] == ">":
+                if not self.current_header:
+                    self.current_header = (line[1:].split())[0]
+                    self.current_sequence = list()
+                else:
+                    this_entry = (self.current_header, "".join(self.current_sequence))
+                    self.current_header = (line[1:].split())[0]
+                    self.current_sequence = list()
+                    return this_entry
+            else:
+                self.current_sequence.append(line)
+
+        if len(self.current_sequence) > 0:
+            this_entry = (self.current_header, "".join(self.current_sequence))
+            self.current_sequence = list()
+            return this_entry
+
+        raise IndexError
+
+    def __del__(self):
+        self.f.close()
+
+
+def make_transcriptome(path, number_of_transcripts, seed=0):
+    """
+    Roughly the size distribution of the human transcriptome:
+    ~250k transcripts with a median length around 1.5kb.
+    """
+    rng = random.Random(seed)
+    block = "".join(rng.choice("ACGT") for _ in range(1 << 16))
+    with gzip.open(path, "wt", compresslevel=6) as output_stream:
+        for i in range(number_of_transcripts):
+            length = min(int(rng.lognormvariate(7.3, 0.8)) + 50, len(block))
+            start = rng.randrange(len(block) - length + 1)
+            sequence = block[start : start + length]
+            output_stream.write(
+                ">ENST{:011d}.1|ENSG{:011d}.1|description\n".format(i, i)
+            )
+            for j in range(0, length, 60):
+                output_stream.write(sequence[j : j + 60] + "\n")
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def run(path, repeat=3):
+    cases = {
+        "legacy: header -> sequence": lambda: {h: s for h, s in LegacyFastaFile(path)},
+        "legacy: header -> length": lambda: {
+            h: len(s) for h, s in LegacyFastaFile(path)
+        },
+        "FastaFile: entries": lambda: {e.header: e.sequence for e in FastaFile(path)},
+        "FastaFile.records": lambda: dict(FastaFile(path).records()),
+        "FastaFile.lengths": lambda: dict(FastaFile(path).lengths()),
+    }
+
+    results = {}
+    for name, case in cases.items():
+        times = []
+        for _ in range(repeat):
+            elapsed, output = timed(case)
+            times.append(elapsed)
+        results[name] = (min(times), len(output))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("fasta", nargs="?", help="gzipped fasta file")
+    parser.add_argument("--transcripts", type=int, default=250000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    path = args.fasta
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), "synthetic_transcriptome.fa.gz")
+        if not os.path.exists(path):
+            print("Generating {} ...".format(path))
+            make_transcriptome(path, args.transcripts)
+
+    results = run(path, repeat=args.repeat)
+    baseline = results["legacy: header -> sequence"][0]
+    print("{:<30} {:>10} {:>10} {:>10}".format("case", "seconds", "speedup", "entries"))
+    for name, (elapsed, entries) in results.items():
+        print(
+            "{:<30} {:>10.2f} {:>9.1f}x {:>10}".format(
+                name, elapsed, baseline / elapsed, entries
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Time every registered API and the ingestion helpers on synthetic data.
+
+Run from the ribograph folder:
+
+    python -m benchmarks.suite --size small --size medium --output results.json
+    python -m benchmarks.suite --size small --baseline results.json
+
+The ribo files and references are generated once (see benchmarks/synthetic.py)
+and the database is a throwaway test database. Every case is run once with
+empty caches ("cold") and then repeat times with only the response cache
+cleared, so the API timings include the reads but not the cached responses.
+
+The results are written as JSON. With --baseline, a case whose median is more
+than threshold times its median in the baseline (and slower by at least
+MIN_DELTA seconds) is a regression, and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ribograph.settings")
+
+import django
+
+django.setup()
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from ribopy import Ribo
+
+from browser.models import Project, Experiment, Reference
+from browser.api import (
+    api_response_cache,
+    gene_correlation_helper,
+    register_experiment_api,
+    register_project_api,
+    ribo_handle_pool,
+)
+from browser.cache import memoized
+from browser.Fasta import FastaFile
+from browser.ingestion import RiboIngestion, choose_transcript_regex, digest_reference
+from browser.jobs import enqueue
+
+from benchmarks.synthetic import SIZES, make_dataset
+
+RESULTS_VERSION = 1
+
+# A case is a regression if its median grows by more than this factor...
+DEFAULT_THRESHOLD = 1.25
+# ... and by more than this many seconds, so that the fastest cases are not all noise.
+MIN_DELTA = 0.002
+
+
+def clear_caches():
+    api_response_cache.clear()
+    ribo_handle_pool.clear()
+    for func in memoized.values():
+        func.cache_clear()
+
+
+def measure(func, repeat, setup=None):
+    """
+    The time of a first call of func with empty caches and of repeat more calls.
+    setup, if given, runs untimed before every call.
+    """
+    times = []
+    clear_caches()
+    for _ in range(repeat + 1):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        "cold": times[0],
+        "min": min(times[1:]),
+        "median": statistics.median(times[1:]),
+        "max": max(times[1:]),
+        "repeat": repeat,
+    }
+
+
+class Dataset:
+    """
+    The database objects of a project holding the ribo files of a size.
+    """
+
+    def __init__(self, ribo_file_paths, reference_path):
+        self.ribo_file_paths = ribo_file_paths
+        self.reference_path = reference_path
+
+        self.user, _ = User.objects.get_or_create(username="benchmark")
+        self.reference = Reference.objects.create(
+            name=os.path.basename(reference_path),
+            reference_file_path=reference_path,
+            owner=self.user,
+        )
+        enqueue("index_reference", reference_id=self.reference.id)
+
+        self.project = Project.objects.create(
+            name=os.path.basename(reference_path), owner=self.user, public=True
+        )
+        self.experiments = []
+        for path in ribo_file_paths:
+            ingestion = RiboIngestion.run(path)
+            for name in ingestion.experiments:
+                self.experiments.append(
+                    Experiment.objects.create(
+                        name=name,
+                        project=self.project,
+                        ribo_file_path=path,
+                        transcript_regex=ingestion.transcript_regex,
+                        reference=self.reference,
+                        reference_digest=ingestion.reference_digest,
+                    )
+                )
+        self.ingestion = ingestion
+
+        with ribo_handle_pool.lease(path, ingestion.transcript_regex) as ribo:
+            self.genes = (
+                ribo.alias.aliases if ribo.alias is not None else ribo.transcript_names
+            )
+
+    def experiment_api_params(self):
+        offsets = ",".join(
+            ["12"] * (self.ingestion.length_max - self.ingestion.length_min + 1)
+        )
+        return {
+            "getMetageneCounts": {"site": "start"},
+            "getCoverage": {"gene": self.genes[0]},
+            "getOffsetCoverage": {"gene": self.genes[0], "offsets": offsets},
+            "getCoverageBatch": {"gene": list(self.genes[:50])},
+            "searchGenes": {"q": self.genes[0][:4]},
+        }
+
+    def project_api_params(self):
+        return {
+            "getExperimentsCoverage": {
+                "gene": self.genes[0],
+                "experiment": [e.id for e in self.experiments],
+            },
+            "getGeneCorrelations": {
+                "referenceHash": self.ingestion.reference_digest,
+                "range_lower": self.ingestion.length_min,
+                "range_upper": self.ingestion.length_max,
+            },
+        }
+
+
+def api_cases(dataset):
+    """
+    (case name, url, params) of every registered API.
+    """
+    experiment_params = dataset.experiment_api_params()
+    for endpoint in sorted(register_experiment_api.all):
+        url = "/api/experiment/{}/{}".format(dataset.experiments[0].id, endpoint)
+        yield "api:" + endpoint, url, experiment_params.get(endpoint, {})
+
+    project_params = dataset.project_api_params()
+    for endpoint in sorted(register_project_api.all):
+        url = "/api/project/{}/{}".format(dataset.project.id, endpoint)
+        yield "api:" + endpoint, url, project_params.get(endpoint, {})
+
+
+def run_size(size_name, folder, repeat=5):
+    """
+    Time every case on the data of a size. Returns a list of result dicts.
+    """
+    size = SIZES[size_name]
+    ribo_file_paths, reference_path = make_dataset(folder, size, appris=True)
+    dataset = Dataset(ribo_file_paths, reference_path)
+    ribo_file_path = ribo_file_paths[0]
+
+    cases = [
+        ("FastaFile.records", lambda: dict(FastaFile(reference_path).records())),
+        ("FastaFile.lengths", lambda: dict(FastaFile(reference_path).lengths())),
+        (
+            "gene_correlation_helper",
+            lambda: gene_correlation_helper.__wrapped__(
+                dataset.project,
+                dataset.ingestion.reference_digest,
+                dataset.ingestion.length_min,
+                dataset.ingestion.length_max,
+            ),
+        ),
+    ]
+
+    results = []
+
+    def record(case, timings, status="ok"):
+        results.append(dict(timings, size=size_name, case=case, status=status))
+
+    for case, func in cases:
+        record(case, measure(func, repeat))
+
+    # a new handle every time, so that the transcript names are read again
+    handle = []
+    record(
+        "digest_reference",
+        measure(
+            lambda: digest_reference(handle[-1]),
+            repeat,
+            setup=lambda: handle.append(Ribo(ribo_file_path)),
+        ),
+    )
+    record(
+        "choose_transcript_regex",
+        measure(
+            lambda: choose_transcript_regex(handle[-1].transcript_names),
+            repeat,
+            setup=lambda: handle.append(Ribo(ribo_file_path)),
+        ),
+    )
+    del handle[:]
+
+    client = Client()
+    for case, url, params in api_cases(dataset):
+        statuses = set()
+
+        def call():
+            statuses.add(client.get(url, params).status_code)
+
+        timings = measure(call, repeat, setup=api_response_cache.clear)
+        status = "ok" if statuses == {200} else "status {}".format(sorted(statuses))
+        record(case, timings, status)
+
+    clear_caches()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, min_delta=MIN_DELTA):
+    """
+    The cases of results that are slower than in baseline (both as written by main).
+    """
+    before = {(r["size"], r["case"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        previous = before.get((result["size"], result["case"]))
+        if previous is None or {result["status"], previous["status"]} != {"ok"}:
+            continue
+        if (
+            result["median"] > threshold * previous["median"]
+            and result["median"] - previous["median"] > min_delta
+        ):
+            regressions.append(
+                {
+                    "size": result["size"],
+                    "case": result["case"],
+                    "baseline": previous["median"],
+                    "median": result["median"],
+                    "ratio": result["median"] / previous["median"],
+                }
+            )
+    return regressions
+
+
+def run(sizes, folder, repeat=5, threshold=DEFAULT_THRESHOLD):
+    """
+    Run the suite on a throwaway database.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        results = []
+        for size_name in sizes:
+            results.extend(run_size(size_name, folder, repeat))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    return {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "sizes": {name: SIZES[name] for name in sizes},
+        "threshold": threshold,
+        "min_delta": MIN_DELTA,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--size",
+        action="append",
+        choices=list(SIZES),
+        help="data sizes to run (repeatable, default: small)",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--data",
+        default=os.path.join(tempfile.gettempdir(), "ribograph_benchmarks"),
+        help="folder of the generated files, kept between runs",
+    )
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare to")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    os.makedirs(args.data, exist_ok=True)
+    results = run(args.size or ["small"], args.data, args.repeat, args.threshold)
+
+    print(
+        "{:<8} {:<30} {:>10} {:>10} {:>10}  {}".format(
+            "size", "case", "cold", "median", "min", "status"
+        )
+    )
+    for r in results["results"]:
+        print(
+            "{:<8} {:<30} {:>10.4f} {:>10.4f} {:>10.4f}  {}".format(
+                r["size"], r["case"], r["cold"], r["median"], r["min"], r["status"]
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as output_stream:
+            json.dump(results, output_stream, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as input_stream:
+            baseline = json.load(input_stream)
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(
+                "REGRESSION {size} {case}: {baseline:.4f}s -> {median:.4f}s "
+                "({ratio:.2f}x)".format(**r)
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
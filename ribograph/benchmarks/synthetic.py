@@ -0,0 +1,110 @@
+"""
+Synthetic ribo files and references for the benchmarks.
+
+The files are built with the test fixtures (browser/tests/ribo_fixtures.py), with
+transcript lengths drawn from roughly the distribution of a real transcriptome.
+Generating the larger sizes takes a while, so the files are kept in a folder and
+reused as long as the size does not change.
+"""
+import os
+import random
+
+from browser.tests.ribo_fixtures import (
+    make_ribo_file,
+    make_reference_file,
+    transcript_names,
+)
+
+# Every size is a number of transcripts, experiments per ribo file, read lengths
+# and reads per experiment. A project of a size holds files_per_project files.
+SIZES = {
+    "tiny": {
+        "transcripts": 20,
+        "experiments": 2,
+        "length_min": 25,
+        "length_max": 32,
+        "reads": 2000,
+        "files_per_project": 1,
+    },
+    "small": {
+        "transcripts": 500,
+        "experiments": 2,
+        "length_min": 25,
+        "length_max": 32,
+        "reads": 50000,
+        "files_per_project": 2,
+    },
+    "medium": {
+        "transcripts": 5000,
+        "experiments": 4,
+        "length_min": 20,
+        "length_max": 40,
+        "reads": 500000,
+        "files_per_project": 2,
+    },
+    "large": {
+        "transcripts": 20000,
+        "experiments": 8,
+        "length_min": 15,
+        "length_max": 45,
+        "reads": 2000000,
+        "files_per_project": 4,
+    },
+}
+
+
+def transcript_lengths(number_of_transcripts, seed=0):
+    """
+    Lengths with a median around 1.5kb, long enough for the fixture annotation
+    (a 50 nt 5' UTR and a 60 nt 3' UTR).
+    """
+    rng = random.Random(seed)
+    return [
+        min(int(rng.lognormvariate(7.3, 0.8)) + 300, 20000)
+        for _ in range(number_of_transcripts)
+    ]
+
+
+def size_name(size) -> str:
+    return "t{transcripts}-e{experiments}-l{length_min}_{length_max}-r{reads}".format(
+        **size
+    )
+
+
+def make_dataset(folder, size, appris=False):
+    """
+    The ribo files (files_per_project of them) and the gzipped reference of a size,
+    created in folder unless they are already there.
+    Returns the ribo file paths and the reference path.
+    """
+    prefix = os.path.join(folder, size_name(size) + ("-appris" if appris else ""))
+    lengths = transcript_lengths(size["transcripts"])
+
+    ribo_file_paths = []
+    for i in range(size["files_per_project"]):
+        path = "{}-{}.ribo".format(prefix, i)
+        if not os.path.exists(path):
+            experiments = ["exp{}_{}".format(i, j) for j in range(size["experiments"])]
+            make_ribo_file(
+                path + ".partial",
+                experiments=experiments,
+                reads_per_experiment=size["reads"],
+                appris=appris,
+                seed=i,
+                length_min=size["length_min"],
+                length_max=size["length_max"],
+                lengths=lengths,
+            )
+            os.replace(path + ".partial", path)
+        ribo_file_paths.append(path)
+
+    reference_path = prefix + ".fa.gz"
+    if not os.path.exists(reference_path):
+        make_reference_file(
+            reference_path + ".partial",
+            transcript_names(len(lengths), appris=appris),
+            lengths,
+        )
+        os.replace(reference_path + ".partial", reference_path)
+
+    return ribo_file_paths, reference_path
@@ -1,6 +1,83 @@
 import gzip
+import os
+import sys
 import django
 
+# Size of the blocks read from fasta files
+READ_SIZE = 1 << 22
+
+_WHITESPACE = b" \t\r\n"
+
+_COMPLEMENTS = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+_NUCLEOTIDES = str.maketrans("", "", "ACGTNacgtn")
+
+
+def _header_name(header_line):
+    """
+    The name of an entry is the first word of its header line.
+    """
+    words = header_line.split(None, 1)
+    return words[0] if words else b""
+
+
+def read_fasta_records(stream, sequences=True):
+    """
+    Parse a binary fasta stream in large blocks.
+
+    Yields (header, sequence) pairs of bytes, or (header, sequence length) pairs
+    if sequences is False, in which case sequences are never assembled.
+    """
+    header = None
+    parts = []
+    length = 0
+    tail = b""
+
+    def finish():
+        if sequences:
+            return header, b"".join(parts).translate(None, _WHITESPACE)
+        return header, length
+
+    while True:
+        block = stream.read(READ_SIZE)
+        if block:
+            data = tail + block
+            # only complete lines are processed, the rest waits for the next block
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                tail = data
+                continue
+            data, tail = data[:cut], data[cut:]
+        elif tail:
+            data, tail = tail + b"\n", b""
+        else:
+            break
+
+        position = 0
+        end = len(data)
+        while position < end:
+            if data[position] == 62:  # ">"
+                line_end = data.find(b"\n", position)
+                if header is not None:
+                    yield finish()
+                header = _header_name(data[position + 1 : line_end])
+                parts = []
+                length = 0
+                position = line_end + 1
+            else:
+                next_header = data.find(b"\n>", position)
+                part_end = end if next_header == -1 else next_header + 1
+                if header is not None:
+                    if sequences:
+                        parts.append(data[position:part_end])
+                    else:
+                        length += len(
+                            data[position:part_end].translate(None, _WHITESPACE)
+                        )
+                position = part_end
+
+    if header is not None:
+        yield finish()
+
 
 class FastaEntry:
     """
@@ -17,55 +94,22 @@ class FastaEntry:
         self.sequence = sequence
 
     def reverse_complement(self):
-        complements = {
-            "A": "T",
-            "a": "t",
-            "C": "G",
-            "c": "g",
-            "G": "C",
-            "g": "c",
-            "T": "A",
-            "t": "a",
-            "N": "N",
-            "n": "n",
-        }
-        result = list()
-
-        for i in range(len(self.sequence) - 1, -1, -1):
-            try:
-                result.append(complements[self.sequence[i]])
-            except IndexError:
-                error_message = (
-                    "Invalid character (%s) in the fasta sequence with header \n"
-                    "%s" % (self.sequence[i], self.header)
-                )
-                raise IOError(error_message)
-        self.sequence = "".join(result)
+        invalid_characters = self.sequence.translate(_NUCLEOTIDES)
+        if invalid_characters:
+            error_message = (
+                "Invalid character (%s) in the fasta sequence with header \n"
+                "%s" % (invalid_characters[0], self.header)
+            )
+            raise IOError(error_message)
+        self.sequence = self.sequence.translate(_COMPLEMENTS)[::-1]
 
     def __str__(self):
         chunk_size = 50  # Do not change this!
         result_list = [">" + self.header]
-        sequence_size = len(self.sequence)
-        number_of_remaining_letters = sequence_size
-        number_of_processed_letters = 0
-
-        while number_of_remaining_letters > 0:
-            if number_of_remaining_letters <= chunk_size:
-                result_list.append(self.sequence[number_of_processed_letters:])
-                number_of_remaining_letters = 0
-                number_of_processed_letters = sequence_size
-            else:
-                new_number_of_processed_letters = (
-                    number_of_processed_letters + chunk_size
-                )
-                result_list.append(
-                    self.sequence[
-                        number_of_processed_letters:new_number_of_processed_letters
-                    ]
-                )
-                number_of_remaining_letters -= chunk_size
-                number_of_processed_letters = new_number_of_processed_letters
-
+        result_list.extend(
+            self.sequence[i : i + chunk_size]
+            for i in range(0, len(self.sequence), chunk_size)
+        )
         return "\n".join(result_list)
 
 
@@ -78,19 +122,19 @@ class FastaFile:
     For writing fasta files, we only need FastaEntry objects and using
     their str function, we can convert them to string and write to files.
     Note that it can be used as a context manager as well.
+
+    records() and lengths() give (header, sequence) and (header, length) pairs
+    without creating FastaEntry objects.
     """
 
     def __init__(self, file):
-        myopen = open
-        if file.endswith(".gz"):
-            myopen = gzip.open
         if file:
-            self.f = myopen(file, "rt")
+            myopen = gzip.open if file.endswith(".gz") else open
+            self.f = myopen(file, "rb")
         else:
-            self.f = stdin
+            self.f = sys.stdin.buffer
 
-        self.current_header = ""
-        self.current_sequence = list()
+        self._entries = None
 
     #####################################################
 
@@ -100,43 +144,108 @@ class FastaFile:
     #####################################################
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+        self.f.close()
 
     ######################################################
 
+    def records(self):
+        for header, sequence in read_fasta_records(self.f):
+            yield header.decode(), sequence.decode()
+
+    def lengths(self):
+        for header, length in read_fasta_records(self.f, sequences=False):
+            yield header.decode(), length
+
+    def __iter__(self):
+        for header, sequence in self.records():
+            yield FastaEntry(header=header, sequence=sequence)
+
     def __getitem__(self, index):
+        # Entries are read sequentially, the index is ignored.
+        if self._entries is None:
+            self._entries = iter(self)
+        try:
+            return next(self._entries)
+        except StopIteration:
+            raise IndexError
 
-        for raw_line in self.f:
-            line = raw_line.strip()
-            if not line:
-                continue
+    #########################################################
 
-            if line[0] == ">":
-                if not self.current_header:
-                    self.current_header = (line[1:].split())[0]
-                    self.current_sequence = list()
-                else:
-                    this_entry = FastaEntry(
-                        header=self.current_header,
-                        sequence="".join(self.current_sequence),
-                    )
-                    self.current_header = (line[1:].split())[0]
-                    self.current_sequence = list()
-                    return this_entry
-            else:
-                self.current_sequence.append(line)
+    def __del__(self):
+        if hasattr(self, "f"):
+            self.f.close()
 
-        # this returns the last entry
-        if len(self.current_sequence) > 0:
-            this_entry = FastaEntry(
-                header=self.current_header, sequence="".join(self.current_sequence)
-            )
-            self.current_sequence = list()
-            return this_entry
 
-        raise IndexError
+############################################################################################
 
-    #########################################################
+
+def fasta_index_paths(fasta_file_path):
+    """
+    Paths of the sequence blob and the index of an indexed fasta file.
+    """
+    base = fasta_file_path[:-3] if fasta_file_path.endswith(".gz") else fasta_file_path
+    return base + ".seq", base + ".fai"
+
+
+def build_fasta_index(fasta_file_path):
+    """
+    Write all sequences of a (possibly gzipped) fasta file, one after the other
+    and without line breaks, into a sequence blob. The index is a tab separated
+    file of header, offset in the blob and sequence length.
+    Both files are written next to the fasta file. Returns their paths.
+    """
+    sequence_path, index_path = fasta_index_paths(fasta_file_path)
+
+    offset = 0
+    with open(sequence_path + ".tmp", "wb") as sequence_stream, open(
+        index_path + ".tmp", "w"
+    ) as index_stream:
+        with FastaFile(fasta_file_path) as fasta:
+            for header, sequence in read_fasta_records(fasta.f):
+                sequence_stream.write(sequence)
+                index_stream.write(
+                    "{}\t{}\t{}\n".format(header.decode(), offset, len(sequence))
+                )
+                offset += len(sequence)
+
+    os.replace(sequence_path + ".tmp", sequence_path)
+    os.replace(index_path + ".tmp", index_path)
+    return sequence_path, index_path
+
+
+class IndexedFasta:
+    """
+    Random access to the sequences of a fasta file indexed by build_fasta_index.
+    A sequence is fetched with a single read without loading the rest of the file.
+    """
+
+    def __init__(self, fasta_file_path):
+        sequence_path, index_path = fasta_index_paths(fasta_file_path)
+
+        self.index = dict()
+        with open(index_path) as index_stream:
+            for line in index_stream:
+                header, offset, length = line.rstrip("\n").split("\t")
+                self.index[header] = (int(offset), int(length))
+
+        self.fd = os.open(sequence_path, os.O_RDONLY)
+
+    def __contains__(self, header):
+        return header in self.index
+
+    def __getitem__(self, header):
+        offset, length = self.index[header]
+        return os.pread(self.fd, length, offset).decode("ascii")
+
+    def get(self, header, default=None):
+        if header not in self.index:
+            return default
+        return self[header]
+
+    @property
+    def lengths(self):
+        return {header: length for header, (_, length) in self.index.items()}
 
     def __del__(self):
-        self.f.close()
+        if hasattr(self, "fd"):
+            os.close(self.fd)
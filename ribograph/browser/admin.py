@@ -1,8 +1,8 @@
 from django.contrib import admin
 
-from .models import Experiment, Project, Reference
+from .models import Experiment, Project, Reference, Job
 
-my_models = [Experiment, Project, Reference]
+my_models = [Experiment, Project, Reference, Job]
 
 for m in my_models:
     admin.site.register(m)
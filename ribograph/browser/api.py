@@ -1,9 +1,14 @@
-import re
-from functools import lru_cache, reduce
+import os
+import json
+import logging
+import threading
+from hashlib import md5
+from contextlib import contextmanager
+from functools import partial, reduce
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from scipy.stats import spearmanr
 from cachetools.keys import hashkey
-from cachetools import TTLCache, cached
+from cachetools import TTLCache
 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import (
@@ -13,17 +18,61 @@ from django.http import (
     JsonResponse,
     HttpResponseNotFound,
 )
-from django.views.decorators.gzip import gzip_page
+from django.middleware.gzip import re_accepts_gzip
 from django.views.decorators.cache import cache_control
-
-from .models import Experiment, Project, Reference
-from .Fasta import FastaFile
+from django.views.decorators.csrf import csrf_exempt
+
+from .models import Experiment, Job, Project, Reference
+from .Fasta import IndexedFasta, build_fasta_index, fasta_index_paths
+from .cache import make_cache, cached_response, memoize, memoized
+from .async_api import async_api_view
+from .metrics import (
+    collect_memoized,
+    collect_stats,
+    phase,
+    registry as metrics_registry,
+    timed_gzip_page,
+    timed_view,
+)
+from .compute import (
+    ComputeTimeout,
+    compute_backend,
+    gene_correlations,
+    ribo_handle_pool,
+)
+from .coverage import (
+    COVERAGE_AGGREGATES,
+    bin_coverage,
+    read_coverage_window,
+    read_transcript_coverages,
+    split_coverage,
+)
+from .summary import load_summary, file_digest
+from .jobs import enqueue
+from .gene_index import GeneIndex, GENE_MATCHES, GENE_SORTS
+from .offsets import (
+    AUTO_OFFSET_SEARCH_BOUNDS,
+    apply_offsets,
+    auto_offsets,
+    parse_offsets,
+)
+from .wire import split, split_frame, negotiate_format, encode_response, not_acceptable
+from .correlation import CORRELATION_METHODS, correlations_to_list
+from ribograph.settings import (
+    API_CACHE,
+    COVERAGE_BATCH_LIMIT,
+    COVERAGE_READ_WORKERS,
+    GENE_SEARCH_LIMIT,
+    GENE_SEARCH_MAX_LIMIT,
+)
 
 import ribopy
 from ribopy import Ribo
 from ribopy.core.get_gadgets import get_region_boundaries, get_reference_names
 import time
 
+logger = logging.getLogger(__name__)
+
 
 def camelCase(st: str):
     """
@@ -33,23 +82,103 @@ def camelCase(st: str):
     return output[0].lower() + output[1:]
 
 
-@cached(cache=TTLCache(maxsize=64, ttl=300))
-def get_ribo(experiment: Experiment) -> Ribo:
+@contextmanager
+def lease_ribo(experiment: Experiment):
     """
-    Create a ribo object for the given experiment with the appropriate aliasing.
+    Lease a ribo object for the given experiment with the appropriate aliasing.
+    Experiments stored in the same ribo file share the same open handle, which
+    stays open until the block ends.
     """
-    alias = None
-    if experiment.transcript_regex:
-        alias = lambda x: re.search(experiment.transcript_regex, x).group(1)
-    return Ribo(experiment.ribo_file_path, alias=alias)
+    with phase("handle"):
+        ribo = ribo_handle_pool.acquire(
+            experiment.ribo_file_path, experiment.transcript_regex
+        )
+    try:
+        yield ribo
+    finally:
+        ribo_handle_pool.release(ribo)
 
 
 def request_key(*args, **kwargs):
     """
-    Hashes an API request by its path. This is how we tell if a request is cached.
+    Hashes an API request by its path and the format it is encoded in.
+    This is how we tell if a request is cached.
+    Responses are cached after compression, so whether the client accepts
+    gzip is part of the key.
     """
     request = args[0]
-    return hashkey(request.get_full_path(), request.user.is_authenticated)
+    accepts_gzip = bool(
+        re_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    )
+    if request.method == "POST":
+        # the parameters of POST requests are in the body
+        return hashkey(
+            request.get_full_path(),
+            request.user.is_authenticated,
+            negotiate_format(request),
+            accepts_gzip,
+            md5(request.body).hexdigest(),
+        )
+    return hashkey(
+        request.get_full_path(),
+        request.user.is_authenticated,
+        negotiate_format(request),
+        accepts_gzip,
+    )
+
+
+# One response cache for all registered APIs. Depending on the backend,
+# it is either private to this process or shared by all workers.
+api_response_cache = make_cache(API_CACHE)
+
+metrics_registry.register(
+    lambda const_labels: collect_stats(
+        "ribograph_response_cache",
+        "API response cache",
+        api_response_cache.stats(),
+        counters=("hits", "misses", "evictions"),
+        gauges=("bytes", "max_bytes"),
+        const_labels=const_labels,
+    )
+)
+metrics_registry.register(
+    lambda const_labels: collect_stats(
+        "ribograph_ribo_handles",
+        "Pool of open ribo files",
+        ribo_handle_pool.stats(),
+        counters=("opens", "reuses", "evictions"),
+        gauges=("open", "leased", "max_open"),
+        const_labels=const_labels,
+    )
+)
+metrics_registry.register(partial(collect_memoized, memoized))
+
+
+def load_experiment(request, experiment_id, **kwargs) -> Experiment:
+    with phase("db"):
+        experiment = get_object_or_404(
+            Experiment.objects.select_related("project", "reference"), id=experiment_id
+        )
+    # check permissions - either the project is public or a user is logged in
+    if not (request.user.is_authenticated or experiment.project.public):
+        raise Http404
+    return experiment
+
+
+def experiment_response(f, experiment, wire_format, request, *args, **kwargs):
+    with lease_ribo(experiment) as ribo, phase("read"):
+        result = f(ribo, experiment, request, *args, **kwargs)
+        if not isinstance(result, HttpResponse):
+            # inject this info into every response
+            result["experiment"] = experiment.name
+            result["min"] = int(ribo.minimum_length)
+            result["totalReads"] = int(
+                ribo._handle["experiments"][experiment.name].attrs["total_reads"]
+            )
+    if not isinstance(result, HttpResponse):
+        with phase("serialize"):
+            result = encode_response(result, wire_format)
+    return result
 
 
 def make_experiment_api_registrar():
@@ -57,75 +186,107 @@ def make_experiment_api_registrar():
     Returns a decorator that wraps experiment level APIs. This decorater
     centralizes some common logic, including getting the ribo and experiment
     objects, authenticating requests, and caching responses.
+    The async variants of the APIs (see async_api.py) are kept in .async_all.
     """
     registry = {}
+    async_registry = {}
 
     def registrar(func):
         def api_decorator(f):
-            @cached(cache=TTLCache(maxsize=128, ttl=600), key=request_key)
+            # APIs are read only, so they may also be called with POST bodies
+            @csrf_exempt
+            @timed_view(camelCase(f.__name__))
+            @cached_response(api_response_cache, key=request_key, namespace="e:")
             @cache_control(max_age=60 * 15)
-            @gzip_page
+            @timed_gzip_page
             def wrapper(*args, **kwargs):
                 request = args[0]
                 assert "experiment_id" in kwargs and "project_id" not in kwargs
-                experiment = Experiment.objects.get(id=kwargs["experiment_id"])
-                # check permissions - either the project is public or a user is logged in
-                if not (request.user or experiment.project.public):
-                    raise Http404
-                ribo = get_ribo(experiment)
-                result = f(ribo, experiment, *args, **kwargs)
-                if not isinstance(result, HttpResponse):
-                    # inject this info into every response
-                    result["experiment"] = experiment.name
-                    result["min"] = int(ribo.minimum_length)
-                    result["totalReads"] = int(
-                        ribo._handle["experiments"][experiment.name].attrs[
-                            "total_reads"
-                        ]
-                    )
-                if not isinstance(result, HttpResponse):
-                    result = JsonResponse(result)
-                return result
+                wire_format = negotiate_format(request)
+                if wire_format is None:
+                    return not_acceptable()
+                experiment = load_experiment(request, **kwargs)
+                return experiment_response(f, experiment, wire_format, *args, **kwargs)
 
             return wrapper
 
         registry[camelCase(func.__name__)] = api_decorator(func)
+        async_registry[camelCase(func.__name__)] = async_api_view(
+            load_experiment,
+            partial(experiment_response, func),
+            limit_key=lambda experiment: experiment.ribo_file_path,
+            cache=api_response_cache,
+            key=request_key,
+            namespace="e:",
+            endpoint=camelCase(func.__name__),
+        )
         return api_decorator(func)
 
     registrar.all = registry
+    registrar.async_all = async_registry
     return registrar
 
 
+def load_project(request, project_id, **kwargs) -> Project:
+    with phase("db"):
+        project = get_object_or_404(Project, id=project_id)
+    if not (request.user.is_authenticated or project.public):
+        raise Http404
+    return project
+
+
+def project_response(f, project, wire_format, request, *args, **kwargs):
+    with phase("read"):
+        result = f(project, request, *args, **kwargs)
+    if not isinstance(result, HttpResponse):
+        with phase("serialize"):
+            result = encode_response(result, wire_format)
+    return result
+
+
 def make_project_api_registrar():
     """
     Returns a decorator that wraps experiment level APIs. This decorater
     centralizes some common logic, including getting the project
     object, authenticating requests, and caching responses.
+    The async variants of the APIs (see async_api.py) are kept in .async_all.
     """
     registry = {}
+    async_registry = {}
 
     def registrar(func):
         def api_decorator(f):
-            @cached(cache=TTLCache(maxsize=128, ttl=600), key=request_key)
+            @csrf_exempt
+            @timed_view(camelCase(f.__name__))
+            @cached_response(api_response_cache, key=request_key, namespace="p:")
             @cache_control(max_age=60 * 15)
-            @gzip_page
+            @timed_gzip_page
             def wrapper(*args, **kwargs):
                 request = args[0]
                 assert "project_id" in kwargs and "experiment_id" not in kwargs
-                project = Project.objects.get(id=kwargs["project_id"])
-                if not (request.user.is_authenticated or project.public):
-                    raise Http404
-                result = f(project, *args, **kwargs)
-                if not isinstance(result, HttpResponse):
-                    result = JsonResponse(result)
-                return result
+                wire_format = negotiate_format(request)
+                if wire_format is None:
+                    return not_acceptable()
+                project = load_project(request, **kwargs)
+                return project_response(f, project, wire_format, *args, **kwargs)
 
             return wrapper
 
         registry[camelCase(func.__name__)] = api_decorator(func)
+        async_registry[camelCase(func.__name__)] = async_api_view(
+            load_project,
+            partial(project_response, func),
+            # project APIs read several files, so they are capped per project
+            limit_key=lambda project: "project:{}".format(project.id),
+            cache=api_response_cache,
+            key=request_key,
+            namespace="p:",
+            endpoint=camelCase(func.__name__),
+        )
         return api_decorator(func)
 
     registrar.all = registry
+    registrar.async_all = async_registry
     return registrar
 
 
@@ -133,6 +294,40 @@ register_experiment_api = make_experiment_api_registrar()
 register_project_api = make_project_api_registrar()
 
 
+def summary_request_key(ribo_file_path: str):
+    return file_digest(ribo_file_path)
+
+
+@memoize(TTLCache(maxsize=4096, ttl=24 * 3600), key=summary_request_key)
+def request_summary(ribo_file_path: str):
+    """
+    Build a missing summary, in a background job if there are workers and right
+    away otherwise. This is done once per file (by digest) and per day, so read
+    requests do not touch the job table every time, and a build that failed
+    (e.g. on an unreadable file) is not tried over and over.
+    Returns the job.
+    """
+    return enqueue("build_summary", unique=True, ribo_file_path=ribo_file_path)
+
+
+def get_summary(experiment: Experiment):
+    """
+    The precomputed summary of the experiment's ribo file, if it has one.
+    """
+    summary = load_summary(experiment.ribo_file_path)
+    if summary is None:
+        # files registered before summaries existed get one
+        job = request_summary(experiment.ribo_file_path)
+        if job.status != Job.DONE:
+            return None
+        summary = load_summary(experiment.ribo_file_path)
+        if summary is None:
+            return None
+    if experiment.name not in summary.experiments:
+        return None
+    return summary
+
+
 @register_experiment_api
 def get_metadata(ribo, experiment: Experiment, *args, **kwargs):
     return {
@@ -147,6 +342,10 @@ def get_region_percentages(ribo, experiment: Experiment, *args, **kwarg):
     """
     Returns a triplet of percentages for the regions (5' UTR, CDS, 3' UTR) for each read length.
     """
+    summary = get_summary(experiment)
+    if summary:
+        return summary.region_percentages(experiment.name)
+
     region_counts = [
         ribo.get_region_counts(
             experiments=[experiment.name],
@@ -157,8 +356,9 @@ def get_region_percentages(ribo, experiment: Experiment, *args, **kwarg):
         ).rename(columns={experiment.name: region})
         for region in ("UTR5", "CDS", "UTR3")
     ]
-    combined_region_counts = reduce(lambda x, y: x.join(y), region_counts)
-    return combined_region_counts.to_dict(orient="split")
+    with phase("transform"):
+        combined_region_counts = reduce(lambda x, y: x.join(y), region_counts)
+        return split_frame(combined_region_counts)
 
 
 @register_experiment_api
@@ -166,68 +366,211 @@ def get_length_distribution(ribo, experiment: Experiment, *args, **kwargs):
     """
     Get the distribution of read lengths for this experiment.
     """
+    summary = get_summary(experiment)
+    if summary:
+        return {
+            "min": summary.length_min,
+            "data": summary.length_distribution(experiment.name),
+        }
+
     length_df = ribo.get_length_dist(region_name="CDS", experiments=[experiment.name])
     length_dist = list(length_df[experiment.name])
     return {"min": int(length_df.index.values[0]), "data": length_dist}
 
 
+def parse_length_range(params, length_min, length_max):
+    """
+    The read lengths range_lower to range_upper of a request, all of them by default.
+    Raises ValueError for invalid parameters.
+    """
+    try:
+        range_lower = int(params.get("range_lower", length_min))
+        range_upper = int(params.get("range_upper", length_max))
+    except ValueError:
+        raise ValueError("range_lower and range_upper must be integers")
+    if not length_min <= range_lower <= range_upper <= length_max:
+        raise ValueError(
+            "read lengths must be within {} and {}".format(length_min, length_max)
+        )
+    return range_lower, range_upper
+
+
 @register_experiment_api
 def get_metagene_counts(ribo, experiment: Experiment, request, *args, **kwargs):
     """
     Get the metagene counts around the start or stop site for this experiment.
     User must provide the site as a URL paramater (either 'start' or 'stop')
+
+    With offsets (a comma separated list, one per read length from range_lower to
+    range_upper, all lengths by default), the counts of each read length are
+    shifted by its offset and summed, as for getOffsetCoverage.
     """
     site_type = request.GET.get("site")
     if site_type is None:
         return HttpResponseBadRequest(
             "site type must be provided as a url parameter (either 'start' or 'stop')"
         )
-    df = ribo.get_metagene(
-        site_type=site_type,
-        experiments=[experiment.name],
-        range_lower=ribo.minimum_length,
-        range_upper=ribo.maximum_length,
-        sum_lengths=False,
+    offsets = request.GET.get("offsets")
+    if offsets is not None:
+        try:
+            range_lower, range_upper = parse_length_range(
+                request.GET, int(ribo.minimum_length), int(ribo.maximum_length)
+            )
+            offsets = parse_offsets(offsets, range_upper - range_lower + 1)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+    summary = get_summary(experiment)
+    if summary and site_type in ("start", "stop"):
+        counts = summary.metagene_counts(experiment.name, site_type)
+    else:
+        df = ribo.get_metagene(
+            site_type=site_type,
+            experiments=[experiment.name],
+            range_lower=ribo.minimum_length,
+            range_upper=ribo.maximum_length,
+            sum_lengths=False,
+        )
+        with phase("transform"):
+            df = df.reset_index()
+            counts = split_frame(
+                df[df["experiment"] == experiment.name]
+                .set_index(keys=["read_length"])
+                .drop(columns=["experiment"])
+            )
+    if offsets is None:
+        return counts
+
+    with phase("transform"):
+        first = counts["index"][0]
+        shifted = apply_offsets(
+            counts["data"][range_lower - first : range_upper - first + 1], offsets
+        )
+    return split(
+        shifted[None, :],
+        ["{}-{}".format(range_lower, range_upper)],
+        counts["columns"],
     )
-    df = df.reset_index()
+
+
+def gene_index_key(ribo, experiment: Experiment):
+    # the names depend on the aliases, so the regex is part of the key
     return (
-        df[df["experiment"] == experiment.name]
-        .set_index(keys=["read_length"])
-        .drop(columns=["experiment"])
-        .to_dict(orient="split")
+        file_digest(experiment.ribo_file_path),
+        experiment.name,
+        experiment.transcript_regex,
     )
 
 
+@memoize(TTLCache(maxsize=64, ttl=3600), key=gene_index_key)
+def get_gene_index(ribo, experiment: Experiment) -> GeneIndex:
+    """
+    The search index of the genes of an experiment, built from the precomputed
+    summary when the file has one.
+    """
+    names = ribo.alias.aliases if ribo.alias != None else ribo.transcript_names
+    summary = get_summary(experiment)
+    if summary:
+        counts = summary.cds_counts[summary.index(experiment.name)]
+    else:
+        counts = (
+            ribo.get_region_counts(
+                "CDS", sum_references=False, experiments=[experiment.name]
+            )
+            .reindex(ribo.transcript_names)[experiment.name]
+            .to_numpy()
+        )
+    with phase("transform"):
+        return GeneIndex(names, counts)
+
+
 @register_experiment_api
 def list_genes(ribo, experiment: Experiment, *args, **kwargs):
     """
     Return a dict of the genes in an experiment mapped to and sorted by their frequency in the CDS.
     """
-    df = ribo.get_region_counts("CDS", sum_references=False, alias=(ribo.alias != None))
-    df = df.sort_values(by=[experiment.name], ascending=False)
-    genes = df.to_dict()[experiment.name]
-    return {"genes": genes}
+    index = get_gene_index(ribo, experiment)
+    return {
+        "genes": dict(
+            zip(
+                index.names[index.by_count].tolist(),
+                index.counts[index.by_count].tolist(),
+            )
+        )
+    }
+
+
+@register_experiment_api
+def search_genes(ribo, experiment: Experiment, request, *args, **kwargs):
+    """
+    Search the genes of an experiment, one page at a time.
+
+    q:      the text to look for (case insensitive), all genes if empty
+    match:  "substring" (default) or "prefix"
+    sort:   "count" (by decreasing CDS count, default) or "name"
+    offset, limit: the page of the matching genes to return
+    """
+    query = request.GET.get("q", "")
+    sort = request.GET.get("sort", "count")
+    match = request.GET.get("match", "substring")
+    if sort not in GENE_SORTS:
+        return HttpResponseBadRequest("sort must be one of " + ", ".join(GENE_SORTS))
+    if match not in GENE_MATCHES:
+        return HttpResponseBadRequest("match must be one of " + ", ".join(GENE_MATCHES))
+    try:
+        offset = int(request.GET.get("offset", 0))
+        limit = int(request.GET.get("limit", GENE_SEARCH_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest("offset and limit must be integers")
+    if offset < 0 or not 0 < limit <= GENE_SEARCH_MAX_LIMIT:
+        return HttpResponseBadRequest(
+            "offset must be positive and limit between 1 and {}".format(
+                GENE_SEARCH_MAX_LIMIT
+            )
+        )
+
+    index = get_gene_index(ribo, experiment)
+    total, page = index.search(query, sort, match, offset, limit)
+    return dict(index.page(page), total=total, offset=offset, limit=limit)
+
 
+_reference_index_lock = threading.Lock()
 
-@cached(cache=TTLCache(maxsize=128, ttl=3600))
-def get_sequence_dict(reference: Reference, ribo: Ribo, alias):
+
+@memoize(TTLCache(maxsize=32, ttl=3600))
+def get_indexed_reference(reference_file_path: str) -> IndexedFasta:
+    """
+    Random access to the sequences of a reference. References recorded before
+    the indexes were introduced are indexed on first use.
     """
-    For a given reference and alias, return a dict of aliased gene name to sequence mappings.
+    with _reference_index_lock:
+        if not all(os.path.exists(p) for p in fasta_index_paths(reference_file_path)):
+            build_fasta_index(reference_file_path)
+    return IndexedFasta(reference_file_path)
+
+
+def get_gene_sequence(reference: Reference, ribo: Ribo, gene: str):
+    """
+    Return the sequence of a (possibly aliased) gene from the given reference.
     """
     if reference is None:
         return None
 
-    transcript_names = ribo.transcript_names
-    reference_file_path = reference.reference_file_path
-    fasta = FastaFile(reference_file_path)
-    fasta_dict = {e.header: e.sequence for e in fasta}
-    sequence_dict = {
-        alias(transcript): fasta_dict[transcript] for transcript in transcript_names
-    }
-    return sequence_dict
+    transcript = ribo.alias.get_original_name(gene) if ribo.alias != None else gene
+    return get_indexed_reference(reference.reference_file_path).get(transcript)
 
 
-@cached(cache=TTLCache(maxsize=128, ttl=3600))
+def get_requested_gene_sequence(request, reference: Reference, ribo: Ribo, gene: str):
+    """
+    The sequence of a gene for a coverage request, unless it is left out with
+    sequence=0 (e.g. when only the window changes).
+    """
+    if request.GET.get("sequence", "1").lower() in ("0", "false"):
+        return None
+    return get_gene_sequence(reference, ribo, gene)
+
+
+@memoize(TTLCache(maxsize=128, ttl=3600))
 def get_cds_range_lookup(ribo: Ribo):
     """
     Create a dict of gene to region ranges, so that the CDS range can be found for a given experiment.
@@ -240,29 +583,436 @@ def get_cds_range_lookup(ribo: Ribo):
     return boundary_lookup
 
 
+def parse_coverage_window(
+    params, transcript_length, length_min, length_max, clamp_lengths=False
+):
+    """
+    The window of a coverage request. Positions default to the whole transcript
+    and read lengths to all of them. Instead of a resolution, a number of bins
+    may be given, which the window is split into.
+    With clamp_lengths, the read lengths are cut to those of the file instead of
+    being rejected. Raises ValueError for invalid parameters.
+    """
+    try:
+        window = {
+            "start": int(params.get("start", 0)),
+            "end": int(params.get("end", transcript_length)),
+            "resolution": int(params.get("resolution", 1)),
+            "rangeLower": int(params.get("range_lower", length_min)),
+            "rangeUpper": int(params.get("range_upper", length_max)),
+        }
+        bins = int(params["bins"]) if "bins" in params else None
+    except ValueError:
+        raise ValueError(
+            "start, end, resolution, bins, range_lower and range_upper "
+            "must be integers"
+        )
+    window["sumLengths"] = params.get("sum_lengths", "0").lower() in ("1", "true")
+    window["aggregate"] = params.get("aggregate", "sum")
+    if clamp_lengths:
+        window["rangeLower"] = max(window["rangeLower"], length_min)
+        window["rangeUpper"] = min(window["rangeUpper"], length_max)
+    if bins is not None:
+        if bins < 1:
+            raise ValueError("bins must be at least 1")
+        window["resolution"] = max(-(-(window["end"] - window["start"]) // bins), 1)
+
+    if not 0 <= window["start"] < window["end"] <= transcript_length:
+        raise ValueError(
+            "start and end must satisfy 0 <= start < end <= {}".format(
+                transcript_length
+            )
+        )
+    if window["resolution"] < 1:
+        raise ValueError("resolution must be at least 1")
+    if not length_min <= window["rangeLower"] <= window["rangeUpper"] <= length_max:
+        raise ValueError(
+            "read lengths must be within {} and {}".format(length_min, length_max)
+        )
+    if window["aggregate"] not in COVERAGE_AGGREGATES:
+        raise ValueError("aggregate must be one of " + ", ".join(COVERAGE_AGGREGATES))
+    return window
+
+
+def get_transcript_window(ribo, request, gene):
+    """
+    The transcript (original name) of a gene and the window of a coverage request.
+    """
+    transcript = ribo.alias.get_original_name(gene) if ribo.alias is not None else gene
+    window = parse_coverage_window(
+        request.GET,
+        int(ribo.transcript_lengths[transcript]),
+        int(ribo.minimum_length),
+        int(ribo.maximum_length),
+    )
+    return transcript, window
+
+
+def coverage_axes(window):
+    """
+    The read length (or summed range) labels and the bin positions of a window.
+    """
+    if window["sumLengths"]:
+        index = ["{}-{}".format(window["rangeLower"], window["rangeUpper"])]
+    else:
+        index = range(window["rangeLower"], window["rangeUpper"] + 1)
+    return index, range(window["start"], window["end"], window["resolution"])
+
+
 @register_experiment_api
 def get_coverage(ribo, experiment: Experiment, request, *args, **kwargs):
     """
     Get the coverage for a particular gene in an experiment. Also returns the CDS range
     for the gene and the sequence.
+
+    The coverage can be restricted to the positions [start, end) and the read lengths
+    from range_lower to range_upper, summed over the read lengths (sum_lengths=1) and
+    binned to one value per resolution positions (by their sum, or their maximum
+    with aggregate=max), so that zoomed out plots of long transcripts stay small.
+    With bins instead of resolution, the window is split into that many bins.
+    With sequence=0, the sequence is left out, e.g. when only the window changes.
     """
     gene = request.GET.get("gene")
     if gene is None:
         return HttpResponseBadRequest("gene name must be provided as a url parameter")
     cds_range = get_cds_range_lookup(ribo)[gene][1]
-    df = ribo.get_transcript_coverage(
-        experiment.name, alias=(ribo.alias != None), transcript=gene
+    try:
+        transcript, window = get_transcript_window(ribo, request, gene)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    coverage = read_coverage_window(
+        ribo,
+        experiment.name,
+        transcript,
+        window["start"],
+        window["end"],
+        window["rangeLower"],
+        window["rangeUpper"],
     )
-    sequence_dict = get_sequence_dict(
-        experiment.reference,
-        ribo=ribo,
-        alias=(ribo.alias.get_alias if ribo.alias != None else lambda x: x),
+    with phase("transform"):
+        coverage = bin_coverage(
+            coverage, window["resolution"], window["aggregate"], window["sumLengths"]
+        )
+
+    return {
+        "cdsRange": (int(cds_range[0]), int(cds_range[1]) - 1),
+        "coverage": split(coverage, *coverage_axes(window)),
+        "window": window,
+        "gene": gene,
+        "geneSequence": get_requested_gene_sequence(
+            request, experiment.reference, ribo, gene
+        ),
+    }
+
+
+@register_experiment_api
+def get_offset_coverage(ribo, experiment: Experiment, request, *args, **kwargs):
+    """
+    Get the coverage of a gene with a P-site offset applied to each read length,
+    summed over the read lengths. The offsets are given as a comma separated list,
+    one per read length from range_lower to range_upper (all lengths by default).
+    The other window parameters of getCoverage apply to the shifted coverage.
+    """
+    gene = request.GET.get("gene")
+    if gene is None:
+        return HttpResponseBadRequest("gene name must be provided as a url parameter")
+    cds_range = get_cds_range_lookup(ribo)[gene][1]
+    try:
+        transcript, window = get_transcript_window(ribo, request, gene)
+        offsets = parse_offsets(
+            request.GET.get("offsets", ""),
+            window["rangeUpper"] - window["rangeLower"] + 1,
+        )
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    # reads shifted into the window may come from outside of it
+    margin = int(abs(offsets).max())
+    read_start = max(window["start"] - margin, 0)
+    read_end = min(window["end"] + margin, int(ribo.transcript_lengths[transcript]))
+    coverage = read_coverage_window(
+        ribo,
+        experiment.name,
+        transcript,
+        read_start,
+        read_end,
+        window["rangeLower"],
+        window["rangeUpper"],
     )
+    with phase("transform"):
+        coverage = apply_offsets(coverage, offsets)
+        coverage = coverage[window["start"] - read_start : window["end"] - read_start]
+        coverage = bin_coverage(
+            coverage[None, :], window["resolution"], window["aggregate"]
+        )
+    window["sumLengths"] = True
+
     return {
         "cdsRange": (int(cds_range[0]), int(cds_range[1]) - 1),
-        "coverage": df.to_dict(orient="split"),
+        "coverage": split(coverage, *coverage_axes(window)),
+        "offsets": offsets,
+        "window": window,
         "gene": gene,
-        "geneSequence": sequence_dict[gene] if sequence_dict else None,
+        "geneSequence": get_requested_gene_sequence(
+            request, experiment.reference, ribo, gene
+        ),
+    }
+
+
+def auto_offsets_key(ribo, experiment_name):
+    return (file_digest(ribo._handle.filename), experiment_name)
+
+
+@memoize(TTLCache(maxsize=256, ttl=3600), key=auto_offsets_key)
+def get_auto_offsets_helper(ribo, experiment_name):
+    """
+    Auto offsets of every read length from the start site metagene of an experiment.
+    They only depend on the file, so they are shared by every handle of it.
+    """
+    df = ribo.get_metagene(
+        site_type="start",
+        experiments=[experiment_name],
+        range_lower=ribo.minimum_length,
+        range_upper=ribo.maximum_length,
+        sum_lengths=False,
+    )
+    with phase("transform"):
+        metagene = df.loc[experiment_name]
+        return auto_offsets(metagene.to_numpy(), metagene.columns.to_numpy())
+
+
+@register_experiment_api
+def get_auto_offsets(ribo, experiment: Experiment, *args, **kwargs):
+    """
+    Offsets that align the start site peak of each read length to 0.
+    See AUTO_OFFSET_SEARCH_BOUNDS for where the peaks are looked for.
+    """
+    return {
+        "index": range(int(ribo.minimum_length), int(ribo.maximum_length) + 1),
+        "offsets": get_auto_offsets_helper(ribo, experiment.name),
+        "searchBounds": AUTO_OFFSET_SEARCH_BOUNDS,
+    }
+
+
+def get_requested_genes(request):
+    """
+    Genes can be given as repeated "gene" url parameters, or, for long lists,
+    as a JSON body of the form {"genes": [...]}.
+    """
+    genes = request.GET.getlist("gene")
+    if request.method == "POST" and request.body:
+        try:
+            genes += json.loads(request.body)["genes"]
+        except (ValueError, KeyError, TypeError):
+            return None
+    # keep the order but drop duplicates
+    return list(dict.fromkeys(genes))
+
+
+@register_experiment_api
+def get_coverage_batch(ribo, experiment: Experiment, request, *args, **kwargs):
+    """
+    Get the coverage, CDS range and sequence of many genes in an experiment at once.
+    Genes that do not exist in the experiment are listed under "missing".
+    """
+    genes = get_requested_genes(request)
+    if not genes:
+        return HttpResponseBadRequest(
+            "genes must be provided as url parameters or as a JSON body"
+        )
+    if len(genes) > COVERAGE_BATCH_LIMIT:
+        return HttpResponseBadRequest(
+            "at most {} genes can be requested at once".format(COVERAGE_BATCH_LIMIT)
+        )
+
+    cds_range_lookup = get_cds_range_lookup(ribo)
+
+    # map the (possibly aliased) gene names to the transcript names in the file
+    if ribo.alias != None:
+        original_names = ribo.alias.reverse_mapping_dict
+    else:
+        original_names = ribo.transcript_lengths
+    found = [gene for gene in genes if gene in original_names]
+    missing = [gene for gene in genes if gene not in original_names]
+    transcripts = {
+        gene: (original_names[gene] if ribo.alias != None else gene) for gene in found
+    }
+
+    coverages = read_transcript_coverages(ribo, experiment.name, transcripts.values())
+
+    range_lower = int(ribo.minimum_length)
+    results = {}
+    for gene in found:
+        cds_range = cds_range_lookup[gene][1]
+        results[gene] = {
+            "cdsRange": (int(cds_range[0]), int(cds_range[1]) - 1),
+            "coverage": split_coverage(coverages[transcripts[gene]], range_lower),
+            "geneSequence": get_gene_sequence(experiment.reference, ribo, gene),
+        }
+
+    return {"genes": results, "missing": missing}
+
+
+coverage_read_executor = ThreadPoolExecutor(
+    max_workers=COVERAGE_READ_WORKERS, thread_name_prefix="coverage_read"
+)
+
+
+def read_gene_coverage_per_file(
+    ribo_file_path, transcript_regex, experiment_names, gene, params
+):
+    """
+    Read the coverage window (see parse_coverage_window) of a gene for the given
+    experiments of a single ribo file. The read lengths are cut to those of the file.
+    Returns the window, the coverage and the total reads of every experiment and
+    the minimum read length of the file, or None if the gene does not exist in it.
+    """
+    with ribo_handle_pool.lease(ribo_file_path, transcript_regex) as ribo:
+        if ribo.alias is not None:
+            transcript = ribo.alias.reverse_mapping_dict.get(gene)
+        else:
+            transcript = gene if gene in ribo.transcript_lengths else None
+        if transcript is None:
+            return None
+
+        window = parse_coverage_window(
+            params,
+            int(ribo.transcript_lengths[transcript]),
+            int(ribo.minimum_length),
+            int(ribo.maximum_length),
+            clamp_lengths=True,
+        )
+        coverages = {}
+        for name in experiment_names:
+            coverage = read_coverage_window(
+                ribo,
+                name,
+                transcript,
+                window["start"],
+                window["end"],
+                window["rangeLower"],
+                window["rangeUpper"],
+            )
+            coverages[name] = bin_coverage(
+                coverage,
+                window["resolution"],
+                window["aggregate"],
+                window["sumLengths"],
+            )
+        total_reads = {
+            name: int(ribo._handle["experiments"][name].attrs["total_reads"])
+            for name in experiment_names
+        }
+        return window, coverages, total_reads, int(ribo.minimum_length)
+
+
+@register_project_api
+def get_experiments_coverage(project: Project, request, *args, **kwargs):
+    """
+    Get the coverage of one gene for several experiments (given as repeated
+    "experiment" url parameters) that share the same reference.
+    Experiments stored in the same ribo file are read together, and different
+    files are read concurrently. The CDS range and the sequence are sent once.
+    The window parameters of getCoverage apply to every experiment, with the
+    read lengths cut to those of its file.
+    Every experiment has to be in the project. Experiments whose file can not be
+    read are listed in "failed" with the error, and the others are still returned.
+    """
+    gene = request.GET.get("gene")
+    if gene is None:
+        return HttpResponseBadRequest("gene name must be provided as a url parameter")
+    try:
+        experiment_ids = [int(x) for x in request.GET.getlist("experiment")]
+    except ValueError:
+        return HttpResponseBadRequest("experiment ids must be integers")
+    if not experiment_ids:
+        return HttpResponseBadRequest(
+            "experiment ids must be provided as url parameters"
+        )
+
+    experiments = list(
+        Experiment.objects.filter(
+            project=project, id__in=experiment_ids
+        ).select_related("reference")
+    )
+    outside = set(experiment_ids) - {e.id for e in experiments}
+    if outside:
+        return HttpResponseBadRequest(
+            "experiments {} are not in this project".format(
+                ", ".join(str(i) for i in sorted(outside))
+            )
+        )
+
+    if len({e.reference_digest for e in experiments}) > 1:
+        return HttpResponseBadRequest("experiments must share the same reference")
+
+    files = {}
+    for e in experiments:
+        files.setdefault((e.ribo_file_path, e.transcript_regex), []).append(e)
+
+    futures = {
+        key: coverage_read_executor.submit(
+            read_gene_coverage_per_file,
+            *key,
+            [e.name for e in file_experiments],
+            gene,
+            request.GET,
+        )
+        for key, file_experiments in files.items()
+    }
+
+    results = {}
+    failed = []
+    for key, future in futures.items():
+        try:
+            read = future.result()
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        except (OSError, KeyError, RuntimeError) as e:
+            # an unreadable file does not fail the experiments of the other files
+            logger.exception("Reading the coverage of %s from %s failed", gene, key[0])
+            failed.extend({"id": x.id, "error": str(e)} for x in files[key])
+            continue
+        if read is None:
+            continue
+        window, coverages, total_reads, minimum_length = read
+        index, columns = coverage_axes(window)
+        for e in files[key]:
+            results[e.id] = {
+                "id": e.id,
+                "experiment": e.name,
+                "min": minimum_length,
+                "totalReads": total_reads[e.name],
+                "coverage": split(coverages[e.name], index, columns),
+                "window": window,
+            }
+
+    if not results:
+        if failed:
+            return HttpResponse(
+                "The coverage of the given experiments could not be read.",
+                status=500,
+            )
+        return HttpResponseNotFound("gene not found in the given experiments")
+
+    # all experiments share the same reference, so any of them can be used for these
+    first = next(e for e in experiments if e.id in results)
+    reference = next((e.reference for e in experiments if e.reference), None)
+    with lease_ribo(first) as ribo:
+        cds_range = get_cds_range_lookup(ribo)[gene][1]
+        gene_sequence = get_requested_gene_sequence(request, reference, ribo, gene)
+
+    failed_ids = {x["id"] for x in failed}
+    return {
+        "gene": gene,
+        "cdsRange": (int(cds_range[0]), int(cds_range[1]) - 1),
+        "geneSequence": gene_sequence,
+        "experiments": [results[i] for i in experiment_ids if i in results],
+        "missing": [
+            i for i in experiment_ids if i not in results and i not in failed_ids
+        ],
+        "failed": failed,
     }
 
 
@@ -273,15 +1023,20 @@ def list_experiments(ribo, experiment: Experiment, request, *args, **kwargs):
     """
     experiments = Experiment.objects.filter(
         reference_digest=experiment.reference_digest
-    )
+    ).select_related("project")
     if not request.user.is_authenticated:
         # if user isn't logged in, filter to only public projects
-        public_projects = Project.objects.filter(public=True)
-        experiments = experiments.filter(project__in=public_projects)
+        experiments = experiments.filter(project__public=True)
 
     return {
         "experiments": [
-            {"id": x.id, "name": x.name, "project": x.project.name} for x in experiments
+            {
+                "id": x.id,
+                "name": x.name,
+                "project": x.project.name,
+                "projectId": x.project_id,
+            }
+            for x in experiments
         ]
     }
 
@@ -296,8 +1051,18 @@ def get_gene_correlations(project: Project, request, *args, **kwargs):
         )
     range_lower = int(request.GET.get("range_lower"))
     range_upper = int(request.GET.get("range_upper"))
+    method = request.GET.get("method", "spearman")
+    if method not in CORRELATION_METHODS:
+        return HttpResponseBadRequest(
+            "method must be one of " + ", ".join(CORRELATION_METHODS)
+        )
 
-    data = gene_correlation_helper(project, reference_hash, range_lower, range_upper)
+    try:
+        data = gene_correlation_helper(
+            project, reference_hash, range_lower, range_upper, method
+        )
+    except ComputeTimeout:
+        return HttpResponse("The correlations did not finish in time.", status=504)
 
     if not data:
         return HttpResponse(status=400)
@@ -306,24 +1071,26 @@ def get_gene_correlations(project: Project, request, *args, **kwargs):
 
     # genome = ORGANISM_GENOME_MAP.get(data[2])
 
-    context = {
-        "geneCounts": data[0].to_dict(),
-        "correlations": data[1],
-        "min": int(data[2]),
-        "max": int(data[3])
-        # "organism": data[2],
-        # "genome": genome
-    }
+    with phase("serialize"):
+        context = {
+            "geneCounts": data[0].to_dict(),
+            "correlations": data[1],
+            "min": int(data[2]),
+            "max": int(data[3]),
+            "method": method,
+            # "organism": data[2],
+            # "genome": genome
+        }
 
-    return JsonResponse(context)
+        return JsonResponse(context)
 
 
 # region_counts_cache = {}
 
 
-@lru_cache()
+@memoize(TTLCache(maxsize=128, ttl=3600))
 def gene_correlation_helper(
-    project: Project, referenceHash: str, range_lower, range_upper
+    project: Project, referenceHash: str, range_lower, range_upper, method="spearman"
 ):
 
     # get a list of all experiment aliases in the study
@@ -337,88 +1104,30 @@ def gene_correlation_helper(
     # else:
     #     organism = None
 
-    # create a dict of experiment alias : ribo_object
-    ribo_objects = {
-        experiment.name: get_ribo(experiment)
-        for experiment in experiments
-        if experiment.reference_digest == referenceHash
-    }
-
-    # get gene cds counts for each ribo_object
-    region_counts = []
-    min_range_min = 1000
-    max_range_max = -1
-    for name, ribo in ribo_objects.items():
-        df = get_region_counts_helper(ribo)
-        if name in df and df is not None:
-            print("filtering read lengths...")
-            # print(df.index)
-            df["read_lengths"] = [x[1] for x in df.index]
-            df = df[(df["read_lengths"] >= (range_lower or ribo.minimum_length))]
-            df = df[df["read_lengths"] <= (range_upper or ribo.maximum_length)]
-            summed_counts = df.groupby(["transcript"]).sum().get(name, None)
-            if summed_counts is not None:
-                region_counts.append(summed_counts)
-        
-        if ribo.minimum_length < min_range_min:
-            min_range_min = ribo.minimum_length
-
-        if ribo.maximum_length > max_range_max:
-            max_range_max = ribo.maximum_length
-
-    # get correlation coefficients for the heatmap
-    correlations = generate_correlations(region_counts)
-
-    return (
-        pd.DataFrame(
-            reduce(
-                lambda x, y: pd.merge(x, y, left_index=True, right_index=True),
-                region_counts,
-            )
-        ),
-        correlations,
-        min_range_min,
-        max_range_max
+    # the counts and correlations are computed by the compute backend,
+    # possibly in another process, so it only gets the files and names
+    result = compute_backend.run(
+        gene_correlations,
+        [
+            (e.ribo_file_path, e.transcript_regex, e.name)
+            for e in experiments
+            if e.reference_digest == referenceHash
+        ],
+        range_lower,
+        range_upper,
+        method,
     )
 
+    with phase("transform"):
+        gene_counts = pd.DataFrame(
+            result["counts"],
+            index=pd.Index(result["transcripts"], name="transcript"),
+            columns=result["experiments"],
+        )
 
-def region_counts_helper_key(ribo):
-    return ribo._handle.filename
-
-
-@cached(cache=TTLCache(maxsize=128, ttl=600), key=region_counts_helper_key)
-def get_region_counts_helper(ribo):
-    """
-    A light caching wrapper around the Ribo.get_region_counts function
-    """
-    return ribo.get_region_counts(
-        "CDS",
-        sum_references=False,
-        alias=(ribo.alias != None),
-        sum_lengths=False,
-    )
-
-
-def generate_correlations(region_counts):
-    """
-    Generate a square matrix of spearman correlation coefficients between gene region counts
-    """
-
-    n = len(region_counts)
-
-    # init a blank square array
-    correlations = [[None for _ in range(n)] for _ in range(n)]
-
-    # fill in the diagonal
-    for i in range(n):
-        correlations[i][i] = 1
-
-    # fill in other values
-    for i in range(n):
-        for j in range(i):
-            c = spearmanr(region_counts[i], region_counts[j]).correlation
-            # symmetric values
-            correlations[i][j] = c
-            correlations[j][i] = c
-
-    return correlations
+        return (
+            gene_counts,
+            correlations_to_list(result["correlations"]),
+            result["min"],
+            result["max"],
+        )
@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class BrowserConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "browser"
+
+    def ready(self):
+        # registers the background job handlers
+        from . import tasks
+
+        from django.db.models.signals import post_save, post_delete
+        from .models import Project, Experiment
+        from .context_processor import invalidate_navigation
+
+        for signal in (post_save, post_delete):
+            for model in (Project, Experiment):
+                signal.connect(
+                    invalidate_navigation,
+                    sender=model,
+                    dispatch_uid="invalidate_navigation",
+                )
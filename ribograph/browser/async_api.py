@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+
+from .cache import SingleFlight, digest_key, dump_response, load_response
+from .metrics import RequestTimer, TimedGZipMiddleware
+from .wire import negotiate_format, not_acceptable
+
+from ribograph.settings import ASYNC_API_WORKERS, ASYNC_API_PER_FILE, API_DEADLINE
+
+
+class BoundedExecutor:
+    """
+    Runs blocking calls for async views on a fixed number of threads, with at most
+    per_key calls for the same key (a ribo file) at a time, so that many slow reads
+    of one file can not take every thread.
+    """
+
+    def __init__(self, max_workers, per_key, thread_name_prefix="api_read"):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix
+        )
+        self.per_key = per_key
+        # asyncio semaphores belong to an event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _semaphore(self, loop, key):
+        with self._lock:
+            semaphores = self._semaphores.setdefault(loop, {})
+            if key not in semaphores:
+                semaphores[key] = asyncio.Semaphore(self.per_key)
+            return semaphores[key]
+
+    async def run(self, key, func, timeout=None):
+        """
+        Run func() on the executor. Raises asyncio.TimeoutError if it has not
+        finished (including the time spent waiting for a slot) within timeout seconds.
+        A call that timed out keeps its slot until it actually finishes.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        semaphore = self._semaphore(loop, key)
+        await asyncio.wait_for(semaphore.acquire(), timeout)
+
+        future = loop.run_in_executor(self.executor, func)
+
+        def done(future):
+            semaphore.release()
+            if not future.cancelled():
+                future.exception()  # retrieved, even if nobody waits for it anymore
+
+        future.add_done_callback(done)
+        remaining = None if deadline is None else max(deadline - loop.time(), 0)
+        return await asyncio.wait_for(asyncio.shield(future), remaining)
+
+
+api_executor = BoundedExecutor(ASYNC_API_WORKERS, ASYNC_API_PER_FILE)
+
+_gzip = TimedGZipMiddleware(lambda request: None)
+
+
+def async_api_view(load, respond, limit_key, cache, key, namespace="", endpoint=""):
+    """
+    The async counterpart of the registrar wrappers in api.py.
+
+    load(request, **kwargs) does the database lookups and the permission checks and
+    returns the experiment or project; it runs on the thread Django uses for the ORM.
+    respond(obj, wire_format, request, **kwargs) builds the response; it runs on
+    the bounded executor, capped per limit_key(obj).
+    Responses are cached in cache under key(request), and concurrent misses of the
+    same key are computed once, like cached_response does.
+    The time of each request and its phases is recorded as endpoint (see metrics.py).
+    """
+    flight = SingleFlight()
+
+    def prepare(timer, request, kwargs):
+        with timer.activate():
+            return load(request, **kwargs), namespace + digest_key(key(request))
+
+    def build_response(timer, obj, cache_key, wire_format, request, kwargs):
+        close_old_connections()
+        try:
+            with timer.activate():
+                response = respond(obj, wire_format, request, **kwargs)
+                response = _gzip.process_response(request, response)
+            patch_cache_control(response, max_age=60 * 15)
+            blob = None if response.streaming else dump_response(response)
+            if response.status_code == 200 and blob is not None:
+                cache.set(cache_key, blob)
+            return response, blob
+        finally:
+            close_old_connections()
+
+    async def view(request, **kwargs):
+        wire_format = negotiate_format(request)
+        if wire_format is None:
+            return not_acceptable()
+
+        timer = RequestTimer(endpoint)
+        try:
+            obj, cache_key = await sync_to_async(prepare)(timer, request, kwargs)
+            blob = await sync_to_async(cache.get, thread_sensitive=False)(cache_key)
+            if blob is not None:
+                return load_response(blob)
+
+            def run():
+                return api_executor.run(
+                    limit_key(obj),
+                    lambda: build_response(
+                        timer, obj, cache_key, wire_format, request, kwargs
+                    ),
+                    API_DEADLINE,
+                )
+
+            try:
+                (response, blob), shared = await flight.do_async(cache_key, run)
+                if not shared:
+                    return response
+                if blob is None:
+                    return (await run())[0]
+            except asyncio.TimeoutError:
+                return HttpResponse("The request did not finish in time.", status=504)
+            # every caller gets its own copy, the middleware may change it
+            return load_response(blob)
+        finally:
+            timer.finish()
+
+    # APIs are read only, so they may also be called with POST bodies
+    view.csrf_exempt = True
+    return view
@@ -0,0 +1,479 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from functools import wraps
+
+from cachetools import TTLCache
+from cachetools.keys import hashkey
+
+from django.http import HttpResponse
+
+
+##########################################################################
+#### Response serialization
+##########################################################################
+
+
+def dump_response(response: HttpResponse) -> bytes:
+    """
+    Serialize a response to bytes so that it can be shared between worker
+    processes. Only the status, headers and the (already encoded) body are kept:
+    a line of json with the status and headers, followed by the raw body.
+    """
+    head = json.dumps(
+        {"status": response.status_code, "headers": list(response.items())}
+    )
+    return head.encode("utf-8") + b"\n" + response.content
+
+
+def load_response(blob: bytes) -> HttpResponse:
+    """
+    Rebuild a response serialized by dump_response.
+    """
+    head, _, content = blob.partition(b"\n")
+    head = json.loads(head)
+    response = HttpResponse(content, status=head["status"])
+    for header, value in head["headers"]:
+        response[header] = value
+    return response
+
+
+def digest_key(key) -> str:
+    """
+    Turn a cachetools style key into a string that can be used by
+    out-of-process backends.
+    """
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+##########################################################################
+#### Backends
+##########################################################################
+
+
+class CacheBackend:
+    """
+    Base class of the response cache backends.
+    Values are bytes; keys are strings produced by digest_key.
+    Hit / miss counters are kept per process.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            # never worth evicting everything else for a single entry
+            return
+        self._set(key, value)
+
+    def stats(self):
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self.size(),
+            "max_bytes": self.max_bytes,
+        }
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+    def size(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class _SizedTTLCache(TTLCache):
+    """
+    A TTLCache that reports evictions back to its owner.
+    """
+
+    def __init__(self, *args, on_evict=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        item = super().popitem()
+        if self._on_evict:
+            self._on_evict()
+        return item
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    In-process cache. Entries are bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        super().__init__(max_bytes, ttl)
+        self._cache = _SizedTTLCache(
+            maxsize=max_bytes, ttl=ttl, getsizeof=len, on_evict=self._count_eviction
+        )
+        self._lock = threading.Lock()
+
+    def _count_eviction(self):
+        self.evictions += 1
+
+    def _get(self, key):
+        with self._lock:
+            return self._cache.get(key)
+
+    def _set(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+
+    def size(self):
+        return self._cache.currsize
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    On-disk cache shared by every worker process on the host.
+    When the byte budget is exceeded, least recently used entries are dropped.
+    """
+
+    def __init__(self, location, max_bytes, ttl):
+        super().__init__(max_bytes, ttl)
+        self.location = location
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.location, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+                "expires REAL, accessed REAL)"
+            )
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def _get(self, key):
+        now = time.time()
+        connection = self._connection
+        row = connection.execute(
+            "SELECT value FROM response_cache WHERE key = ? AND expires > ?",
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE response_cache SET accessed = ? WHERE key = ?", (now, key)
+        )
+        connection.commit()
+        return row[0]
+
+    def _set(self, key, value):
+        now = time.time()
+        connection = self._connection
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), now + self.ttl, now),
+            )
+            connection.execute("DELETE FROM response_cache WHERE expires <= ?", (now,))
+            self._enforce_budget(connection)
+
+    def _enforce_budget(self, connection):
+        total = self._total_size(connection)
+        if total <= self.max_bytes:
+            return
+        rows = connection.execute(
+            "SELECT key, size FROM response_cache ORDER BY accessed ASC"
+        ).fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM response_cache WHERE key = ?", stale)
+        self.evictions += len(stale)
+
+    @staticmethod
+    def _total_size(connection):
+        return connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM response_cache"
+        ).fetchone()[0]
+
+    def size(self):
+        return self._total_size(self._connection)
+
+    def clear(self):
+        with self._connection as connection:
+            connection.execute("DELETE FROM response_cache")
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache kept in a Redis (or Redis compatible) server.
+    Any client implementing get, set(ex=...), scan_iter, delete and memory
+    usage reporting through info() can be passed in place of redis.Redis.
+    The byte budget is enforced by the server (maxmemory with an LRU policy),
+    so it is only used here to skip oversized entries.
+    """
+
+    def __init__(self, location, max_bytes, ttl, client=None, prefix="ribograph:"):
+        super().__init__(max_bytes, ttl)
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(location)
+        self.client = client
+        self.prefix = prefix
+
+    def _get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def _set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def size(self):
+        try:
+            return int(self.client.info("memory").get("used_memory", 0))
+        except Exception:
+            return 0
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def make_cache(config, **kwargs) -> CacheBackend:
+    """
+    Create a cache backend from a settings dict of the form
+
+    {"BACKEND": "local" | "sqlite" | "redis", "LOCATION": ..., "MAX_BYTES": ..., "TTL": ...}
+    """
+    backend = config.get("BACKEND", "local")
+    max_bytes = int(config.get("MAX_BYTES", 64 * 1024 * 1024))
+    ttl = int(config.get("TTL", 600))
+
+    if backend == "local":
+        return LocalCacheBackend(max_bytes, ttl)
+    elif backend == "sqlite":
+        return SQLiteCacheBackend(config["LOCATION"], max_bytes, ttl)
+    elif backend == "redis":
+        return RedisCacheBackend(config["LOCATION"], max_bytes, ttl, **kwargs)
+
+    raise ValueError("Unknown cache backend: {}".format(backend))
+
+
+##########################################################################
+#### Coalescing
+##########################################################################
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller computes the
+    value while the others wait for it and get the same value (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key):
+        with self._lock:
+            del self._calls[key]
+
+    def do(self, key, func):
+        """
+        Returns the value of func() and whether it was computed by another caller.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+
+        try:
+            value = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            self._finish(key)
+        return value, False
+
+    async def do_async(self, key, func):
+        """
+        do() for async callers: func() returns an awaitable, and waiting for
+        another caller does not block the event loop. Calls of do() and do_async()
+        with the same key are coalesced too.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            # a waiter that is cancelled must not cancel the computation
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+
+        try:
+            value = await func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            self._finish(key)
+        return value, False
+
+
+# Every memoized function by name, for the metrics
+memoized = {}
+
+
+def memoize(cache, key=hashkey):
+    """
+    A thread safe replacement of cachetools.cached: the cache (any cachetools cache)
+    is only touched under a lock, and concurrent calls with the same key are computed
+    once. cache_clear() also drops the results of computations still in flight.
+    Hits, misses and evictions (including expired entries) are counted per process.
+    """
+
+    def decorator(func):
+        lock = threading.Lock()
+        flight = SingleFlight()
+        generation = [0]
+        counts = {"hits": 0, "misses": 0, "evictions": 0}
+
+        def compute(k, args, kwargs):
+            with lock:
+                started = generation[0]
+            value = func(*args, **kwargs)
+            with lock:
+                if generation[0] == started:
+                    size = len(cache) + (k not in cache)
+                    try:
+                        cache[k] = value
+                    except ValueError:
+                        pass  # larger than the whole cache
+                    else:
+                        # storing a value first drops the expired entries,
+                        # then the least recently used ones if it is full
+                        counts["evictions"] += size - len(cache)
+            return value
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            with lock:
+                try:
+                    value = cache[k]
+                except KeyError:
+                    counts["misses"] += 1
+                else:
+                    counts["hits"] += 1
+                    return value
+            return flight.do(k, lambda: compute(k, args, kwargs))[0]
+
+        def cache_clear():
+            with lock:
+                generation[0] += 1
+                cache.clear()
+
+        def stats():
+            with lock:
+                return dict(
+                    counts,
+                    entries=len(cache),
+                    size=cache.currsize,
+                    max_size=cache.maxsize,
+                )
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache_clear
+        wrapper.stats = stats
+        memoized["{}.{}".format(func.__module__, func.__qualname__)] = wrapper
+        return wrapper
+
+    return decorator
+
+
+##########################################################################
+
+
+def cached_response(cache: CacheBackend, key, namespace=""):
+    """
+    Cache successful responses of a view in the given backend.
+    The key function is called with the view arguments.
+    Concurrent misses of the same key in this process are computed once.
+    """
+
+    def decorator(view):
+        flight = SingleFlight()
+
+        def compute(cache_key, args, kwargs):
+            response = view(*args, **kwargs)
+            blob = None if response.streaming else dump_response(response)
+            if response.status_code == 200 and blob is not None:
+                cache.set(cache_key, blob)
+            return response, blob
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache_key = namespace + digest_key(key(*args, **kwargs))
+            blob = cache.get(cache_key)
+            if blob is not None:
+                return load_response(blob)
+
+            (response, blob), shared = flight.do(
+                cache_key, lambda: compute(cache_key, args, kwargs)
+            )
+            if not shared:
+                return response
+            if blob is None:
+                return view(*args, **kwargs)
+            # every caller gets its own copy, the middleware may change it
+            return load_response(blob)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
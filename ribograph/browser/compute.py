@@ -0,0 +1,199 @@
+"""
+Backends running the CPU heavy parts of the project APIs.
+
+With the "process" backend, they run on a pool of worker processes, so they do not
+hold the GIL of the web workers. This module is imported by the worker processes
+on their own, without django.setup(): it must not import the models or read the
+Django settings (django.http is still imported through .cache and .summary,
+which works without setup). The jobs get plain arguments (paths, names,
+numbers), keep their ribo files open between jobs and return numpy arrays.
+"""
+import importlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+import pandas as pd
+from cachetools import TTLCache
+
+from .cache import memoize
+from .handles import RiboHandlePool
+from .summary import file_digest
+from .correlation import (
+    align_counts,
+    correlation_matrix,
+    read_length_counts,
+)
+
+from ribograph.settings import (
+    COMPUTE_BACKEND,
+    COMPUTE_PROCESSES,
+    COMPUTE_TIMEOUT,
+    RIBO_HANDLE_POOL_SIZE,
+)
+
+# The open ribo files of this process. In the web process it is shared with
+# the APIs, and every worker process of the pool has its own.
+ribo_handle_pool = RiboHandlePool(max_open=RIBO_HANDLE_POOL_SIZE)
+
+
+def read_length_counts_key(ribo, experiment_name):
+    return (file_digest(ribo._handle.filename), experiment_name)
+
+
+@memoize(TTLCache(maxsize=128, ttl=600), key=read_length_counts_key)
+def get_read_length_counts(ribo, experiment_name):
+    """
+    A caching wrapper around the transcripts x read lengths CDS counts of an experiment.
+    The counts do not depend on the aliases, so they are shared by every handle of the file.
+    """
+    return read_length_counts(ribo, experiment_name)
+
+
+##########################################################################
+#### Jobs
+##########################################################################
+
+
+def gene_correlations(experiments, range_lower, range_upper, method="spearman"):
+    """
+    CDS counts of the genes common to the given experiments, summed over the read
+    lengths from range_lower to range_upper, and the correlations between them.
+
+    experiments is a list of (ribo_file_path, transcript_regex, experiment_name).
+    Returns a dict of numpy arrays: transcripts, experiments, counts
+    (transcripts x experiments) and correlations (experiments x experiments), and
+    the smallest minimum and largest maximum read length of the files.
+    """
+    region_counts = []
+    length_min, length_max = 1000, -1
+    for ribo_file_path, transcript_regex, name in experiments:
+        with ribo_handle_pool.lease(ribo_file_path, transcript_regex) as ribo:
+            if name in ribo.experiments:
+                counts = get_read_length_counts(ribo, name)
+                transcripts = (
+                    ribo.alias.aliases if ribo.alias else ribo.transcript_names
+                )
+                region_counts.append(
+                    pd.Series(
+                        counts.range_sum(range_lower, range_upper),
+                        index=pd.Index(transcripts, name="transcript"),
+                        name=name,
+                    )
+                )
+            length_min = min(length_min, int(ribo.minimum_length))
+            length_max = max(length_max, int(ribo.maximum_length))
+
+    gene_counts = align_counts(region_counts)
+    counts = gene_counts.to_numpy()
+    return {
+        "transcripts": gene_counts.index.to_numpy(dtype=str),
+        "experiments": np.array(gene_counts.columns, dtype=str),
+        "counts": counts.astype(np.uint64),
+        "correlations": correlation_matrix(counts, method),
+        "min": length_min,
+        "max": length_max,
+    }
+
+
+##########################################################################
+#### Backends
+##########################################################################
+
+
+class ComputeTimeout(Exception):
+    pass
+
+
+class InlineBackend:
+    """
+    Runs the jobs in the calling thread.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def run(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+
+def _warm_up():
+    """
+    Runs once in every new worker process, so that the first job does not
+    pay for the imports.
+    """
+    importlib.import_module("ribopy")
+    importlib.import_module("scipy.stats")
+
+
+def _ping():
+    return True
+
+
+class ProcessPoolBackend:
+    """
+    Runs the jobs on a pool of worker processes. The pool is started on first use.
+    A job that does not finish within timeout seconds raises ComputeTimeout;
+    its worker stays busy until the job ends.
+    """
+
+    def __init__(self, processes, timeout=None):
+        self.processes = processes
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    # open hdf5 files and database connections do not survive a fork
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_up,
+                )
+            return self._executor
+
+    def warm(self):
+        """
+        Start every worker process now.
+        """
+        futures = [self.executor.submit(_ping) for _ in range(self.processes)]
+        for future in futures:
+            future.result()
+
+    def run(self, func, *args, **kwargs):
+        future = self.executor.submit(func, *args, **kwargs)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ComputeTimeout(
+                "{} did not finish in {} seconds".format(func.__name__, self.timeout)
+            )
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                # shutdown(cancel_futures=True) needs python 3.9
+                for future in list(self._pending):
+                    future.cancel()
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def make_compute_backend(name, processes=COMPUTE_PROCESSES, timeout=COMPUTE_TIMEOUT):
+    if name == "inline":
+        return InlineBackend(timeout)
+    elif name == "process":
+        return ProcessPoolBackend(processes, timeout)
+
+    raise ValueError("Unknown compute backend: {}".format(name))
+
+
+compute_backend = make_compute_backend(COMPUTE_BACKEND)
@@ -1,20 +1,40 @@
-from .models import Project, Experiment
+from .models import Project
+from .cache import memoize
 import os
 
-def get_user_projects(request):
-    """
-    Find the list of projects the user should have access to depending on
-    if they're logged in, and experiments for each of them
-    """
-    if request.user.is_authenticated:
+from cachetools import TTLCache
+
+from ribograph.settings import NAVIGATION_CACHE_TTL
+
+
+# Navigation trees keyed by whether the user is logged in.
+# Cleared by invalidate_navigation whenever a project or an experiment changes.
+# The cache is per process, so changes made in other processes show up
+# after NAVIGATION_CACHE_TTL seconds at the latest.
+@memoize(TTLCache(maxsize=2, ttl=NAVIGATION_CACHE_TTL))
+def build_navigation(authenticated: bool):
+    if authenticated:
         # projects = Project.objects.filter(owner=request.user)
         projects = Project.objects.all()
     else:
         projects = Project.objects.filter(public=True)
 
-    projects_experiments = {
-        project: Experiment.objects.filter(project=project) for project in projects
+    return {
+        project: list(project.experiment_set.all())
+        for project in projects.prefetch_related("experiment_set")
     }
+
+
+def invalidate_navigation(**kwargs):
+    build_navigation.cache_clear()
+
+
+def get_user_projects(request):
+    """
+    Find the list of projects the user should have access to depending on
+    if they're logged in, and experiments for each of them
+    """
+    projects_experiments = build_navigation(request.user.is_authenticated)
     return {"projects": projects_experiments, "project": {}, "experiment": {}}
 
 
@@ -23,10 +43,10 @@ def debug_mode(request):
     Controls whether or not the debug vue server is used, or built static assets
     """
     return {
-        "DEBUG": request.META["DEBUG"]
+        "DEBUG": bool(request.META.get("DEBUG"))
         and (
-            request.META["HTTP_HOST"].split(":")[0]
-            in request.META["DJANGO_ALLOWED_HOSTS"]
+            request.META.get("HTTP_HOST", "").split(":")[0]
+            in request.META.get("DJANGO_ALLOWED_HOSTS", "")
         ),
-        "RUN_VUE_SERVER": os.getenv('RUN_VUE_SERVER')
+        "RUN_VUE_SERVER": os.getenv("RUN_VUE_SERVER"),
     }
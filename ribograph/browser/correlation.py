@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+from ribopy import Ribo
+from ribopy.settings import (
+    CDS_name,
+    EXPERIMENTS_name,
+    EXTENDED_REGION_names,
+    REF_DG_REGION_COUNTS,
+)
+
+CORRELATION_METHODS = ("spearman", "pearson", "log_pearson")
+
+# Number of genes multiplied at once when building the correlation matrix.
+# This bounds the temporary memory to BLOCK_SIZE x number of experiments.
+BLOCK_SIZE = 1 << 16
+
+
+class ReadLengthCounts:
+    """
+    CDS counts of an experiment as a transcripts x read lengths matrix, kept as
+    prefix sums along the read lengths. The counts summed over any range of
+    read lengths then take one column subtraction.
+    """
+
+    def __init__(self, counts: np.ndarray, length_min: int):
+        number_of_transcripts, number_of_lengths = counts.shape
+        self.length_min = length_min
+        self.length_max = length_min + number_of_lengths - 1
+        self.prefix_sums = np.zeros(
+            (number_of_transcripts, number_of_lengths + 1), dtype=np.int64
+        )
+        np.cumsum(counts, axis=1, out=self.prefix_sums[:, 1:])
+
+    def range_sum(self, range_lower=0, range_upper=0) -> np.ndarray:
+        """
+        Counts of every transcript summed over [range_lower, range_upper].
+        A bound of 0 means the minimum (maximum) read length of the file.
+        """
+        lower = max(range_lower or self.length_min, self.length_min)
+        upper = min(range_upper or self.length_max, self.length_max)
+        if upper < lower:
+            return np.zeros(self.prefix_sums.shape[0], dtype=np.int64)
+
+        return (
+            self.prefix_sums[:, upper - self.length_min + 1]
+            - self.prefix_sums[:, lower - self.length_min]
+        )
+
+
+def read_length_counts(ribo: Ribo, experiment_name: str) -> ReadLengthCounts:
+    """
+    Read the CDS column of the region counts of an experiment straight from the
+    ribo file. The dataset has one row per read length and transcript, read length
+    major, in the order of ribo.transcript_names.
+    """
+    dataset = ribo._handle[EXPERIMENTS_name][experiment_name][REF_DG_REGION_COUNTS][
+        REF_DG_REGION_COUNTS
+    ]
+    number_of_transcripts = len(ribo.transcript_names)
+    cds = dataset[:, EXTENDED_REGION_names.index(CDS_name)]
+    counts = cds.reshape(-1, number_of_transcripts).T
+    return ReadLengthCounts(counts, int(ribo.minimum_length))
+
+
+def align_counts(region_counts) -> pd.DataFrame:
+    """
+    Combine per experiment gene count series into one genes x experiments frame,
+    keeping only the genes present in every experiment.
+    """
+    return pd.concat(region_counts, axis=1, join="inner")
+
+
+def prepare_matrix(counts: np.ndarray, method: str) -> np.ndarray:
+    """
+    Transform a genes x experiments count matrix so that the pearson correlation
+    of its columns gives the requested correlation.
+    The result is the only full size copy: a float32 matrix filled in place,
+    one column at a time for the ranks of spearman.
+    """
+    if method not in CORRELATION_METHODS:
+        raise ValueError("Unknown correlation method: {}".format(method))
+
+    matrix = np.empty(counts.shape, dtype=np.float32)
+    if method == "spearman":
+        for j in range(counts.shape[1]):
+            matrix[:, j] = rankdata(counts[:, j])
+    else:
+        matrix[:] = counts
+        if method == "log_pearson":
+            np.log1p(matrix, out=matrix)
+    return matrix
+
+
+def correlation_matrix(
+    counts: np.ndarray, method="spearman", block_size=BLOCK_SIZE
+) -> np.ndarray:
+    """
+    Correlation coefficients between all columns of a genes x experiments matrix.
+
+    The centered matrix is multiplied with itself in blocks of genes, so the whole
+    matrix comes out of a few BLAS calls instead of pairwise correlations.
+    Columns without any variance get NaN coefficients, as in scipy, including
+    their correlation with themselves.
+    """
+    matrix = prepare_matrix(np.asarray(counts), method)
+    number_of_genes, n = matrix.shape
+
+    means = matrix.mean(axis=0, dtype=np.float64).astype(np.float32)
+    products = np.zeros((n, n), dtype=np.float64)
+    for start in range(0, number_of_genes, block_size):
+        block = matrix[start : start + block_size] - means
+        products += block.T @ block
+
+    deviations = np.sqrt(np.diag(products))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlations = products / np.outer(deviations, deviations)
+    np.clip(correlations, -1, 1, out=correlations)
+    np.fill_diagonal(correlations, np.where(deviations > 0, 1, np.nan))
+    return correlations
+
+
+def correlations_to_list(correlations: np.ndarray):
+    """
+    Nested lists for JSON responses, with undefined coefficients as None.
+    """
+    return [[None if np.isnan(x) else float(x) for x in row] for row in correlations]
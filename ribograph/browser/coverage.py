@@ -0,0 +1,153 @@
+import numpy as np
+
+from ribopy import Ribo
+from ribopy.settings import (
+    EXPERIMENTS_name,
+    REF_DG_COVERAGE,
+    TRANSCRIPT_COVERAGE_DT,
+)
+
+from .wire import split
+
+# Transcripts closer than this many positions (in the flattened coverage
+# dataset) are read together in a single slice, as long as the slice
+# does not grow beyond MAX_READ_SIZE positions.
+MAX_READ_GAP = 1 << 16
+MAX_READ_SIZE = 1 << 22
+
+# How the positions of a bin are combined by bin_coverage
+COVERAGE_AGGREGATES = ("sum", "max")
+
+
+def coverage_dataset(ribo: Ribo, experiment_name: str):
+    """
+    The coverage dataset of an experiment. For each read length, from the minimum to
+    the maximum, it holds the coverage of all transcripts laid out one after the other.
+    """
+    return ribo._handle[EXPERIMENTS_name][experiment_name][REF_DG_COVERAGE][
+        REF_DG_COVERAGE
+    ]
+
+
+def _coalesce(spans, max_gap, max_size=MAX_READ_SIZE):
+    """
+    Group (start, end, transcript) spans, sorted by start, into runs that can be
+    read with one slice each.
+    """
+    runs = []
+    for span in spans:
+        if (
+            runs
+            and span[0] - runs[-1][1] <= max_gap
+            and span[1] - runs[-1][0] <= max_size
+        ):
+            runs[-1][1] = max(runs[-1][1], span[1])
+            runs[-1][2].append(span)
+        else:
+            runs.append([span[0], span[1], [span]])
+    return runs
+
+
+def read_transcript_coverages(
+    ribo: Ribo,
+    experiment_name: str,
+    transcripts,
+    range_lower=0,
+    range_upper=0,
+    max_gap=MAX_READ_GAP,
+):
+    """
+    Read the coverage of many transcripts (original, not aliased, names) at once.
+
+    The requested transcripts are sorted by their position in the coverage dataset
+    and nearby ones are merged, so each read length is read in one ordered pass.
+    Returns a dict of transcript name to a (read lengths x transcript length) array.
+    """
+    range_lower = range_lower or int(ribo.minimum_length)
+    range_upper = range_upper or int(ribo.maximum_length)
+
+    lengths = ribo.transcript_lengths
+    offsets = ribo.transcript_offsets
+    total_length = int(np.sum(tuple(lengths.values())))
+
+    spans = sorted(
+        (offsets[t], offsets[t] + int(lengths[t]), t) for t in set(transcripts)
+    )
+    runs = _coalesce(spans, max_gap)
+
+    number_of_lengths = range_upper - range_lower + 1
+    result = {
+        t: np.zeros((number_of_lengths, end - start), dtype=TRANSCRIPT_COVERAGE_DT)
+        for start, end, t in spans
+    }
+
+    dataset = coverage_dataset(ribo, experiment_name)
+    for row, read_length in enumerate(range(range_lower, range_upper + 1)):
+        base = (read_length - int(ribo.minimum_length)) * total_length
+        for run_start, run_end, members in runs:
+            block = dataset[base + run_start : base + run_end]
+            for start, end, t in members:
+                result[t][row] = block[start - run_start : end - run_start]
+
+    return result
+
+
+def split_coverage(coverage: np.ndarray, range_lower: int):
+    """
+    Same layout as DataFrame.to_dict(orient="split") of ribopy's transcript coverage.
+    """
+    return split(
+        coverage,
+        range(range_lower, range_lower + coverage.shape[0]),
+        range(coverage.shape[1]),
+    )
+
+
+def read_coverage_window(
+    ribo: Ribo,
+    experiment_name: str,
+    transcript: str,
+    start: int,
+    end: int,
+    range_lower=0,
+    range_upper=0,
+):
+    """
+    Read the coverage of positions [start, end) of a transcript (original name),
+    for the read lengths from range_lower to range_upper.
+    Only the window is read from the file, one slice per read length.
+    """
+    range_lower = range_lower or int(ribo.minimum_length)
+    range_upper = range_upper or int(ribo.maximum_length)
+
+    total_length = int(np.sum(tuple(ribo.transcript_lengths.values())))
+    offset = ribo.transcript_offsets[transcript]
+
+    dataset = coverage_dataset(ribo, experiment_name)
+    result = np.zeros(
+        (range_upper - range_lower + 1, end - start), dtype=TRANSCRIPT_COVERAGE_DT
+    )
+    for row, read_length in enumerate(range(range_lower, range_upper + 1)):
+        base = (read_length - int(ribo.minimum_length)) * total_length + offset
+        result[row] = dataset[base + start : base + end]
+    return result
+
+
+def bin_coverage(
+    coverage: np.ndarray, resolution=1, aggregate="sum", sum_lengths=False
+):
+    """
+    Combine every resolution consecutive positions of a (read lengths x positions)
+    coverage array into one bin, by their sum or their maximum.
+    The last bin may be shorter. With sum_lengths, the read lengths are summed
+    first, so the result has a single row.
+    """
+    if sum_lengths:
+        coverage = coverage.sum(axis=0, dtype=np.uint64, keepdims=True)
+    if resolution == 1:
+        return coverage
+
+    edges = np.arange(0, coverage.shape[1], resolution)
+    if aggregate == "max":
+        return np.maximum.reduceat(coverage, edges, axis=1)
+    return np.add.reduceat(coverage, edges, axis=1, dtype=np.uint64)
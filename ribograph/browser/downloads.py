@@ -0,0 +1,122 @@
+import os
+import re
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, quote_etag
+
+from ribograph.settings import DOWNLOAD_ACCEL_REDIRECT, DOWNLOAD_ACCEL_LOCATIONS
+
+# Size of the blocks the file is streamed in.
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a single byte range "bytes=start-end", "bytes=start-" or "bytes=-suffix"
+    into inclusive (start, end) offsets.
+    Returns None for headers that should be ignored (malformed or multiple ranges)
+    and raises ValueError for ranges that can not be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # the last <end> bytes of the file
+        suffix = int(end)
+        if suffix == 0:
+            raise ValueError("empty suffix range")
+        return max(size - suffix, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _read_file(path: str, start: int, length: int):
+    with open(path, "rb") as input_stream:
+        input_stream.seek(start)
+        while length > 0:
+            chunk = input_stream.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _accel_redirect_uri(path: str):
+    """
+    The internal nginx uri of a file, if it lies in one of the folders nginx serves.
+    """
+    path = os.path.realpath(path)
+    for folder, location in DOWNLOAD_ACCEL_LOCATIONS.items():
+        folder = os.path.realpath(folder)
+        if os.path.commonpath([path, folder]) == folder:
+            return location.rstrip("/") + "/" + os.path.relpath(path, folder)
+    return None
+
+
+def file_response(request, path: str, filename: str, content_type: str):
+    """
+    A response streaming the file at path, honoring single Range requests so
+    interrupted downloads can be resumed.
+
+    With DOWNLOAD_ACCEL_REDIRECT enabled, only the headers are sent and nginx
+    serves the file itself through X-Accel-Redirect. Permissions must be checked
+    before calling this.
+    """
+    disposition = 'attachment; filename="{}"'.format(filename.replace('"', ""))
+
+    if DOWNLOAD_ACCEL_REDIRECT:
+        uri = _accel_redirect_uri(path)
+        if uri is not None:
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = uri
+            response["Content-Disposition"] = disposition
+            return response
+
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = http_date(stat.st_mtime)
+    etag = quote_etag("{:x}-{:x}".format(stat.st_mtime_ns, size))
+
+    byte_range = None
+    range_header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    # a stale If-Range means the client's partial copy is outdated, send everything
+    if range_header and (not if_range or if_range in (etag, last_modified)):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */{}".format(size)
+            return response
+
+    if byte_range is None:
+        response = StreamingHttpResponse(
+            _read_file(path, 0, size), content_type=content_type
+        )
+        response["Content-Length"] = str(size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_file(path, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = "bytes {}-{}/{}".format(start, end, size)
+
+    response["Accept-Ranges"] = "bytes"
+    response["Last-Modified"] = last_modified
+    response["ETag"] = etag
+    response["Content-Disposition"] = disposition
+    return response
@@ -9,6 +9,7 @@ from django.contrib.auth.models import User, Group
 from django.contrib.auth.forms import UserCreationForm
 
 from django.core.exceptions import ValidationError
+from django.db.models import Q
 
 from .models import Project, Experiment, Reference
 
@@ -16,7 +17,7 @@ from datetime import datetime
 
 from ribopy import Ribo
 
-from .Fasta import FastaFile
+from .manifest import digest_reference_file, reference_manifest, find_incompatibility
 
 
 ###############################################################################
@@ -67,21 +68,8 @@ class UploadRiboFileForm(forms.Form):
     ribo_file = forms.FileField(widget=ClearableFileInput(attrs={"accept": ".ribo"}))
     project_id = forms.CharField(widget=forms.HiddenInput(), required=False)
 
-    def clean_ribo_file(self):
-        ribo_file = self.cleaned_data["ribo_file"]
-        ribo_file.seek(0)
-        try:
-            myribo = Ribo(ribo_file)
-            number_of_experiments = len(myribo.experiments)
-        except:
-            raise ValidationError(("Invalid ribo file."), code="invalid")
-
-        if number_of_experiments < 1:
-            raise ValidationError(
-                ("No experiments found in the ribo file."), code="invalid"
-            )
-
-        return ribo_file
+    # The contents of the file are checked by the ingestion (see ingestion.py)
+    # after it is saved, so that the file is opened only once.
 
 
 ################################################################################
@@ -149,39 +137,45 @@ class ExperimentReferenceForm(ModelForm):
         model = Experiment
         fields = ["reference"]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Offer the references with the same transcripts as the experiment,
+        # those that are not indexed yet and the current one.
+        if self.instance.reference_digest:
+            self.fields["reference"].queryset = Reference.objects.filter(
+                Q(transcript_digest=self.instance.reference_digest)
+                | Q(transcript_digest="")
+                | Q(id=self.instance.reference_id)
+            )
+
     def clean_reference(self):
-        ribo_handle = Ribo(self.instance.ribo_file_path)
         reference = self.cleaned_data["reference"]
 
         if not reference:
             """IF reference is none then there is nothing to check."""
             return reference
 
-        reference_fasta = FastaFile(reference.reference_file_path)
+        if not reference.transcript_digest:
+            reference.transcript_digest = digest_reference_file(
+                reference.reference_file_path
+            )
+            reference.save(update_fields=["transcript_digest"])
 
-        reference_dict = dict()
-        for transcript_entry in reference_fasta:
-            reference_dict[transcript_entry.header] = len(transcript_entry.sequence)
+        if reference.transcript_digest == self.instance.reference_digest:
+            return reference
 
+        # The reference can still have extra transcripts, or be in another order.
+        ribo_handle = Ribo(self.instance.ribo_file_path)
         ribo_transcripts = ribo_handle.transcript_names
         ribo_lengths = ribo_handle.transcript_lengths
 
-        for this_transcript in ribo_transcripts:
-            this_length = ribo_lengths[this_transcript]
-            reference_length = reference_dict.get(this_transcript, -1)
-            if this_length != reference_length:
-                if reference_length == -1:
-                    fail_message = "The transcript in the experiment (ribo file) does not exist in reference: {}".format(
-                        this_transcript
-                    )
-                else:
-                    fail_message = (
-                        "The lengths of the transcript {} do not match {} vs {}".format(
-                            this_transcript,
-                            this_length,
-                            reference_dict.get(this_transcript, -1),
-                        )
-                    )
-                raise ValidationError("Incompatible reference:" + fail_message)
+        fail_message = find_incompatibility(
+            ribo_transcripts,
+            [ribo_lengths[t] for t in ribo_transcripts],
+            *reference_manifest(reference.reference_file_path)
+        )
+        if fail_message:
+            raise ValidationError("Incompatible reference:" + fail_message)
 
         return reference
@@ -0,0 +1,113 @@
+import threading
+
+import numpy as np
+
+GENE_SORTS = ("count", "name")
+GENE_MATCHES = ("substring", "prefix")
+
+# Queries shorter than this are matched with a scan of all names,
+# longer ones through the trigram index.
+TRIGRAM_SIZE = 3
+
+
+class GeneIndex:
+    """
+    Search over the (possibly aliased) gene names of an experiment and their CDS counts.
+
+    The names are kept sorted, so prefix matches are a binary search, together with the
+    rank of every gene by name and by decreasing count, so any set of matches can be
+    ordered without sorting the names again. Substring matches go through a trigram
+    index, built on the first query that needs it.
+    """
+
+    def __init__(self, names, counts):
+        self.names = np.asarray(names, dtype=str)
+        self.counts = np.asarray(counts, dtype=np.uint64)
+        self.lower_names = np.char.lower(self.names)
+
+        self.by_name = np.argsort(self.lower_names, kind="stable")
+        self.sorted_names = self.lower_names[self.by_name]
+        self.by_count = np.argsort(-self.counts.astype(np.int64), kind="stable")
+
+        self.rank = {}
+        for sort, order in (("name", self.by_name), ("count", self.by_count)):
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            self.rank[sort] = rank
+
+        self._trigrams = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def trigrams(self):
+        """
+        Trigram -> sorted indices of the names containing it.
+        """
+        with self._lock:
+            if self._trigrams is None:
+                postings = {}
+                for i, name in enumerate(self.lower_names):
+                    for trigram in {
+                        name[j : j + TRIGRAM_SIZE]
+                        for j in range(len(name) - TRIGRAM_SIZE + 1)
+                    }:
+                        postings.setdefault(trigram, []).append(i)
+                self._trigrams = {
+                    k: np.array(v, dtype=np.int64) for k, v in postings.items()
+                }
+        return self._trigrams
+
+    def prefix_matches(self, query: str) -> np.ndarray:
+        lower = np.searchsorted(self.sorted_names, query, side="left")
+        upper = np.searchsorted(self.sorted_names, query + "\U0010ffff", side="left")
+        return self.by_name[lower:upper]
+
+    def substring_matches(self, query: str) -> np.ndarray:
+        if len(query) < TRIGRAM_SIZE:
+            return np.flatnonzero(np.char.find(self.lower_names, query) >= 0)
+
+        candidates = None
+        for j in range(len(query) - TRIGRAM_SIZE + 1):
+            posting = self.trigrams.get(query[j : j + TRIGRAM_SIZE])
+            if posting is None:
+                return np.zeros(0, dtype=np.int64)
+            candidates = (
+                posting
+                if candidates is None
+                else np.intersect1d(candidates, posting, assume_unique=True)
+            )
+        # the trigrams may be in the name in a different order
+        found = np.char.find(self.lower_names[candidates], query) >= 0
+        return candidates[found]
+
+    def search(self, query="", sort="count", match="substring", offset=0, limit=100):
+        """
+        Returns the number of matching genes and the indices of the requested page.
+        """
+        query = query.lower()
+        if not query:
+            order = self.by_name if sort == "name" else self.by_count
+            return len(order), order[offset : offset + limit]
+
+        if match == "prefix":
+            matches = self.prefix_matches(query)
+        else:
+            matches = self.substring_matches(query)
+
+        rank = self.rank[sort][matches]
+        if offset + limit < len(matches):
+            # only the requested page has to be in order
+            page = np.argpartition(rank, offset + limit - 1)[: offset + limit]
+            page = page[np.argsort(rank[page])]
+        else:
+            page = np.argsort(rank)
+        return len(matches), matches[page[offset : offset + limit]]
+
+    def page(self, indices) -> dict:
+        return {
+            "genes": self.names[indices].tolist(),
+            "counts": self.counts[indices],
+        }
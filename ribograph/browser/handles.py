@@ -0,0 +1,167 @@
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ribopy import Ribo
+
+
+def open_ribo(ribo_file_path: str, transcript_regex: str = "") -> Ribo:
+    """
+    Open a ribo file, aliasing transcript names with the given regex if there is one.
+    """
+    alias = None
+    if transcript_regex:
+        alias = lambda x: re.search(transcript_regex, x).group(1)
+    return Ribo(ribo_file_path, alias=alias)
+
+
+def close_ribo(ribo: Ribo):
+    """
+    Close the underlying hdf5 file of a ribo object.
+    """
+    try:
+        ribo._handle.close()
+    except Exception:
+        pass
+
+
+class _Handle:
+    __slots__ = ("ribo", "leases", "retired")
+
+    def __init__(self, ribo):
+        self.ribo = ribo
+        self.leases = 0
+        # no longer in the pool; closed by its last release
+        self.retired = False
+
+
+class RiboHandlePool:
+    """
+    A bounded pool of open ribo files.
+
+    Handles are keyed by (ribo_file_path, transcript_regex), so experiments that
+    live in the same ribo file share one open hdf5 file. Handles are leased:
+    acquire() (or the lease() context manager) returns an open ribo object that
+    stays open until it is released. When more than max_open files are in the
+    pool, the least recently used one leaves it and is closed as soon as its
+    last lease is released, so reads still running on it are not cut short.
+    """
+
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+        self._handles = OrderedDict()
+        self._leased = {}
+        self._lock = threading.Lock()
+
+        self.opens = 0
+        self.reuses = 0
+        self.evictions = 0
+
+    def _lease(self, key):
+        handle = self._handles.get(key)
+        if handle is None or not handle.ribo._handle.id.valid:
+            return None
+        self._handles.move_to_end(key)
+        handle.leases += 1
+        self._leased[id(handle.ribo)] = handle
+        return handle.ribo
+
+    def _retire(self, handle):
+        """
+        Take a handle out of the pool, closing it if nobody holds it.
+        Returns the ribo object to close, if any; closing is done without the lock.
+        """
+        handle.retired = True
+        return handle.ribo if handle.leases == 0 else None
+
+    def acquire(self, ribo_file_path: str, transcript_regex: str = "") -> Ribo:
+        """
+        An open ribo object for the file, to be given back with release().
+        """
+        key = (ribo_file_path, transcript_regex or "")
+
+        with self._lock:
+            ribo = self._lease(key)
+            if ribo is not None:
+                self.reuses += 1
+                return ribo
+
+        # opening reads the file, so other files are not held up meanwhile
+        opened = open_ribo(*key)
+
+        to_close = []
+        with self._lock:
+            ribo = self._lease(key)
+            if ribo is not None:
+                # opened by another thread in the meantime
+                self.reuses += 1
+                to_close.append(opened)
+            else:
+                stale = self._handles.pop(key, None)
+                if stale is not None:
+                    to_close.append(self._retire(stale))
+                self._handles[key] = _Handle(opened)
+                ribo = self._lease(key)
+                self.opens += 1
+
+                while len(self._handles) > self.max_open:
+                    _, evicted = self._handles.popitem(last=False)
+                    to_close.append(self._retire(evicted))
+                    self.evictions += 1
+
+        for stale_ribo in to_close:
+            if stale_ribo is not None:
+                close_ribo(stale_ribo)
+        return ribo
+
+    def release(self, ribo: Ribo):
+        with self._lock:
+            handle = self._leased[id(ribo)]
+            handle.leases -= 1
+            if handle.leases > 0:
+                return
+            del self._leased[id(ribo)]
+            if not handle.retired:
+                return
+        close_ribo(ribo)
+
+    @contextmanager
+    def lease(self, ribo_file_path: str, transcript_regex: str = ""):
+        ribo = self.acquire(ribo_file_path, transcript_regex)
+        try:
+            yield ribo
+        finally:
+            self.release(ribo)
+
+    def _retire_where(self, predicate):
+        with self._lock:
+            keys = [k for k in self._handles if predicate(k)]
+            to_close = [self._retire(self._handles.pop(k)) for k in keys]
+        for ribo in to_close:
+            if ribo is not None:
+                close_ribo(ribo)
+
+    def discard(self, ribo_file_path: str):
+        """
+        Close every handle of the given file, e.g. before the file is deleted.
+        Handles still leased are closed when they are released.
+        """
+        self._retire_where(lambda key: key[0] == ribo_file_path)
+
+    def clear(self):
+        self._retire_where(lambda key: True)
+
+    def __len__(self):
+        return len(self._handles)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self._handles),
+                "leased": len(self._leased),
+                "max_open": self.max_open,
+                "opens": self.opens,
+                "reuses": self.reuses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import shutil
+
+from ribopy import Ribo
+from ribopy.api.alias import ReferenceAlias
+
+from .handles import close_ribo
+from .summary import build_summary, summary_path
+from .manifest import digest_transcripts
+
+# Bump this when the stored fields change.
+INGESTION_VERSION = 1
+
+APPRIS_REGEX = r"^(?:[^|]*\|){4}([^|]*)\|.*$"
+
+
+class IngestionError(Exception):
+    """
+    The uploaded file can not be added as a ribo file.
+    The message is shown to the user.
+    """
+
+
+def ingestion_path(ribo_file_path: str) -> str:
+    return os.path.splitext(ribo_file_path)[0] + ".ingest.json"
+
+
+def digest_reference(ribo_handle):
+    """
+    We take the transcript names and concatanate transcript lengths to them.
+    Then we hash the resulting value.
+    If the hashed values are same for two experiments, we can
+    assume that they come from the same reference.
+    """
+    transcript_names = ribo_handle.transcript_names
+    transcript_lengths_dict = ribo_handle.transcript_lengths
+    return digest_transcripts(
+        transcript_names, [transcript_lengths_dict[t] for t in transcript_names]
+    )
+
+
+def detect_transcript_regex(transcript_names) -> str:
+    """
+    If the transcript name has many "|"s, then
+    our guess is it is coming from Appris.
+    So we will pick the names between 3rd and fourth "|"s.
+    If not, then we will return empty string.
+    """
+    number_of_bars = len(re.findall(r"\|", transcript_names[0]))
+
+    # If there are many bars, we assume that it is coming from the appris reference
+    # So we pick the 5th element which is
+    # GeneName-TranscriptNumber
+    # E.g.: Rfpl4-201
+    if number_of_bars > 8:
+        return APPRIS_REGEX
+    return ""
+
+
+def validate_alias(regex: str, transcript_names) -> bool:
+    """
+    Make sure the aliases coming from the regular expression are accepted by ribopy,
+    without opening the file again.
+    """
+    try:
+        ReferenceAlias(lambda x: re.search(regex, x).group(1), transcript_names)
+    except Exception:
+        return False
+    return True
+
+
+def choose_transcript_regex(transcript_names) -> str:
+    """
+    The transcript regex of a ribo file with these transcript names.
+    Empty if there is none or the aliases coming from it are not accepted by ribopy.
+    """
+    transcript_regex = detect_transcript_regex(transcript_names)
+    if transcript_regex and not validate_alias(transcript_regex, transcript_names):
+        return ""
+    return transcript_regex
+
+
+##########################################################################
+
+
+class RiboIngestion:
+    """
+    Everything the upload and confirmation steps need to know about a new ribo file.
+
+    run() opens the file once, checks it, computes the reference digest and the
+    transcript regex, builds the summary next to the file and stores the results
+    in a json file next to it, so that the later steps only load() them.
+    """
+
+    def __init__(
+        self,
+        ribo_file_path,
+        experiments,
+        reference_digest,
+        transcript_regex,
+        length_min,
+        length_max,
+        number_of_transcripts,
+    ):
+        self.ribo_file_path = ribo_file_path
+        self.experiments = list(experiments)
+        self.reference_digest = reference_digest
+        self.transcript_regex = transcript_regex
+        self.length_min = length_min
+        self.length_max = length_max
+        self.number_of_transcripts = number_of_transcripts
+
+    @classmethod
+    def run(cls, ribo_file_path: str, progress=None):
+        """
+        progress, if given, is called with the fraction done and a message.
+        """
+        progress = progress or (lambda fraction, message: None)
+        try:
+            ribo = Ribo(ribo_file_path)
+            experiments = list(ribo.experiments)
+        except Exception:
+            raise IngestionError("Invalid ribo file.")
+
+        try:
+            if len(experiments) < 1:
+                raise IngestionError("No experiments found in the ribo file.")
+            progress(0.1, "Checking transcript names")
+
+            transcript_names = ribo.transcript_names
+            transcript_regex = choose_transcript_regex(transcript_names)
+
+            ingestion = cls(
+                ribo_file_path,
+                experiments=experiments,
+                reference_digest=digest_reference(ribo),
+                transcript_regex=transcript_regex,
+                length_min=int(ribo.minimum_length),
+                length_max=int(ribo.maximum_length),
+                number_of_transcripts=len(transcript_names),
+            )
+
+            # precompute the arrays the experiment overview pages are built from
+            progress(0.2, "Summarizing experiments")
+            build_summary(ribo, ribo_file_path)
+        finally:
+            close_ribo(ribo)
+
+        ingestion.save()
+        return ingestion
+
+    def to_dict(self):
+        return {
+            "version": INGESTION_VERSION,
+            "experiments": self.experiments,
+            "reference_digest": self.reference_digest,
+            "transcript_regex": self.transcript_regex,
+            "length_min": self.length_min,
+            "length_max": self.length_max,
+            "number_of_transcripts": self.number_of_transcripts,
+        }
+
+    def save(self):
+        target_path = ingestion_path(self.ribo_file_path)
+        tmp_path = target_path + ".tmp"
+        with open(tmp_path, "w") as output_stream:
+            json.dump(self.to_dict(), output_stream)
+        os.replace(tmp_path, target_path)
+
+    @classmethod
+    def load(cls, ribo_file_path: str):
+        """
+        The stored results for a file, or None if the file was not ingested
+        (or with an older version).
+        """
+        try:
+            with open(ingestion_path(ribo_file_path)) as input_stream:
+                data = json.load(input_stream)
+        except (OSError, ValueError):
+            return None
+
+        if data.pop("version", None) != INGESTION_VERSION:
+            return None
+        return cls(ribo_file_path, **data)
+
+    def move(self, target_path: str):
+        """
+        Move the ribo file and its summary to their final place.
+        The stored results are not needed there, they live in the experiments.
+        """
+        shutil.move(self.ribo_file_path, target_path)
+        if os.path.exists(summary_path(self.ribo_file_path)):
+            shutil.move(summary_path(self.ribo_file_path), summary_path(target_path))
+        self.remove()
+        self.ribo_file_path = target_path
+
+    def remove(self):
+        try:
+            os.remove(ingestion_path(self.ribo_file_path))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import socket
+import logging
+from datetime import timedelta
+from hashlib import sha1
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+from ribograph.settings import BACKGROUND_JOBS, JOB_POLL_INTERVAL, JOB_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+def make_job_registrar():
+    """
+    Returns a decorator registering job handlers by name.
+    A handler is called as handler(job, **arguments) and may report its progress
+    with job.set_progress. Its return value (json serializable) is the job result.
+    """
+    registry = {}
+
+    def registrar(name):
+        def register(func):
+            registry[name] = func
+            return func
+
+        return register
+
+    registrar.all = registry
+    return registrar
+
+
+register_job = make_job_registrar()
+
+
+def job_key(kind: str, arguments: dict) -> str:
+    return sha1(
+        json.dumps([kind, arguments], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def enqueue(kind: str, owner=None, inline=True, unique=False, **arguments):
+    """
+    Queue a job. Without background jobs, it is run right away if inline is set
+    and skipped (None is returned) otherwise.
+    With unique set, a job of the same kind and arguments that is still queued
+    or running is returned instead of queueing another one.
+    """
+    if kind not in register_job.all:
+        raise KeyError("Unknown job: {}".format(kind))
+
+    if not BACKGROUND_JOBS and not inline:
+        logger.info("Skipped job %s: background jobs are off", kind)
+        return None
+
+    key = job_key(kind, arguments)
+    if unique and BACKGROUND_JOBS:
+        fail_stale_jobs()
+        pending = Job.objects.filter(
+            key=key, status__in=(Job.QUEUED, Job.RUNNING)
+        ).first()
+        if pending is not None:
+            return pending
+
+    job = Job.objects.create(kind=kind, arguments=arguments, key=key, owner=owner)
+    if not BACKGROUND_JOBS:
+        run_job(job)
+    return job
+
+
+def run_job(job: Job):
+    """
+    Run a claimed (or inline) job and record its outcome.
+    """
+    Job.objects.filter(id=job.id).update(status=Job.RUNNING, start_date=timezone.now())
+    try:
+        result = register_job.all[job.kind](job, **job.arguments)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        job.status, job.message, job.result = Job.FAILED, str(e), None
+    else:
+        job.status, job.progress, job.result = Job.DONE, 1, result
+
+    job.end_date = timezone.now()
+    Job.objects.filter(id=job.id).update(
+        status=job.status,
+        progress=job.progress,
+        message=job.message,
+        result=job.result,
+        end_date=job.end_date,
+    )
+    return job
+
+
+def fail_stale_jobs(timeout=JOB_TIMEOUT) -> int:
+    """
+    Mark the jobs running for more than timeout seconds as failed. Their worker
+    was most likely killed, and they would otherwise stay running forever.
+    Returns the number of failed jobs.
+    """
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        start_date__lt=timezone.now() - timedelta(seconds=timeout),
+    )
+    for job in stale:
+        logger.warning("Job %s (%s) on %s timed out", job.id, job.kind, job.worker)
+    return stale.update(
+        status=Job.FAILED,
+        message="The job did not finish in time.",
+        end_date=timezone.now(),
+    )
+
+
+def claim_job(worker: str):
+    """
+    Take the oldest queued job, or return None if there is none.
+    The status is switched with a conditional update, so two workers
+    can not claim the same job.
+    """
+    fail_stale_jobs()
+    while True:
+        job = Job.objects.filter(status=Job.QUEUED).order_by("id").first()
+        if job is None:
+            return None
+
+        with transaction.atomic():
+            claimed = Job.objects.filter(id=job.id, status=Job.QUEUED).update(
+                status=Job.RUNNING, worker=worker, start_date=timezone.now()
+            )
+        if claimed:
+            job.status, job.worker = Job.RUNNING, worker
+            return job
+
+
+def worker_name():
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+def run_worker(poll_interval=JOB_POLL_INTERVAL, should_stop=lambda: False):
+    """
+    Run queued jobs until should_stop() returns True.
+    """
+    name = worker_name()
+    while not should_stop():
+        job = claim_job(name)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+
+
+def job_status(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "result": job.result,
+        "creationDate": job.creation_date.isoformat(),
+    }
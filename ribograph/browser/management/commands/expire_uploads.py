@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from browser.uploads import expire_uploads
+from ribograph.settings import UPLOAD_EXPIRY
+
+
+class Command(BaseCommand):
+    help = "Removes chunked uploads that were never finalized, with their part files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=float,
+            default=UPLOAD_EXPIRY,
+            help="Seconds after which an upload expires.",
+        )
+
+    def handle(self, *args, **options):
+        count = expire_uploads(options["max_age"])
+        self.stdout.write("Removed {} expired uploads.".format(count))
@@ -0,0 +1,61 @@
+import signal
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from browser.jobs import run_worker
+from ribograph.settings import WORKER_PROCESSES, JOB_POLL_INTERVAL
+
+
+def _work(poll_interval):
+    stopping = multiprocessing.Event()
+    # finish the current job on SIGTERM, then exit
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(poll_interval, should_stop=stopping.is_set)
+
+
+class Command(BaseCommand):
+    help = "Runs the queued background jobs (ingestion, summaries, cache warming)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=WORKER_PROCESSES,
+            help="Number of worker processes.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=JOB_POLL_INTERVAL,
+            help="Seconds between looking for new jobs when idle.",
+        )
+
+    def handle(self, *args, **options):
+        # every process opens its own database connection
+        connections.close_all()
+
+        processes = [
+            multiprocessing.get_context("fork").Process(
+                target=_work, args=(options["poll_interval"],)
+            )
+            for _ in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write("Started {} worker processes.".format(len(processes)))
+
+        def stop(*args):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop()
+            for process in processes:
+                process.join()
@@ -0,0 +1,72 @@
+import os
+from hashlib import md5
+
+import numpy as np
+import pandas as pd
+
+from .Fasta import build_fasta_index, fasta_index_paths
+
+
+def digest_transcripts(transcript_names, transcript_lengths) -> str:
+    """
+    md5 of the transcript names followed by their lengths.
+    Ribo files and references with the same digest have the same transcripts.
+    """
+    transcript_names_string = ",".join(transcript_names)
+    transcript_lengths_string = ",".join(str(x) for x in transcript_lengths)
+
+    string_to_be_digested = transcript_names_string + transcript_lengths_string
+    transcript_hash = md5()
+    transcript_hash.update(string_to_be_digested.encode("ascii"))
+
+    return transcript_hash.hexdigest()
+
+
+def reference_manifest(reference_file_path: str):
+    """
+    Transcript names and lengths of a reference, in the order of the fasta file.
+    They are read from the index of the reference, which is built if missing.
+    """
+    _, index_path = fasta_index_paths(reference_file_path)
+    if not os.path.exists(index_path):
+        build_fasta_index(reference_file_path)
+
+    names, lengths = [], []
+    with open(index_path) as index_stream:
+        for line in index_stream:
+            header, _, length = line.rstrip("\n").split("\t")
+            names.append(header)
+            lengths.append(int(length))
+
+    return names, np.array(lengths, dtype=np.int64)
+
+
+def digest_reference_file(reference_file_path: str) -> str:
+    return digest_transcripts(*reference_manifest(reference_file_path))
+
+
+def find_incompatibility(
+    transcript_names, transcript_lengths, reference_names, reference_lengths
+):
+    """
+    Check that every transcript of a ribo file is in the reference with the same length.
+    Returns a message describing the first mismatch, or None if they are compatible.
+    """
+    reference = pd.Series(reference_lengths, index=reference_names)
+    reference = reference[~reference.index.duplicated()]
+    matched = reference.reindex(transcript_names).to_numpy()
+
+    missing = np.isnan(matched)
+    different = ~missing & (matched != np.asarray(transcript_lengths))
+    mismatches = np.flatnonzero(missing | different)
+    if len(mismatches) == 0:
+        return None
+
+    i = mismatches[0]
+    if missing[i]:
+        return "The transcript in the experiment (ribo file) does not exist in reference: {}".format(
+            transcript_names[i]
+        )
+    return "The lengths of the transcript {} do not match {} vs {}".format(
+        transcript_names[i], transcript_lengths[i], int(matched[i])
+    )
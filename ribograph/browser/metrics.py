@@ -0,0 +1,348 @@
+"""
+Process local metrics of the APIs, exported in the Prometheus text format.
+
+Every registered API records its total time and the time spent in each phase of
+the request (API_PHASES) in histograms. Phases nest: the time of an inner phase
+is only counted there, so e.g. "read" is the time of the API function without
+the "transform" blocks inside it. Counters and gauges kept elsewhere (the cache
+and handle statistics) are read by collectors when the metrics are rendered.
+
+Each worker process has its own metrics. Every sample is labelled with the
+worker (host:pid) that recorded it, so the series of different processes are
+kept apart and can be summed over the worker label.
+"""
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.decorators import decorator_from_middleware
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# db: database lookups and permission checks, handle: getting the open ribo file,
+# read: the API function (mostly ribopy / hdf5 reads), transform: pandas and numpy
+# work on what was read, serialize: encoding the response, gzip: compressing it
+API_PHASES = ("db", "handle", "read", "transform", "serialize", "gzip")
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def worker_label() -> str:
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+def _format_sample(name, labels, value) -> str:
+    if labels:
+        label_text = ",".join(
+            '{}="{}"'.format(k, _escape(v)) for k, v in labels.items()
+        )
+        return "{}{{{}}} {}".format(name, label_text, _format_value(value))
+    return "{} {}".format(name, _format_value(value))
+
+
+class Histogram:
+    """
+    A Prometheus histogram with a fixed set of label names.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        assert len(labels) == len(self.labelnames)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # one count per bucket, then the sum
+                counts = self._values[labels] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def collect(self, const_labels=None):
+        with self._lock:
+            values = {k: list(v) for k, v in self._values.items()}
+
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} histogram".format(self.name),
+        ]
+        for labels, counts in sorted(values.items()):
+            labels = dict(const_labels or {}, **dict(zip(self.labelnames, labels)))
+            for bound, count in zip(self.buckets, counts):
+                lines.append(
+                    _format_sample(
+                        self.name + "_bucket",
+                        dict(labels, le=_format_value(float(bound))),
+                        count,
+                    )
+                )
+            lines.append(_format_sample(self.name + "_sum", labels, counts[-1]))
+            lines.append(_format_sample(self.name + "_count", labels, counts[-2]))
+        return lines
+
+
+def render_family(name, metric_type, documentation, samples, const_labels=None):
+    """
+    The lines of a counter or gauge, samples being (labels dict, value) pairs.
+    const_labels are added to the labels of every sample.
+    """
+    lines = [
+        "# HELP {} {}".format(name, documentation),
+        "# TYPE {} {}".format(name, metric_type),
+    ]
+    lines.extend(
+        _format_sample(name, dict(const_labels or {}, **labels), value)
+        for labels, value in samples
+    )
+    return lines
+
+
+class Registry:
+    """
+    The histograms of this process and the collectors of its other metrics.
+    A collector is a function of the labels shared by every sample (the worker)
+    returning a list of lines, e.g. from render_family.
+    """
+
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        histogram = Histogram(*args, **kwargs)
+        self.histograms.append(histogram)
+        return histogram
+
+    def register(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        const_labels = {"worker": worker_label()}
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.collect(const_labels))
+        for collector in self.collectors:
+            lines.extend(collector(const_labels))
+        return "\n".join(lines) + "\n"
+
+
+def collect_stats(
+    prefix, documentation, stats, counters=(), gauges=(), const_labels=None
+):
+    """
+    Counters and gauges from a stats() dict, such as the ones of the cache
+    backends and the handle pool.
+    """
+    lines = []
+    for key in counters:
+        lines.extend(
+            render_family(
+                "{}_{}_total".format(prefix, key),
+                "counter",
+                "{}: {}".format(documentation, key),
+                [({}, stats[key])],
+                const_labels,
+            )
+        )
+    for key in gauges:
+        lines.extend(
+            render_family(
+                "{}_{}".format(prefix, key),
+                "gauge",
+                "{}: {}".format(documentation, key),
+                [({}, stats[key])],
+                const_labels,
+            )
+        )
+    return lines
+
+
+def collect_memoized(memoized, const_labels=None):
+    """
+    Counters and gauges of the caches of memoized functions, labelled by function.
+    """
+    stats = {name: func.stats() for name, func in sorted(memoized.items())}
+    lines = []
+    for key, metric_type in (
+        ("hits", "counter"),
+        ("misses", "counter"),
+        ("evictions", "counter"),
+        ("entries", "gauge"),
+        ("size", "gauge"),
+        ("max_size", "gauge"),
+    ):
+        name = "ribograph_memoize_" + key
+        if metric_type == "counter":
+            name += "_total"
+        lines.extend(
+            render_family(
+                name,
+                metric_type,
+                "Caches of memoized functions: {}".format(key),
+                [({"cache": cache}, values[key]) for cache, values in stats.items()],
+                const_labels,
+            )
+        )
+    return lines
+
+
+registry = Registry()
+
+api_request_seconds = registry.histogram(
+    "ribograph_api_request_seconds",
+    "Time to answer an API request, including cached responses.",
+    ("endpoint",),
+)
+api_phase_seconds = registry.histogram(
+    "ribograph_api_phase_seconds",
+    "Time spent in each phase of an API request.",
+    ("endpoint", "phase"),
+)
+
+
+##########################################################################
+#### Request timing
+##########################################################################
+
+_current_timer = ContextVar("ribograph_request_timer", default=None)
+
+
+class RequestTimer:
+    """
+    Collects the phase times of one API request.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.phases = {}
+        # [name, start, time spent in nested phases]
+        self._stack = []
+
+    @contextmanager
+    def activate(self):
+        """
+        Make phase() record into this timer, in the current thread or task.
+        """
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    @contextmanager
+    def phase(self, name):
+        frame = [name, time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed - frame[2]
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def finish(self):
+        api_request_seconds.observe(time.perf_counter() - self.start, self.endpoint)
+        # a request that timed out may still be running
+        for name, elapsed in list(self.phases.items()):
+            api_phase_seconds.observe(elapsed, self.endpoint, name)
+
+
+@contextmanager
+def phase(name):
+    """
+    Count the time of the block as the given phase of the current API request.
+    Does nothing outside of a timed request.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.phase(name):
+        yield
+
+
+@contextmanager
+def timed_request(endpoint):
+    timer = RequestTimer(endpoint)
+    with timer.activate():
+        try:
+            yield timer
+        finally:
+            timer.finish()
+
+
+def timed_view(endpoint):
+    """
+    Decorator recording the time of every call of a view as a request to endpoint.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with timed_request(endpoint):
+                return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TimedGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware counting its time as the gzip phase of the request.
+    """
+
+    def process_response(self, request, response):
+        with phase("gzip"):
+            return super().process_response(request, response)
+
+
+timed_gzip_page = decorator_from_middleware(TimedGZipMiddleware)
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User, Group
 from django.core.exceptions import ValidationError
 
 import re
+import uuid
 
 
 ##################################################################
@@ -71,6 +72,12 @@ class Reference(RiboGraphModel):
         User, on_delete=models.CASCADE, help_text="Owner of the Reference."
     )
 
+    # Same digest as the reference_digest of experiments (see manifest.py),
+    # filled in when the reference is indexed.
+    transcript_digest = models.CharField(
+        max_length=50, unique=False, blank=True, db_index=True
+    )
+
 
 ##################################################################
 
@@ -113,3 +120,109 @@ class Experiment(RiboGraphModel):
 
 
 ##################################################################
+
+
+class ChunkedUpload(models.Model):
+    """
+    A file that is being uploaded in chunks. The received bytes are kept in a
+    part file until the upload is finalized, so an interrupted upload can be
+    resumed from the stored offset.
+    """
+
+    KINDS = (("ribo", "ribo file"), ("reference", "reference file"))
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    creation_date = models.DateTimeField(auto_now_add=True)
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+
+    file_name = models.CharField(max_length=255, blank=True)
+
+    size = models.BigIntegerField(help_text="Total size of the file in bytes.")
+
+    offset = models.BigIntegerField(
+        default=0, help_text="Number of bytes received so far."
+    )
+
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        help_text="Project the ribo file is uploaded to.",
+    )
+
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, help_text="User uploading the file."
+    )
+
+
+##################################################################
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by `manage.py worker`.
+    See jobs.py.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    STATUSES = (
+        (QUEUED, "queued"),
+        (RUNNING, "running"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    )
+
+    creation_date = models.DateTimeField(auto_now_add=True)
+
+    kind = models.CharField(max_length=50, help_text="Name of the job handler.")
+
+    arguments = models.JSONField(default=dict)
+
+    # identifies jobs with the same kind and arguments
+    key = models.CharField(max_length=40, db_index=True)
+
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=QUEUED, db_index=True
+    )
+
+    progress = models.FloatField(default=0, help_text="Between 0 and 1.")
+
+    message = models.TextField(blank=True)
+
+    result = models.JSONField(blank=True, null=True)
+
+    worker = models.CharField(max_length=100, blank=True)
+
+    start_date = models.DateTimeField(blank=True, null=True)
+
+    end_date = models.DateTimeField(blank=True, null=True)
+
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        help_text="User who started the job.",
+    )
+
+    def __str__(self):
+        return "{} {} ({})".format(self.kind, self.id, self.status)
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def set_progress(self, progress, message=""):
+        self.progress = progress
+        self.message = message
+        Job.objects.filter(id=self.id).update(progress=progress, message=message)
+
+
+##################################################################
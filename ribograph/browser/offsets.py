@@ -0,0 +1,54 @@
+import numpy as np
+
+# Auto offsets align the peak of the start site metagene within these
+# positions (the upper bound is exclusive) to 0, as the offset page does.
+AUTO_OFFSET_SEARCH_BOUNDS = (-18, -6)
+
+
+def parse_offsets(value: str, number_of_lengths: int):
+    """
+    Offsets are given as a comma separated list of integers, one per read length.
+    Raises ValueError if they can not be parsed or their number is wrong.
+    """
+    try:
+        offsets = [int(x) for x in value.split(",")] if value else []
+    except ValueError:
+        raise ValueError("offsets must be a comma separated list of integers")
+    if len(offsets) != number_of_lengths:
+        raise ValueError(
+            "one offset per read length ({}) must be given".format(number_of_lengths)
+        )
+    return np.array(offsets, dtype=np.int64)
+
+
+def apply_offsets(coverage: np.ndarray, offsets) -> np.ndarray:
+    """
+    Shift each row (read length) of a read lengths x positions coverage array by its
+    offset, positive offsets moving reads towards the 3' end, and sum the rows.
+    Positions shifted out of the array are dropped, like shiftArray in utils.ts.
+    """
+    length = coverage.shape[1]
+    result = np.zeros(length, dtype=np.uint64)
+    for row, offset in zip(coverage, offsets):
+        offset = int(offset)
+        if abs(offset) >= length:
+            continue
+        if offset >= 0:
+            result[offset:] += row[: length - offset]
+        else:
+            result[:offset] += row[-offset:]
+    return result
+
+
+def auto_offsets(metagene: np.ndarray, positions, bounds=AUTO_OFFSET_SEARCH_BOUNDS):
+    """
+    For every read length (row) of a start site metagene, the offset that moves
+    the highest count between the bounds to position 0.
+    Ties go to the position closest to the lower bound.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    columns = np.flatnonzero((positions >= bounds[0]) & (positions < bounds[1]))
+    if len(columns) == 0:
+        return np.zeros(metagene.shape[0], dtype=positions.dtype)
+    peaks = np.argmax(metagene[:, columns], axis=1)
+    return -positions[columns[peaks]]
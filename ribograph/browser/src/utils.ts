@@ -20,24 +20,99 @@ export const CODON_DICT: Record<string, string> =
 //// API INTERFACES
 ////////////////////////
 
+// content type of the packed binary API responses (see browser/wire.py)
+const BINARY_CONTENT_TYPE = "application/vnd.ribograph.binary"
+const BINARY_MAGIC = "RGB1"
+
+const TYPED_ARRAYS: Record<string, any> = {
+    uint16: Uint16Array,
+    uint32: Uint32Array,
+    int32: Int32Array,
+    float64: Float64Array,
+}
+
+interface BinaryBuffer {
+    dtype: string
+    shape: number[]
+    offset: number
+    byteLength: number
+}
+
+/**
+ * Decode a binary API response: a little-endian uint32 header length after the
+ * magic, a JSON header and 8 byte aligned typed arrays. Arrays and ranges referenced
+ * by the header are turned back into the plain arrays of the JSON responses,
+ * so the components can not tell the two formats apart.
+ */
+export function decodeBinaryResponse(buffer: ArrayBuffer) {
+    const view = new DataView(buffer)
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4))
+    if (magic !== BINARY_MAGIC) {
+        throw new Error("Invalid binary response")
+    }
+    const headerLength = view.getUint32(4, true)
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)))
+    const start = 8 + headerLength
+
+    const arrays = header.buffers.map((b: BinaryBuffer) => {
+        const TypedArray = TYPED_ARRAYS[b.dtype]
+        const values = new TypedArray(buffer, start + b.offset, b.byteLength / TypedArray.BYTES_PER_ELEMENT)
+        if (b.shape.length < 2) {
+            return Array.from(values)
+        }
+        const width = b.shape[1]
+        return generateRange(0, b.shape[0]).map(row => Array.from(values.subarray(row * width, (row + 1) * width)))
+    })
+
+    const revive = (value: any): any => {
+        if (Array.isArray(value)) {
+            return value.map(revive)
+        }
+        if (value === null || typeof value !== "object") {
+            return value
+        }
+        if ("$array" in value) {
+            return arrays[value.$array]
+        }
+        if ("$range" in value) {
+            const [start, stop, step] = value.$range
+            return generateRange(0, Math.max(0, Math.ceil((stop - start) / step))).map(i => start + i * step)
+        }
+        return Object.fromEntries(Object.entries(value).map(([k, v]) => [k, revive(v)]))
+    }
+
+    return revive(header.data)
+}
+
 /**
  * A general function that can be used to get data from an arbitrary api endpoint
  * 
  * @param message text to show on the the loading message toast
  * @param endpoint the relative endpoint to fetch
+ * @param options.binary request the packed binary encoding, for endpoints sending large arrays
+ * @param options.quiet don't show the loading toast, for frequent small requests
  */
-async function handleAPICall(message: string, endpoint: string) {
+async function handleAPICall(message: string, endpoint: string, { binary = false, quiet = false } = {}) {
     await nextTick() // this is needed to wait for the notification system to load in
 
     let data = null
 
     // create the loading notification toast
-    const loadingNotification = toast(message, {
+    const loadingNotification = quiet ? null : toast(message, {
         timeout: false, position: POSITION.BOTTOM_RIGHT,
     });
 
     try {
-        data = (await axios.get(BASE_URL + endpoint, { withCredentials: true })).data // the actual data fetch
+        if (binary) {
+            const response = await axios.get(BASE_URL + endpoint, {
+                withCredentials: true,
+                responseType: 'arraybuffer',
+                headers: { Accept: BINARY_CONTENT_TYPE },
+            })
+            data = decodeBinaryResponse(response.data)
+        } else {
+            data = (await axios.get(BASE_URL + endpoint, { withCredentials: true })).data // the actual data fetch
+        }
     } catch (error) {
         // create an error message, defaulting to 'Unknown Error' if the error 
         // doesn't have an inbuilt message
@@ -48,7 +123,7 @@ async function handleAPICall(message: string, endpoint: string) {
     }
 
     // hide the loading notification toast
-    toast.dismiss(loadingNotification)
+    if (loadingNotification !== null) toast.dismiss(loadingNotification)
     return data
 }
 
@@ -58,23 +133,64 @@ export const getMetadata = (experiment_id: number) => (
 
 export const getRegionPercentages = (experiment_id: number) => (
     handleAPICall(`Loading Region Percentages`,
-        `/api/experiment/${experiment_id}/getRegionPercentages`))
+        `/api/experiment/${experiment_id}/getRegionPercentages`, { binary: true }))
 
 export const getLengthDistribution = (experiment_id: number) => (
     handleAPICall(`Loading Length Distribution`,
         `/api/experiment/${experiment_id}/getLengthDistribution`))
 
-export const getMetageneCounts = (experiment_id: number, site: 'start' | 'stop') => (
+// with offsets (one per read length of range), the counts are shifted and summed over the range
+export const getMetageneCounts = (experiment_id: number, site: 'start' | 'stop', offsets?: number[], range?: [number, number]) => (
     handleAPICall(`Loading ${site[0].toUpperCase() + site.slice(1)} Site Metagene Counts`,
-        `/api/experiment/${experiment_id}/getMetageneCounts?site=${site}`))
+        `/api/experiment/${experiment_id}/getMetageneCounts?site=${site}` +
+        (offsets && range ? `&offsets=${offsets.join(",")}&range_lower=${range[0]}&range_upper=${range[1]}` : ""), { binary: true }))
 
 export const getGeneList = (experiment_id: number) => (
     handleAPICall(`Loading Gene List`,
         `/api/experiment/${experiment_id}/listGenes`))
 
-export const getCoverageData = (experiment_id: number, gene: string) => (
+// a page of the genes of an experiment matching the query, with their CDS counts
+export const searchGenes = (experiment_id: number, q: string, limit = 200, offset = 0, sort: 'count' | 'name' = 'count') => (
+    handleAPICall(`Searching genes`,
+        `/api/experiment/${experiment_id}/searchGenes?q=${encodeURIComponent(q)}&limit=${limit}&offset=${offset}&sort=${sort}`,
+        { binary: true, quiet: true }))
+
+export interface CoverageWindow {
+    start?: number
+    end?: number
+    resolution?: number
+    bins?: number // split [start, end) into at most this many bins, instead of a resolution
+    range_lower?: number
+    range_upper?: number
+    sum_lengths?: boolean
+    aggregate?: 'sum' | 'max'
+    sequence?: boolean // false to leave out the gene sequence
+}
+
+// coverage of a part of a gene, binned to one value per `resolution` positions
+export const getCoverageWindow = (experiment_id: number, gene: string, window: CoverageWindow) => (
+    handleAPICall(`Loading ${gene} for experiment ${experiment_id}`,
+        `/api/experiment/${experiment_id}/getCoverage?gene=${gene}&` +
+        Object.entries(window).map(([k, v]) => `${k}=${typeof v === 'boolean' ? Number(v) : v}`).join("&"), { binary: true })
+)
+
+// coverage of a gene with a P-site offset applied to each read length, summed over the read lengths
+export const getOffsetCoverage = (experiment_id: number, gene: string, offsets: number[], window: CoverageWindow = {}) => (
     handleAPICall(`Loading ${gene} for experiment ${experiment_id}`,
-        `/api/experiment/${experiment_id}/getCoverage?gene=${gene}`)
+        `/api/experiment/${experiment_id}/getOffsetCoverage?gene=${gene}&offsets=${offsets.join(",")}` +
+        Object.entries(window).map(([k, v]) => `&${k}=${typeof v === 'boolean' ? Number(v) : v}`).join(""), { binary: true })
+)
+
+export const getAutoOffsets = (experiment_id: number) => (
+    handleAPICall(`Loading Auto Offsets`,
+        `/api/experiment/${experiment_id}/getAutoOffsets`))
+
+// the read lengths of the window are cut to those of each experiment
+export const getExperimentsCoverageData = (project_id: number, experiment_ids: number[], gene: string, window: CoverageWindow = {}) => (
+    handleAPICall(`Loading ${gene} for ${experiment_ids.length} experiments`,
+        `/api/project/${project_id}/getExperimentsCoverage?gene=${gene}&` +
+        experiment_ids.map(id => `experiment=${id}`).join("&") +
+        Object.entries(window).map(([k, v]) => `&${k}=${typeof v === 'boolean' ? Number(v) : v}`).join(""), { binary: true })
 )
 
 export const getExperimentList = (experiment_id: number) => (
@@ -82,9 +198,9 @@ export const getExperimentList = (experiment_id: number) => (
         `/api/experiment/${experiment_id}/listExperiments`)
 )
 
-export const getGeneCorrelations = (project_id: number, referenceHash: string, range_lower: number, range_upper: number) => (
+export const getGeneCorrelations = (project_id: number, referenceHash: string, range_lower: number, range_upper: number, method = "spearman") => (
     handleAPICall(`Loading gene correlations`,
-        `/api/project/${project_id}/getGeneCorrelations?referenceHash=${referenceHash}&range_lower=${range_lower}&range_upper=${range_upper}`)
+        `/api/project/${project_id}/getGeneCorrelations?referenceHash=${referenceHash}&range_lower=${range_lower}&range_upper=${range_upper}&method=${method}`)
 )
 /////////////////////////
 /// CHART UTILITIES
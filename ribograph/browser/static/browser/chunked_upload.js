@@ -0,0 +1,86 @@
+// Uploads the file of a form in chunks through the resumable upload API
+// instead of a single multipart request.
+// Used by forms with a data-chunked-upload attribute, set to "ribo" or "reference".
+// Files smaller than one chunk are submitted with the form as usual.
+
+(function () {
+    const MAX_RETRIES = 5
+
+    function csrfToken(form) {
+        return form.querySelector("input[name=csrfmiddlewaretoken]").value
+    }
+
+    async function call(form, url, options) {
+        options.headers = Object.assign({ "X-CSRFToken": csrfToken(form) }, options.headers)
+        options.credentials = "same-origin"
+        const response = await fetch(url, options)
+        if (!response.ok && response.status !== 409) {
+            throw new Error(await response.text())
+        }
+        return response.json()
+    }
+
+    async function upload(form, file, progress) {
+        const body = new FormData()
+        body.append("kind", form.dataset.chunkedUpload)
+        body.append("size", file.size)
+        body.append("file_name", file.name)
+        if (form.dataset.projectId) {
+            body.append("project_id", form.dataset.projectId)
+        }
+
+        let status = await call(form, "/upload/init", { method: "POST", body: body })
+        const url = `/upload/${status.uploadId}`
+
+        let retries = 0
+        while (status.offset < status.size) {
+            const chunk = file.slice(status.offset, status.offset + status.chunkSize)
+            try {
+                status = await call(form, `${url}?offset=${status.offset}`, { method: "PUT", body: chunk })
+                retries = 0
+            } catch (error) {
+                // resume from whatever the server has received
+                if (++retries > MAX_RETRIES) {
+                    // give up and let the server drop the part file
+                    await fetch(url, {
+                        method: "DELETE",
+                        headers: { "X-CSRFToken": csrfToken(form) },
+                        credentials: "same-origin",
+                    }).catch(() => {})
+                    throw error
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries))
+                status = await call(form, url, { method: "GET" })
+            }
+            progress.value = status.offset / status.size
+        }
+
+        return call(form, `${url}/finalize`, { method: "POST" })
+    }
+
+    document.querySelectorAll("form[data-chunked-upload]").forEach(form => {
+        form.addEventListener("submit", event => {
+            const input = form.querySelector("input[type=file]")
+            const file = input.files[0]
+            const chunkSize = parseInt(form.dataset.chunkSize)
+            if (!file || file.size <= chunkSize) {
+                return
+            }
+
+            event.preventDefault()
+            const progress = document.createElement("progress")
+            progress.className = "w-100"
+            progress.value = 0
+            form.appendChild(progress)
+            form.querySelectorAll("button").forEach(button => button.disabled = true)
+
+            upload(form, file, progress).then(result => {
+                window.location.href = result.redirect
+            }).catch(error => {
+                progress.remove()
+                form.querySelectorAll("button").forEach(button => button.disabled = false)
+                alert("Upload failed: " + error.message)
+            })
+        })
+    })
+})()
@@ -0,0 +1,214 @@
+import os
+import re
+import threading
+from hashlib import md5
+from functools import lru_cache
+
+import numpy as np
+
+from ribopy import Ribo
+
+from .wire import split
+
+# Bump this when the layout of the summary file changes.
+# Summaries of older versions are ignored and the APIs fall back to ribopy.
+SUMMARY_VERSION = 1
+
+REGIONS = ("UTR5", "CDS", "UTR3")
+
+
+def summary_path(ribo_file_path: str) -> str:
+    """
+    The summary of a ribo file is kept next to it.
+    """
+    return os.path.splitext(ribo_file_path)[0] + ".summary.npz"
+
+
+@lru_cache(maxsize=1024)
+def file_digest(ribo_file_path: str) -> str:
+    """
+    md5 digest of a ribo file. Uploaded files are named after their digest,
+    so the file is only read if its name is not a digest.
+    """
+    name = os.path.splitext(os.path.basename(ribo_file_path))[0]
+    if re.fullmatch(r"[0-9a-f]{32}", name):
+        return name
+
+    file_hash = md5()
+    with open(ribo_file_path, "rb") as input_stream:
+        for chunk in iter(lambda: input_stream.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+##########################################################################
+
+
+def compute_summary(ribo: Ribo) -> dict:
+    """
+    Compute, for all experiments in the ribo file at once, the arrays that the
+    experiment overview and the gene list are built from:
+
+    region_counts:  experiments x read lengths x (UTR5, CDS, UTR3)
+    metagene_start: experiments x read lengths x positions around the start site
+    metagene_stop:  experiments x read lengths x positions around the stop site
+    cds_counts:     experiments x transcripts (in the order of the ribo file)
+    """
+    experiments = list(ribo.experiments)
+    length_min, length_max = int(ribo.minimum_length), int(ribo.maximum_length)
+
+    region_counts = np.stack(
+        [
+            ribo.get_region_counts(
+                region_name=region,
+                range_lower=length_min,
+                range_upper=length_max,
+                sum_lengths=False,
+                experiments=experiments,
+            )[experiments].to_numpy()
+            for region in REGIONS
+        ],
+        axis=-1,
+    )
+    # read lengths x experiments x regions -> experiments x read lengths x regions
+    region_counts = region_counts.transpose(1, 0, 2)
+
+    metagene = {}
+    for site in ("start", "stop"):
+        df = ribo.get_metagene(
+            site_type=site,
+            experiments=experiments,
+            range_lower=length_min,
+            range_upper=length_max,
+            sum_lengths=False,
+        )
+        metagene[site] = np.stack([df.loc[e].to_numpy() for e in experiments])
+
+    cds_counts = ribo.get_region_counts(
+        "CDS", sum_references=False, experiments=experiments
+    )
+    cds_counts = cds_counts.reindex(ribo.transcript_names)[experiments].to_numpy().T
+
+    return {
+        "experiments": np.array(experiments, dtype=str),
+        "length_min": length_min,
+        "length_max": length_max,
+        "metagene_radius": int(ribo.metagene_radius),
+        "region_counts": region_counts.astype(np.uint64),
+        "metagene_start": metagene["start"].astype(np.uint64),
+        "metagene_stop": metagene["stop"].astype(np.uint64),
+        "cds_counts": cds_counts.astype(np.uint64),
+    }
+
+
+def build_summary(ribo: Ribo, ribo_file_path: str) -> str:
+    """
+    Compute the summary of a ribo file and store it next to the file.
+    Returns the path of the summary.
+    """
+    arrays = compute_summary(ribo)
+    target_path = summary_path(ribo_file_path)
+    tmp_path = target_path + ".tmp.npz"
+    np.savez_compressed(
+        tmp_path, version=SUMMARY_VERSION, digest=file_digest(ribo_file_path), **arrays
+    )
+    os.replace(tmp_path, target_path)
+    return target_path
+
+
+def remove_summary(ribo_file_path: str):
+    try:
+        os.remove(summary_path(ribo_file_path))
+    except FileNotFoundError:
+        pass
+
+
+##########################################################################
+
+
+class RiboSummary:
+    """
+    Read access to the summary of a ribo file.
+    """
+
+    def __init__(self, arrays):
+        self.experiments = list(arrays["experiments"])
+        self.length_min = int(arrays["length_min"])
+        self.length_max = int(arrays["length_max"])
+        self.metagene_radius = int(arrays["metagene_radius"])
+        self.region_counts = arrays["region_counts"]
+        self.metagene = {
+            "start": arrays["metagene_start"],
+            "stop": arrays["metagene_stop"],
+        }
+        self.cds_counts = arrays["cds_counts"]
+
+    @property
+    def read_lengths(self):
+        return list(range(self.length_min, self.length_max + 1))
+
+    def index(self, experiment_name: str) -> int:
+        return self.experiments.index(experiment_name)
+
+    def region_percentages(self, experiment_name: str) -> dict:
+        """
+        Same layout as the split dict of the ribopy region counts in get_region_percentages.
+        """
+        return split(
+            self.region_counts[self.index(experiment_name)],
+            self.read_lengths,
+            REGIONS,
+        )
+
+    def length_distribution(self, experiment_name: str) -> list:
+        return self.region_counts[self.index(experiment_name), :, 1].tolist()
+
+    def metagene_counts(self, experiment_name: str, site_type: str) -> dict:
+        return split(
+            self.metagene[site_type][self.index(experiment_name)],
+            self.read_lengths,
+            range(-self.metagene_radius, self.metagene_radius + 1),
+        )
+
+    def gene_counts(self, experiment_name: str, transcript_names) -> dict:
+        """
+        CDS counts of every transcript, sorted by decreasing count.
+        """
+        counts = self.cds_counts[self.index(experiment_name)]
+        order = np.argsort(-counts.astype(np.int64), kind="stable")
+        return {transcript_names[i]: int(counts[i]) for i in order}
+
+
+_summary_lock = threading.Lock()
+_summaries = {}
+
+
+def load_summary(ribo_file_path: str):
+    """
+    Load the summary of a ribo file, or return None if there is no usable summary.
+    Loaded summaries are kept in memory as long as the summary file does not change.
+    """
+    path = summary_path(ribo_file_path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _summary_lock:
+        cached = _summaries.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    try:
+        with np.load(path) as arrays:
+            if int(arrays["version"]) != SUMMARY_VERSION or str(
+                arrays["digest"]
+            ) != file_digest(ribo_file_path):
+                return None
+            summary = RiboSummary({k: arrays[k] for k in arrays.files})
+    except (OSError, ValueError, KeyError):
+        return None
+
+    with _summary_lock:
+        _summaries[path] = (mtime, summary)
+    return summary
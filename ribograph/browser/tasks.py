@@ -0,0 +1,96 @@
+"""
+Handlers of the background jobs, see jobs.py.
+"""
+import os
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpRequest, QueryDict
+
+from .jobs import register_job
+from .models import Project, Reference
+from .ingestion import RiboIngestion, IngestionError
+from .handles import open_ribo, close_ribo
+from .summary import build_summary as build_ribo_summary
+from .Fasta import build_fasta_index
+from .manifest import digest_reference_file
+from .api import register_project_api
+
+# Read length range the gene correlation page starts with (sliderLogic in utils.ts)
+DEFAULT_CORRELATION_RANGE = (15, 40)
+
+
+@register_job("ingest_ribo")
+def ingest_ribo(job, ribo_file_path):
+    """
+    Inspect an uploaded ribo file, see RiboIngestion.
+    Files that can not be ingested are removed.
+    """
+    try:
+        ingestion = RiboIngestion.run(ribo_file_path, progress=job.set_progress)
+    except IngestionError:
+        os.remove(ribo_file_path)
+        raise
+    return {"experiments": ingestion.experiments}
+
+
+@register_job("build_summary")
+def build_summary(job, ribo_file_path):
+    ribo = open_ribo(ribo_file_path)
+    try:
+        build_ribo_summary(ribo, ribo_file_path)
+    finally:
+        close_ribo(ribo)
+
+
+@register_job("index_reference")
+def index_reference(job, reference_id):
+    """
+    Index the sequences of a reference and record the digest of its transcripts.
+    """
+    reference = Reference.objects.get(id=reference_id)
+    build_fasta_index(reference.reference_file_path)
+    Reference.objects.filter(id=reference_id).update(
+        transcript_digest=digest_reference_file(reference.reference_file_path)
+    )
+
+
+def api_request(path: str, params: dict, user) -> HttpRequest:
+    """
+    A GET request of an API as the browser sends it, so that the response
+    is cached under the same key.
+    """
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = path
+    request.GET = QueryDict(mutable=True)
+    request.GET.update(params)
+    request.META["QUERY_STRING"] = request.GET.urlencode()
+    request.user = user
+    return request
+
+
+@register_job("warm_gene_correlations")
+def warm_gene_correlations(job, project_id, reference_hash):
+    """
+    Put the first gene correlation response of a project into the API response
+    cache, for anonymous and logged in users.
+    This only helps web workers if the cache is shared (sqlite or redis backend).
+    """
+    project = Project.objects.get(id=project_id)
+    range_lower, range_upper = DEFAULT_CORRELATION_RANGE
+    view = register_project_api.all["getGeneCorrelations"]
+
+    # the parameters in the order of getGeneCorrelations in utils.ts
+    params = {
+        "referenceHash": reference_hash,
+        "range_lower": range_lower,
+        "range_upper": range_upper,
+        "method": "spearman",
+    }
+    for user in (AnonymousUser(), project.owner):
+        if not (user.is_authenticated or project.public):
+            continue
+        request = api_request(
+            "/api/project/{}/getGeneCorrelations".format(project_id), params, user
+        )
+        view(request, project_id=project_id)
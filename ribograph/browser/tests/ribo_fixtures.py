@@ -0,0 +1,118 @@
+"""
+Helpers to create small ribo files and references for the tests.
+"""
+import io
+import gzip
+import random
+
+import h5py
+from ribopy.create import create_ribo
+
+#####################################################################
+
+LENGTH_MIN = 25
+LENGTH_MAX = 32
+
+
+def transcript_names(n, appris=False):
+    if appris:
+        return [
+            "ENST{0:011d}|ENSG{0:011d}|-|-|GENE{0}-201|GENE{0}|{1}|UTR5:1-50|CDS:51-{1}|UTR3:{1}-{1}|".format(
+                i, 300 + 10 * i
+            )
+            for i in range(n)
+        ]
+    return ["t{}".format(i) for i in range(n)]
+
+
+def make_ribo_file(
+    path,
+    experiments=("exp1",),
+    number_of_transcripts=5,
+    reads_per_experiment=2000,
+    appris=False,
+    seed=0,
+    metagene_radius=5,
+    length_min=LENGTH_MIN,
+    length_max=LENGTH_MAX,
+    lengths=None,
+):
+    """
+    Write a ribo file with the given experiments, each holding random reads
+    of length_min to length_max nucleotides on number_of_transcripts transcripts
+    (or one transcript per given length). Coverage is stored for all of them.
+    Returns the transcript names and lengths.
+    """
+    if lengths is None:
+        lengths = [300 + 10 * i for i in range(number_of_transcripts)]
+    number_of_transcripts = len(lengths)
+    names = transcript_names(number_of_transcripts, appris=appris)
+
+    lengths_file = "".join("{}\t{}\n".format(n, l) for n, l in zip(names, lengths))
+    annotation = "".join(
+        "{0}\t0\t50\tUTR5\t0\t+\n"
+        "{0}\t50\t{1}\tCDS\t0\t+\n"
+        "{0}\t{1}\t{2}\tUTR3\t0\t+\n".format(n, l - 60, l)
+        for n, l in zip(names, lengths)
+    )
+
+    rng = random.Random(seed)
+
+    with h5py.File(path, "w") as ribo_handle:
+        for experiment in experiments:
+            reads = []
+            for _ in range(reads_per_experiment):
+                i = rng.randrange(number_of_transcripts)
+                read_length = rng.randint(length_min, length_max)
+                start = rng.randrange(0, lengths[i] - read_length)
+                reads.append((i, start, start + read_length))
+            reads.sort()
+            alignments = "".join(
+                "{}\t{}\t{}\tread\t0\t+\n".format(names[i], start, end)
+                for i, start, end in reads
+            )
+
+            if experiment == experiments[0]:
+                target = ribo_handle
+            else:
+                # ribopy writes one experiment per file, so the rest are created
+                # in memory and copied over.
+                target = h5py.File(io.BytesIO(), "w")
+
+            create_ribo(
+                target,
+                experiment,
+                io.StringIO(alignments),
+                "test_reference",
+                io.StringIO(lengths_file),
+                io.StringIO(annotation),
+                metagene_radius,
+                3,
+                3,
+                length_min,
+                length_max,
+                store_coverage=True,
+            )
+
+            if target is not ribo_handle:
+                target.copy(
+                    target["experiments"][experiment],
+                    ribo_handle["experiments"],
+                    name=experiment,
+                )
+                target.close()
+
+    return names, lengths
+
+
+def make_reference_file(path, names, lengths, seed=0, line_width=60):
+    """
+    Write a gzipped fasta file with random sequences of the given lengths.
+    """
+    rng = random.Random(seed)
+    with gzip.open(path, "wt") as output_stream:
+        for name, length in zip(names, lengths):
+            sequence = "".join(rng.choice("ACGT") for _ in range(length))
+            output_stream.write(">{}\n".format(name))
+            for i in range(0, length, line_width):
+                output_stream.write(sequence[i : i + line_width] + "\n")
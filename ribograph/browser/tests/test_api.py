@@ -0,0 +1,470 @@
+import gzip
+import json
+import os
+import tempfile
+
+from unittest import mock
+
+import numpy as np
+
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+
+from browser.models import Project, Experiment, Reference, Job
+from browser.api import api_response_cache, request_summary, ribo_handle_pool
+from browser.summary import build_summary, load_summary
+from browser.tasks import DEFAULT_CORRELATION_RANGE, warm_gene_correlations
+from browser.tests.ribo_fixtures import make_ribo_file, make_reference_file
+from browser.Fasta import FastaFile
+from browser.wire import BINARY_CONTENT_TYPE, WireJSONEncoder, decode_binary
+
+#####################################################################
+
+
+class ExperimentAPITestCase(TestCase):
+    """
+    Runs the experiment APIs against a small ribo file in a public project.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ribo_path = os.path.join(self.tmp_dir.name, "test.ribo")
+        self.names, self.lengths = make_ribo_file(
+            self.ribo_path, experiments=("exp1", "exp2")
+        )
+
+        user = User.objects.create(username="owner")
+        self.project = Project.objects.create(name="public", owner=user, public=True)
+        self.experiment = Experiment.objects.create(
+            name="exp1", project=self.project, ribo_file_path=self.ribo_path
+        )
+
+        api_response_cache.clear()
+        ribo_handle_pool.clear()
+        self.c = Client()
+
+    def tearDown(self):
+        ribo_handle_pool.clear()
+        self.tmp_dir.cleanup()
+
+    def api(self, endpoint):
+        return "/api/experiment/{}/{}".format(self.experiment.id, endpoint)
+
+    # with workers the summary is only queued, so the first responses come from ribopy
+    @mock.patch("browser.jobs.BACKGROUND_JOBS", True)
+    def test_summary_matches_ribopy(self):
+        endpoints = [
+            "getRegionPercentages",
+            "getLengthDistribution",
+            "getMetageneCounts?site=start",
+            "getMetageneCounts?site=stop",
+            "listGenes",
+        ]
+        from_ribopy = [self.c.get(self.api(e)).json() for e in endpoints]
+
+        with ribo_handle_pool.lease(self.ribo_path) as ribo:
+            build_summary(ribo, self.ribo_path)
+        self.assertIsNotNone(load_summary(self.ribo_path))
+        api_response_cache.clear()
+        from_summary = [self.c.get(self.api(e)).json() for e in endpoints]
+
+        for endpoint, expected, actual in zip(endpoints, from_ribopy, from_summary):
+            self.assertEqual(expected, actual, msg=endpoint)
+
+    @mock.patch("browser.jobs.BACKGROUND_JOBS", True)
+    def test_missing_summary_is_requested_once(self):
+        request_summary.cache_clear()
+        for endpoint in ("getRegionPercentages", "getLengthDistribution"):
+            api_response_cache.clear()
+            self.assertEqual(self.c.get(self.api(endpoint)).status_code, 200)
+        self.assertEqual(Job.objects.filter(kind="build_summary").count(), 1)
+
+        # a build that failed is not queued again by every request
+        Job.objects.update(status=Job.FAILED)
+        api_response_cache.clear()
+        self.c.get(self.api("getRegionPercentages"))
+        self.assertEqual(Job.objects.filter(kind="build_summary").count(), 1)
+
+    def test_missing_summary_is_built_without_workers(self):
+        request_summary.cache_clear()
+        self.assertIsNone(load_summary(self.ribo_path))
+        self.assertEqual(self.c.get(self.api("getLengthDistribution")).status_code, 200)
+
+        self.assertIsNotNone(load_summary(self.ribo_path))
+        job = Job.objects.get(kind="build_summary")
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_gzip_is_part_of_the_cache_key(self):
+        gzipped = self.c.get(
+            self.api("getCoverage"), {"gene": "t0"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        plain = self.c.get(self.api("getCoverage"), {"gene": "t0"})
+
+        self.assertEqual(gzipped["Content-Encoding"], "gzip")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(plain.json(), json.loads(gzip.decompress(gzipped.content)))
+
+    def test_gene_sequence(self):
+        reference_path = os.path.join(self.tmp_dir.name, "reference.gz")
+        make_reference_file(reference_path, self.names, self.lengths)
+        sequences = {e.header: e.sequence for e in FastaFile(reference_path)}
+
+        self.experiment.reference = Reference.objects.create(
+            name="reference",
+            reference_file_path=reference_path,
+            owner=self.project.owner,
+        )
+        self.experiment.save()
+
+        for gene in ("t0", "t4"):
+            response = self.c.get(self.api("getCoverage"), {"gene": gene}).json()
+            self.assertEqual(response["geneSequence"], sequences[gene])
+
+        # left out when only the window of the coverage changes
+        response = self.c.get(self.api("getCoverage"), {"gene": "t0", "sequence": 0})
+        self.assertIsNone(response.json()["geneSequence"])
+
+    def test_coverage_batch_matches_single_coverage(self):
+        genes = ["t3", "t0", "t4"]
+        batch = self.c.get(
+            self.api("getCoverageBatch"), {"gene": genes + ["missing_gene"]}
+        ).json()
+
+        self.assertEqual(batch["missing"], ["missing_gene"])
+        self.assertEqual(set(batch["genes"]), set(genes))
+
+        for gene in genes:
+            single = self.c.get(self.api("getCoverage"), {"gene": gene}).json()
+            self.assertEqual(batch["genes"][gene]["coverage"], single["coverage"])
+            self.assertEqual(
+                batch["genes"][gene]["cdsRange"], single["cdsRange"], msg=gene
+            )
+
+    def test_coverage_batch_post_body(self):
+        response = self.c.post(
+            self.api("getCoverageBatch"),
+            json.dumps({"genes": ["t1", "t2"]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["genes"]), {"t1", "t2"})
+
+        # a different body must not be served from the cache
+        response = self.c.post(
+            self.api("getCoverageBatch"),
+            json.dumps({"genes": ["t1"]}),
+            content_type="application/json",
+        )
+        self.assertEqual(set(response.json()["genes"]), {"t1"})
+
+    def test_coverage_batch_requires_genes(self):
+        response = self.c.get(self.api("getCoverageBatch"))
+        self.assertEqual(response.status_code, 400)
+
+    def test_binary_format_matches_json(self):
+        endpoints = [
+            "getRegionPercentages",
+            "getMetageneCounts?site=start",
+            "getCoverage?gene=t3",
+            "getCoverageBatch?gene=t1&gene=t4",
+            "getMetadata",
+        ]
+        with ribo_handle_pool.lease(self.ribo_path) as ribo:
+            build_summary(ribo, self.ribo_path)
+
+        for endpoint in endpoints:
+            expected = self.c.get(self.api(endpoint)).json()
+            # the format is negotiated with the Accept header, and the two
+            # encodings are cached separately
+            response = self.c.get(self.api(endpoint), HTTP_ACCEPT=BINARY_CONTENT_TYPE)
+            self.assertEqual(response["Content-Type"], BINARY_CONTENT_TYPE)
+            self.assertIn("Accept", response["Vary"])
+            decoded = decode_binary(response.content)
+            actual = json.loads(json.dumps(decoded, cls=WireJSONEncoder))
+            self.assertEqual(expected, actual, msg=endpoint)
+
+        response = self.c.get(self.api("getCoverage?gene=t3&format=binary"))
+        coverage = decode_binary(response.content)["coverage"]["data"]
+        self.assertEqual(coverage.dtype.name, "uint16")
+        self.assertEqual(coverage.shape, (len(coverage), self.lengths[3]))
+
+    def test_coverage_window(self):
+        response = self.c.get(self.api("getCoverage"), {"gene": "t3"}).json()
+        full = np.array(response["coverage"]["data"])
+        with ribo_handle_pool.lease(self.ribo_path) as ribo:
+            length_min = int(ribo.minimum_length)
+
+        params = {"gene": "t3", "start": 10, "end": 95, "range_lower": length_min + 1}
+        window = self.c.get(self.api("getCoverage"), params).json()["coverage"]
+        self.assertEqual(window["columns"], list(range(10, 95)))
+        self.assertEqual(window["index"][0], length_min + 1)
+        np.testing.assert_array_equal(window["data"], full[1:, 10:95])
+
+        for aggregate, reduce in (("sum", np.sum), ("max", np.max)):
+            binned = self.c.get(
+                self.api("getCoverage"),
+                dict(params, resolution=20, aggregate=aggregate),
+            ).json()["coverage"]
+            self.assertEqual(binned["columns"], list(range(10, 95, 20)))
+            expected = [
+                reduce(full[1:, i : min(i + 20, 95)], axis=1) for i in range(10, 95, 20)
+            ]
+            np.testing.assert_array_equal(binned["data"], np.array(expected).T)
+
+        summed = self.c.get(
+            self.api("getCoverage"), dict(params, resolution=20, sum_lengths=1)
+        ).json()["coverage"]
+        self.assertEqual(len(summed["data"]), 1)
+        np.testing.assert_array_equal(
+            summed["data"][0],
+            [full[1:, i : min(i + 20, 95)].sum() for i in range(10, 95, 20)],
+        )
+
+        # 85 positions in at most 5 bins
+        response = self.c.get(self.api("getCoverage"), dict(params, bins=5)).json()
+        self.assertEqual(response["window"]["resolution"], 17)
+        self.assertEqual(response["coverage"]["columns"], list(range(10, 95, 17)))
+
+    def test_invalid_coverage_window(self):
+        for params in (
+            {"start": 50, "end": 10},
+            {"end": 10**6},
+            {"resolution": 0},
+            {"range_lower": 1},
+            {"aggregate": "mean"},
+            {"start": "x"},
+            {"bins": 0},
+        ):
+            response = self.c.get(self.api("getCoverage"), dict(params, gene="t3"))
+            self.assertEqual(response.status_code, 400, msg=params)
+
+    def test_offset_coverage(self):
+        response = self.c.get(self.api("getCoverage"), {"gene": "t3"}).json()
+        full = np.array(response["coverage"]["data"])
+        offsets = [(i % 7) * 3 - 9 for i in range(len(full))]
+
+        # shift like shiftArray in utils.ts does
+        shifted = np.zeros(full.shape[1], dtype=np.int64)
+        for row, offset in zip(full, offsets):
+            for position, value in enumerate(row):
+                if 0 <= position + offset < len(shifted):
+                    shifted[position + offset] += value
+
+        params = {"gene": "t3", "offsets": ",".join(str(x) for x in offsets)}
+        response = self.c.get(self.api("getOffsetCoverage"), params).json()
+        np.testing.assert_array_equal(response["coverage"]["data"][0], shifted)
+
+        window = self.c.get(
+            self.api("getOffsetCoverage"),
+            dict(params, start=5, end=60, resolution=10),
+        ).json()["coverage"]
+        np.testing.assert_array_equal(
+            window["data"][0],
+            [shifted[i : min(i + 10, 60)].sum() for i in range(5, 60, 10)],
+        )
+
+        params["offsets"] = "1,2"
+        response = self.c.get(self.api("getOffsetCoverage"), params)
+        self.assertEqual(response.status_code, 400)
+
+    def test_offset_metagene_counts(self):
+        metagene = self.c.get(self.api("getMetageneCounts"), {"site": "start"}).json()
+        lengths = metagene["index"][1:-1]
+        offsets = [(i % 5) * 2 - 4 for i in range(len(lengths))]
+
+        shifted = np.zeros(len(metagene["columns"]), dtype=np.int64)
+        for row, offset in zip(metagene["data"][1:-1], offsets):
+            for position, value in enumerate(row):
+                if 0 <= position + offset < len(shifted):
+                    shifted[position + offset] += value
+
+        params = {
+            "site": "start",
+            "offsets": ",".join(str(x) for x in offsets),
+            "range_lower": lengths[0],
+            "range_upper": lengths[-1],
+        }
+        response = self.c.get(self.api("getMetageneCounts"), params).json()
+        self.assertEqual(response["index"], ["{}-{}".format(lengths[0], lengths[-1])])
+        self.assertEqual(response["columns"], metagene["columns"])
+        np.testing.assert_array_equal(response["data"][0], shifted)
+
+        # the same from the summary
+        with ribo_handle_pool.lease(self.ribo_path) as ribo:
+            build_summary(ribo, self.ribo_path)
+        api_response_cache.clear()
+        summary = self.c.get(self.api("getMetageneCounts"), params).json()
+        self.assertEqual(summary, response)
+
+        for invalid in ({"offsets": "1,2"}, {"range_upper": 1000}):
+            response = self.c.get(
+                self.api("getMetageneCounts"), dict(params, **invalid)
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_auto_offsets(self):
+        # the start site peaks are looked for up to 18 positions upstream
+        ribo_path = os.path.join(self.tmp_dir.name, "wide.ribo")
+        make_ribo_file(ribo_path, metagene_radius=20, reads_per_experiment=20000)
+        self.experiment.ribo_file_path = ribo_path
+        self.experiment.save()
+
+        metagene = self.c.get(self.api("getMetageneCounts"), {"site": "start"}).json()
+        response = self.c.get(self.api("getAutoOffsets")).json()
+        self.assertEqual(response["index"], metagene["index"])
+
+        # the peak search of the offset page
+        lower, upper = response["searchBounds"]
+        first = metagene["columns"][0]
+        expected = []
+        for row in metagene["data"]:
+            candidates = row[lower - first : upper - first]
+            expected.append(-lower - candidates.index(max(candidates)))
+        self.assertEqual(response["offsets"], expected)
+
+    def test_search_genes(self):
+        genes = self.c.get(self.api("listGenes")).json()["genes"]
+
+        response = self.c.get(self.api("searchGenes"), {"limit": 2}).json()
+        self.assertEqual(response["total"], len(genes))
+        self.assertEqual(response["genes"], list(genes)[:2])
+        self.assertEqual(response["counts"], list(genes.values())[:2])
+
+        response = self.c.get(
+            self.api("searchGenes"), {"q": "T3", "sort": "name"}
+        ).json()
+        self.assertEqual(response["genes"], ["t3"])
+
+        for params in ({"sort": "random"}, {"limit": 0}, {"offset": "x"}):
+            response = self.c.get(self.api("searchGenes"), params)
+            self.assertEqual(response.status_code, 400, msg=params)
+
+    def test_unknown_format(self):
+        response = self.c.get(self.api("getMetadata?format=xml"))
+        self.assertEqual(response.status_code, 406)
+
+
+class ProjectAPITestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        first_path = os.path.join(self.tmp_dir.name, "first.ribo")
+        second_path = os.path.join(self.tmp_dir.name, "second.ribo")
+        make_ribo_file(first_path, experiments=("exp1", "exp2"))
+        make_ribo_file(second_path, experiments=("exp3",), seed=1)
+
+        user = User.objects.create(username="owner")
+        self.project = Project.objects.create(name="public", owner=user, public=True)
+        private_project = Project.objects.create(name="private", owner=user)
+
+        self.experiments = [
+            Experiment.objects.create(
+                name=name, project=project, ribo_file_path=path, reference_digest="d"
+            )
+            for name, project, path in (
+                ("exp1", self.project, first_path),
+                ("exp2", self.project, first_path),
+                ("exp3", self.project, second_path),
+                ("exp1", private_project, first_path),
+            )
+        ]
+
+        api_response_cache.clear()
+        ribo_handle_pool.clear()
+        self.c = Client()
+
+    def tearDown(self):
+        ribo_handle_pool.clear()
+        self.tmp_dir.cleanup()
+
+    def test_experiments_coverage(self):
+        ids = [e.id for e in self.experiments[:3]]
+        response = self.c.get(
+            "/api/project/{}/getExperimentsCoverage".format(self.project.id),
+            {"gene": "t2", "experiment": ids},
+        ).json()
+
+        self.assertEqual([x["id"] for x in response["experiments"]], ids)
+        self.assertEqual(response["missing"], [])
+        self.assertEqual(response["failed"], [])
+        self.assertEqual(response["cdsRange"], [50, 259])
+
+        for e, data in zip(self.experiments, response["experiments"]):
+            single = self.c.get(
+                "/api/experiment/{}/getCoverage".format(e.id), {"gene": "t2"}
+            ).json()
+            self.assertEqual(data["coverage"], single["coverage"])
+            self.assertEqual(data["totalReads"], single["totalReads"])
+
+    def test_experiments_coverage_outside_project(self):
+        # the experiment in the private project can not be read through this one
+        response = self.c.get(
+            "/api/project/{}/getExperimentsCoverage".format(self.project.id),
+            {"gene": "t2", "experiment": [e.id for e in self.experiments]},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_experiments_coverage_unreadable_file(self):
+        ids = [e.id for e in self.experiments[:3]]
+        os.remove(self.experiments[2].ribo_file_path)
+
+        response = self.c.get(
+            "/api/project/{}/getExperimentsCoverage".format(self.project.id),
+            {"gene": "t2", "experiment": ids},
+        ).json()
+
+        self.assertEqual([x["id"] for x in response["experiments"]], ids[:2])
+        self.assertEqual([x["id"] for x in response["failed"]], ids[2:])
+        self.assertEqual(response["missing"], [])
+
+    def test_experiments_coverage_window(self):
+        ids = [e.id for e in self.experiments[:3]]
+        url = "/api/project/{}/getExperimentsCoverage".format(self.project.id)
+        params = {"gene": "t2", "experiment": ids, "start": 10, "end": 100}
+        full = self.c.get(url, {"gene": "t2", "experiment": ids}).json()
+
+        # read lengths beyond those of the files are left out
+        response = self.c.get(
+            url, dict(params, range_lower=0, range_upper=1000, sum_lengths=1, bins=9)
+        ).json()
+        for data, whole in zip(response["experiments"], full["experiments"]):
+            self.assertEqual(data["window"]["resolution"], 10)
+            self.assertEqual(data["coverage"]["columns"], list(range(10, 100, 10)))
+            expected = np.array(whole["coverage"]["data"])[:, 10:100]
+            np.testing.assert_array_equal(
+                data["coverage"]["data"][0],
+                expected.reshape(-1, 9, 10).sum(axis=(0, 2)),
+            )
+
+        response = self.c.get(url, dict(params, end=10**6))
+        self.assertEqual(response.status_code, 400)
+
+    def test_gene_correlations(self):
+        url = "/api/project/{}/getGeneCorrelations".format(self.project.id)
+        params = {"referenceHash": "d", "range_lower": 0, "range_upper": 0}
+
+        for method in ("spearman", "pearson", "log_pearson"):
+            response = self.c.get(url, dict(params, method=method)).json()
+            self.assertEqual(set(response["geneCounts"]), {"exp1", "exp2", "exp3"})
+            self.assertEqual(response["method"], method)
+            for i, row in enumerate(response["correlations"]):
+                self.assertAlmostEqual(row[i], 1)
+
+        response = self.c.get(url, dict(params, method="kendall"))
+        self.assertEqual(response.status_code, 400)
+
+    def test_warm_gene_correlations(self):
+        warm_gene_correlations(None, project_id=self.project.id, reference_hash="d")
+        hits = api_response_cache.stats()["hits"]
+
+        response = self.c.get(
+            "/api/project/{}/getGeneCorrelations".format(self.project.id),
+            {
+                "referenceHash": "d",
+                "range_lower": DEFAULT_CORRELATION_RANGE[0],
+                "range_upper": DEFAULT_CORRELATION_RANGE[1],
+                "method": "spearman",
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(api_response_cache.stats()["hits"], hits + 1)
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, SimpleTestCase, RequestFactory, AsyncRequestFactory
+from django.contrib.auth.models import User, AnonymousUser
+from django.http import HttpResponse
+
+from browser import async_api
+from browser.async_api import BoundedExecutor, async_api_view
+from browser.cache import make_cache
+from browser.models import Project, Experiment
+from browser.api import (
+    api_response_cache,
+    ribo_handle_pool,
+    register_experiment_api,
+    register_project_api,
+)
+from browser.summary import build_summary
+from browser.tests.ribo_fixtures import make_ribo_file
+
+#####################################################################
+
+
+class BoundedExecutorTestCase(SimpleTestCase):
+    def test_per_key_limit(self):
+        executor = BoundedExecutor(max_workers=8, per_key=2)
+        running, peak = {"a": 0, "b": 0}, {"a": 0, "b": 0}
+        lock = threading.Lock()
+
+        def read(key):
+            with lock:
+                running[key] += 1
+                peak[key] = max(peak[key], running[key])
+            time.sleep(0.02)
+            with lock:
+                running[key] -= 1
+            return key
+
+        async def main():
+            return await asyncio.gather(
+                *(
+                    executor.run(key, lambda key=key: read(key))
+                    for key in ["a"] * 6 + ["b"] * 6
+                )
+            )
+
+        self.assertEqual(asyncio.run(main()), ["a"] * 6 + ["b"] * 6)
+        self.assertEqual(peak, {"a": 2, "b": 2})
+
+    def test_deadline(self):
+        executor = BoundedExecutor(max_workers=2, per_key=1)
+        release = threading.Event()
+
+        async def main():
+            with self.assertRaises(asyncio.TimeoutError):
+                await executor.run("a", release.wait, timeout=0.05)
+            # the slot is still taken by the first call, so this one times out waiting
+            with self.assertRaises(asyncio.TimeoutError):
+                await executor.run("a", lambda: 1, timeout=0.05)
+            release.set()
+            await asyncio.sleep(0.05)
+            return await executor.run("a", lambda: 1, timeout=1)
+
+        self.assertEqual(asyncio.run(main()), 1)
+
+
+class AsyncCoalescingTestCase(SimpleTestCase):
+    def test_concurrent_misses_are_computed_once(self):
+        calls = []
+        release = threading.Event()
+
+        def respond(obj, wire_format, request):
+            calls.append(obj)
+            release.wait(5)
+            return HttpResponse(b"body")
+
+        view = async_api_view(
+            lambda request: "obj",
+            respond,
+            limit_key=lambda obj: obj,
+            cache=make_cache({"BACKEND": "local"}),
+            key=lambda request: request.get_full_path(),
+        )
+
+        async def main():
+            requests = [
+                asyncio.ensure_future(view(AsyncRequestFactory().get("/api")))
+                for _ in range(4)
+            ]
+            while not calls:
+                await asyncio.sleep(0.01)
+            # the other requests are waiting for the first one by now
+            await asyncio.sleep(0.1)
+            release.set()
+            return await asyncio.gather(*requests)
+
+        responses = asyncio.run(main())
+        self.assertEqual(calls, ["obj"])
+        self.assertEqual([r.content for r in responses], [b"body"] * 4)
+
+
+class AsyncAPITestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ribo_path = os.path.join(self.tmp_dir.name, "test.ribo")
+        make_ribo_file(self.ribo_path, experiments=("exp1", "exp2"))
+
+        user = User.objects.create(username="owner")
+        self.project = Project.objects.create(name="public", owner=user, public=True)
+        self.experiment = Experiment.objects.create(
+            name="exp1", project=self.project, ribo_file_path=self.ribo_path
+        )
+        # a read without a summary builds it, writing the job table from the
+        # executor thread, which the test transaction of sqlite does not allow
+        with ribo_handle_pool.lease(self.ribo_path) as ribo:
+            build_summary(ribo, self.ribo_path)
+        api_response_cache.clear()
+        ribo_handle_pool.clear()
+
+    def tearDown(self):
+        ribo_handle_pool.clear()
+        self.tmp_dir.cleanup()
+
+    def request(self, factory, path, params):
+        # the async factory of Django 3.2 ignores the data argument
+        request = factory.get("{}?{}".format(path, urlencode(params)))
+        request.user = AnonymousUser()
+        return request
+
+    async def test_async_views_match_sync_views(self):
+        self.assertEqual(
+            set(register_experiment_api.async_all), set(register_experiment_api.all)
+        )
+        self.assertEqual(
+            set(register_project_api.async_all), set(register_project_api.all)
+        )
+
+        for endpoint, params in (
+            ("getCoverage", {"gene": "t2"}),
+            ("getMetageneCounts", {"site": "stop"}),
+            ("searchGenes", {"q": "t"}),
+        ):
+            path = "/api/experiment/{}/{}".format(self.experiment.id, endpoint)
+            view = register_experiment_api.async_all[endpoint]
+            response = await view(
+                self.request(AsyncRequestFactory(), path, params),
+                experiment_id=self.experiment.id,
+            )
+            self.assertEqual(response.status_code, 200)
+
+            api_response_cache.clear()
+            expected = await sync_to_async(register_experiment_api.all[endpoint])(
+                self.request(RequestFactory(), path, params),
+                experiment_id=self.experiment.id,
+            )
+            self.assertEqual(response.content, expected.content, msg=endpoint)
+
+    async def test_deadline_response(self):
+        path = "/api/experiment/{}/getCoverage".format(self.experiment.id)
+        view = register_experiment_api.async_all["getCoverage"]
+        with mock.patch.object(async_api, "API_DEADLINE", 0):
+            response = await view(
+                self.request(AsyncRequestFactory(), path, {"gene": "t2"}),
+                experiment_id=self.experiment.id,
+            )
+        self.assertEqual(response.status_code, 504)
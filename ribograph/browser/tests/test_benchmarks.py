@@ -0,0 +1,45 @@
+import tempfile
+
+from django.test import TestCase, SimpleTestCase
+
+from browser.api import register_experiment_api, register_project_api
+from benchmarks.suite import compare, run_size
+
+#####################################################################
+
+
+class BenchmarkSuiteTestCase(TestCase):
+    def test_every_api_runs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            results = run_size("tiny", tmp_dir, repeat=1)
+
+        cases = {r["case"]: r for r in results}
+        for endpoint in list(register_experiment_api.all) + list(
+            register_project_api.all
+        ):
+            self.assertEqual(cases["api:" + endpoint]["status"], "ok", msg=endpoint)
+        for case in (
+            "FastaFile.records",
+            "digest_reference",
+            "choose_transcript_regex",
+            "gene_correlation_helper",
+        ):
+            self.assertIn(case, cases)
+
+
+class CompareTestCase(SimpleTestCase):
+    def results(self, **medians):
+        return {
+            "results": [
+                {"size": "tiny", "case": case, "median": median, "status": "ok"}
+                for case, median in medians.items()
+            ]
+        }
+
+    def test_compare(self):
+        baseline = self.results(a=1.0, b=1.0, c=0.001, d=1.0)
+        current = self.results(a=1.1, b=2.0, c=0.002, e=5.0)
+        regressions = compare(current, baseline, threshold=1.25, min_delta=0.002)
+        # c doubled, but by less than min_delta; d and e are not in both runs
+        self.assertEqual([r["case"] for r in regressions], ["b"])
+        self.assertEqual(regressions[0]["ratio"], 2.0)
@@ -0,0 +1,271 @@
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from cachetools import TTLCache
+
+from django.test import SimpleTestCase
+from django.http import HttpResponse, JsonResponse
+
+from browser.cache import (
+    LocalCacheBackend,
+    SQLiteCacheBackend,
+    RedisCacheBackend,
+    cached_response,
+    dump_response,
+    load_response,
+    memoize,
+)
+
+#####################################################################
+
+
+class FakeRedis:
+    """
+    A minimal in-memory stand-in for redis.Redis
+    """
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    def scan_iter(self, pattern):
+        prefix = pattern.rstrip("*")
+        return [k for k in self.store if k.startswith(prefix)]
+
+    def delete(self, *keys):
+        for k in keys:
+            self.store.pop(k, None)
+
+    def info(self, section):
+        return {"used_memory": sum(len(v) for v in self.store.values())}
+
+
+#####################################################################
+
+
+class ResponseSerializationTestCase(SimpleTestCase):
+    def test_round_trip(self):
+        response = JsonResponse({"gene": "ACTB"})
+        response["Cache-Control"] = "max-age=900"
+
+        restored = load_response(dump_response(response))
+
+        self.assertEqual(restored.status_code, 200)
+        self.assertEqual(restored.content, response.content)
+        self.assertEqual(restored["Content-Type"], "application/json")
+        self.assertEqual(restored["Cache-Control"], "max-age=900")
+
+    def test_binary_body(self):
+        body = bytes(range(256)) * 2
+        response = HttpResponse(body, status=206, content_type="application/x-test")
+        response["Content-Encoding"] = "gzip"
+
+        restored = load_response(dump_response(response))
+
+        self.assertEqual(restored.status_code, 206)
+        self.assertEqual(restored.content, body)
+        self.assertEqual(restored["Content-Encoding"], "gzip")
+
+
+class CacheBackendTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        location = os.path.join(self.tmp_dir.name, "cache.sqlite3")
+        self.backends = [
+            LocalCacheBackend(max_bytes=100, ttl=60),
+            SQLiteCacheBackend(location, max_bytes=100, ttl=60),
+            RedisCacheBackend(None, max_bytes=100, ttl=60, client=FakeRedis()),
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hits_and_misses(self):
+        for backend in self.backends:
+            self.assertIsNone(backend.get("a"))
+            backend.set("a", b"x" * 10)
+            self.assertEqual(backend.get("a"), b"x" * 10)
+
+            stats = backend.stats()
+            self.assertEqual(stats["hits"], 1, msg=stats["backend"])
+            self.assertEqual(stats["misses"], 1, msg=stats["backend"])
+
+    def test_byte_budget(self):
+        # the redis backend relies on the server for its budget
+        for backend in self.backends[:2]:
+            for i in range(5):
+                backend.set(str(i), b"x" * 40)
+            self.assertLessEqual(backend.size(), 100, msg=type(backend).__name__)
+            self.assertGreater(backend.stats()["evictions"], 0)
+            # the most recent entry survives
+            self.assertIsNotNone(backend.get("4"))
+
+    def test_oversized_entries_are_skipped(self):
+        for backend in self.backends:
+            backend.set("big", b"x" * 101)
+            self.assertIsNone(backend.get("big"))
+
+    def test_shared_between_instances(self):
+        location = self.backends[1].location
+        other = SQLiteCacheBackend(location, max_bytes=100, ttl=60)
+        self.backends[1].set("a", b"shared")
+        self.assertEqual(other.get("a"), b"shared")
+
+
+class CachedResponseTestCase(SimpleTestCase):
+    def test_view_computed_once(self):
+        calls = []
+        cache = LocalCacheBackend(max_bytes=10000, ttl=60)
+
+        @cached_response(cache, key=lambda path: path)
+        def view(path):
+            calls.append(path)
+            return JsonResponse({"path": path})
+
+        first = view("/a")
+        second = view("/a")
+        view("/b")
+
+        self.assertEqual(calls, ["/a", "/b"])
+        self.assertEqual(first.content, second.content)
+
+    def test_concurrent_misses_computed_once(self):
+        calls = Counter()
+        cache = LocalCacheBackend(max_bytes=1 << 20, ttl=60)
+        barrier = threading.Barrier(16)
+
+        @cached_response(cache, key=lambda path: path)
+        def view(path):
+            calls[path] += 1
+            time.sleep(0.05)
+            return JsonResponse({"path": path})
+
+        def request(i):
+            barrier.wait()
+            return view("/{}".format(i % 2))
+
+        with ThreadPoolExecutor(16) as executor:
+            responses = list(executor.map(request, range(16)))
+
+        self.assertEqual(calls, {"/0": 1, "/1": 1})
+        self.assertEqual(len({id(r) for r in responses}), 16)
+        for i, response in enumerate(responses):
+            self.assertEqual(response.content, b'{"path": "/%d"}' % (i % 2))
+
+
+class MemoizeTestCase(SimpleTestCase):
+    """
+    Stress tests of the coalescing cache: many threads asking for the
+    same few keys at once must compute each key exactly once.
+    """
+
+    def stress(self, func, keys, threads=32, rounds=4):
+        barrier = threading.Barrier(threads)
+
+        def worker(i):
+            barrier.wait()
+            return [func(keys[(i + r) % len(keys)]) for r in range(rounds)]
+
+        with ThreadPoolExecutor(threads) as executor:
+            return list(executor.map(worker, range(threads)))
+
+    def test_each_key_computed_once(self):
+        calls = Counter()
+        lock = threading.Lock()
+
+        @memoize(TTLCache(maxsize=100, ttl=60))
+        def square(x):
+            with lock:
+                calls[x] += 1
+            time.sleep(0.02)
+            return x * x
+
+        results = self.stress(square, keys=list(range(5)))
+
+        self.assertEqual(calls, {x: 1 for x in range(5)})
+        for i, values in enumerate(results):
+            self.assertEqual(values, [((i + r) % 5) ** 2 for r in range(4)])
+
+    def test_errors_are_shared_but_not_cached(self):
+        calls = Counter()
+        barrier = threading.Barrier(8)
+
+        @memoize(TTLCache(maxsize=100, ttl=60))
+        def fail(x):
+            calls[x] += 1
+            time.sleep(0.05)
+            raise ValueError(x)
+
+        def call(_):
+            barrier.wait()
+            try:
+                fail("a")
+            except ValueError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(8) as executor:
+            self.assertEqual(list(executor.map(call, range(8))), ["a"] * 8)
+        self.assertEqual(calls["a"], 1)
+
+        with self.assertRaises(ValueError):
+            fail("a")
+        self.assertEqual(calls["a"], 2)
+
+    def test_clear_drops_values_in_flight(self):
+        started, release = threading.Event(), threading.Event()
+        values = iter(["stale", "fresh"])
+
+        @memoize(TTLCache(maxsize=100, ttl=60))
+        def load(key):
+            started.set()
+            release.wait()
+            return next(values)
+
+        with ThreadPoolExecutor(1) as executor:
+            pending = executor.submit(load, "k")
+            started.wait()
+            load.cache_clear()
+            release.set()
+            self.assertEqual(pending.result(), "stale")
+
+        self.assertEqual(load("k"), "fresh")
+        self.assertEqual(load("k"), "fresh")
+
+    def test_read_length_counts_computed_once(self):
+        from browser import compute
+        from browser.tests.ribo_fixtures import make_ribo_file
+
+        calls = Counter()
+        read_length_counts = compute.read_length_counts
+
+        def counting(ribo, experiment_name):
+            calls[experiment_name] += 1
+            return read_length_counts(ribo, experiment_name)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "test.ribo")
+            make_ribo_file(path, experiments=("exp1", "exp2"))
+            compute.get_read_length_counts.cache_clear()
+            try:
+                with compute.ribo_handle_pool.lease(path) as ribo, mock.patch.object(
+                    compute, "read_length_counts", counting
+                ):
+                    results = self.stress(
+                        lambda name: compute.get_read_length_counts(ribo, name),
+                        keys=["exp1", "exp2"],
+                    )
+            finally:
+                compute.ribo_handle_pool.clear()
+
+        self.assertEqual(calls, {"exp1": 1, "exp2": 1})
+        self.assertEqual(len({id(x) for values in results for x in values}), 2)
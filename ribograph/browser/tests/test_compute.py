@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import numpy as np
+
+from django.test import SimpleTestCase
+
+from browser.compute import (
+    ComputeTimeout,
+    InlineBackend,
+    ProcessPoolBackend,
+    gene_correlations,
+    make_compute_backend,
+    ribo_handle_pool,
+)
+from browser.tests.ribo_fixtures import make_ribo_file
+
+#####################################################################
+
+
+class ComputeBackendTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        first = os.path.join(cls.tmp_dir.name, "first.ribo")
+        second = os.path.join(cls.tmp_dir.name, "second.ribo")
+        make_ribo_file(first, experiments=("exp1", "exp2"))
+        make_ribo_file(second, experiments=("exp3",), seed=1)
+        cls.experiments = [
+            (first, None, "exp1"),
+            (first, None, "exp2"),
+            (second, None, "exp3"),
+        ]
+        cls.pool = ProcessPoolBackend(processes=1, timeout=60)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+        ribo_handle_pool.clear()
+        cls.tmp_dir.cleanup()
+        super().tearDownClass()
+
+    def test_process_pool_matches_inline(self):
+        expected = InlineBackend().run(gene_correlations, self.experiments, 26, 30)
+        result = self.pool.run(gene_correlations, self.experiments, 26, 30)
+
+        self.assertEqual(set(result), set(expected))
+        for key, value in expected.items():
+            np.testing.assert_array_equal(result[key], value, err_msg=key)
+        self.assertEqual(result["experiments"].tolist(), ["exp1", "exp2", "exp3"])
+        self.assertEqual(result["correlations"].shape, (3, 3))
+        self.assertEqual(result["counts"].dtype, np.uint64)
+
+        # a second job reuses the warm worker and its open files
+        result = self.pool.run(gene_correlations, self.experiments[:2], 26, 30)
+        self.assertEqual(result["experiments"].tolist(), ["exp1", "exp2"])
+
+    def test_timeout(self):
+        backend = ProcessPoolBackend(processes=1, timeout=0.1)
+        try:
+            with self.assertRaises(ComputeTimeout):
+                backend.run(time.sleep, 2)
+        finally:
+            backend.shutdown()
+
+    def test_shutdown_cancels_queued_jobs(self):
+        backend = ProcessPoolBackend(processes=1)
+        backend.warm()
+        with ThreadPoolExecutor(6) as threads:
+            jobs = [threads.submit(backend.run, time.sleep, 0.5) for _ in range(6)]
+            deadline = time.time() + 5
+            while len(backend._pending) < len(jobs) and time.time() < deadline:
+                time.sleep(0.01)
+            backend.shutdown()
+
+            cancelled = 0
+            for job in jobs:
+                try:
+                    job.result()
+                except CancelledError:
+                    cancelled += 1
+        # the jobs already handed to the worker finish, the others are cancelled
+        self.assertGreaterEqual(cancelled, 1)
+
+    def test_make_compute_backend(self):
+        self.assertIsInstance(make_compute_backend("inline"), InlineBackend)
+        self.assertIsInstance(make_compute_backend("process"), ProcessPoolBackend)
+        with self.assertRaises(ValueError):
+            make_compute_backend("threads")
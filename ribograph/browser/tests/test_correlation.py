@@ -0,0 +1,95 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from django.test import SimpleTestCase
+from scipy.stats import spearmanr, pearsonr
+
+from browser.correlation import align_counts, correlation_matrix, read_length_counts
+from browser.handles import open_ribo, close_ribo
+from browser.tests.ribo_fixtures import make_ribo_file
+
+#####################################################################
+
+
+class CorrelationTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        base = rng.poisson(50, size=400)
+        self.counts = np.stack(
+            [base + rng.poisson(5 * i + 1, size=400) for i in range(5)], axis=1
+        )
+
+    def assert_pairwise(self, method, reference):
+        # a small block size makes sure the blocks are accumulated correctly
+        correlations = correlation_matrix(self.counts, method, block_size=64)
+        for i in range(self.counts.shape[1]):
+            for j in range(self.counts.shape[1]):
+                expected = reference(self.counts[:, i], self.counts[:, j])[0]
+                self.assertAlmostEqual(correlations[i, j], expected, places=4)
+
+    def test_spearman(self):
+        self.assert_pairwise("spearman", spearmanr)
+
+    def test_pearson(self):
+        self.assert_pairwise("pearson", pearsonr)
+
+    def test_log_pearson(self):
+        self.assert_pairwise(
+            "log_pearson", lambda x, y: pearsonr(np.log1p(x), np.log1p(y))
+        )
+
+    def test_constant_column(self):
+        self.counts[:, 2] = 7
+        correlations = correlation_matrix(self.counts)
+        self.assertTrue(np.isnan(correlations[0, 2]))
+        self.assertTrue(np.isnan(correlations[2, 2]))
+        self.assertEqual(correlations[1, 1], 1)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            correlation_matrix(self.counts, "kendall")
+
+    def test_align_counts(self):
+        first = pd.Series({"a": 1, "b": 2, "c": 3}, name="x")
+        second = pd.Series({"c": 4, "a": 5}, name="y")
+        aligned = align_counts([first, second])
+        self.assertEqual(list(aligned.columns), ["x", "y"])
+        self.assertEqual(aligned.loc["a"].tolist(), [1, 5])
+        self.assertEqual(sorted(aligned.index), ["a", "c"])
+
+
+class ReadLengthCountsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, "test.ribo")
+        make_ribo_file(path, experiments=("exp1", "exp2"))
+        self.ribo = open_ribo(path)
+
+    def tearDown(self):
+        close_ribo(self.ribo)
+        self.tmp_dir.cleanup()
+
+    def test_range_sums_match_ribopy(self):
+        for experiment in ("exp1", "exp2"):
+            counts = read_length_counts(self.ribo, experiment)
+            for lower, upper in ((25, 32), (26, 26), (27, 30)):
+                expected = self.ribo.get_region_counts(
+                    "CDS",
+                    range_lower=lower,
+                    range_upper=upper,
+                    sum_references=False,
+                    experiments=[experiment],
+                )[experiment].reindex(self.ribo.transcript_names)
+                self.assertEqual(
+                    counts.range_sum(lower, upper).tolist(), expected.tolist()
+                )
+
+    def test_range_bounds(self):
+        counts = read_length_counts(self.ribo, "exp1")
+        self.assertEqual(
+            counts.range_sum(0, 0).tolist(), counts.range_sum(10, 100).tolist()
+        )
+        self.assertFalse(counts.range_sum(40, 50).any())
@@ -0,0 +1,87 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, SimpleTestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from browser.models import Project, Experiment
+from browser.downloads import parse_range
+
+#####################################################################
+
+
+class ParseRangeTestCase(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=50-500", 100), (50, 99))
+
+    def test_ignored_ranges(self):
+        self.assertIsNone(parse_range("bytes=0-1,5-6", 100))
+        self.assertIsNone(parse_range("lines=0-1", 100))
+        self.assertIsNone(parse_range("bytes=-", 100))
+
+    def test_unsatisfiable_ranges(self):
+        with self.assertRaises(ValueError):
+            parse_range("bytes=100-", 100)
+        with self.assertRaises(ValueError):
+            parse_range("bytes=5-2", 100)
+
+
+class DownloadTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ribo_path = os.path.join(self.tmp_dir.name, "test.ribo")
+        self.content = bytes(range(256)) * 1000
+        with open(self.ribo_path, "wb") as output_stream:
+            output_stream.write(self.content)
+
+        user = User.objects.create(username="owner")
+        project = Project.objects.create(name="public", owner=user, public=True)
+        experiment = Experiment.objects.create(
+            name="exp1", project=project, ribo_file_path=self.ribo_path
+        )
+        self.url = reverse("browser:download_ribo", args=[experiment.id])
+        self.c = Client()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_full_download(self):
+        response = self.c.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+
+    def test_range_download(self):
+        response = self.c.get(self.url, HTTP_RANGE="bytes=1000-1999")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"], "bytes 1000-1999/{}".format(len(self.content))
+        )
+        self.assertEqual(b"".join(response.streaming_content), self.content[1000:2000])
+
+        # resuming with an outdated If-Range gets the whole file
+        response = self.c.get(
+            self.url, HTTP_RANGE="bytes=1000-", HTTP_IF_RANGE='"outdated"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.c.get(self.url, HTTP_RANGE="bytes=9999999-")
+        self.assertEqual(response.status_code, 416)
+
+    def test_accel_redirect(self):
+        locations = {self.tmp_dir.name: "/protected/ribo_files/"}
+        with mock.patch("browser.downloads.DOWNLOAD_ACCEL_REDIRECT", True), mock.patch(
+            "browser.downloads.DOWNLOAD_ACCEL_LOCATIONS", locations
+        ):
+            response = self.c.get(self.url)
+
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected/ribo_files/test.ribo"
+        )
+        self.assertEqual(response.content, b"")
@@ -0,0 +1,91 @@
+import gzip
+import io
+import os
+import random
+import tempfile
+
+from django.test import SimpleTestCase
+
+from browser import Fasta
+from browser.Fasta import FastaEntry, FastaFile, IndexedFasta, build_fasta_index
+
+#####################################################################
+
+FASTA = (
+    b"ignored line before the first header\n"
+    b">first description of the first\n"
+    b"ACGT\n"
+    b"acgtN\n"
+    b"\n"
+    b">second\r\n"
+    b"GG\r\n"
+    b">empty\n"
+    b">last\n"
+    b"TTTT"  # no new line at the end
+)
+
+EXPECTED = [
+    ("first", "ACGTacgtN"),
+    ("second", "GG"),
+    ("empty", ""),
+    ("last", "TTTT"),
+]
+
+
+class FastaParserTestCase(SimpleTestCase):
+    def test_records(self):
+        for read_size in (1, 3, 7, 1 << 22):
+            Fasta.READ_SIZE = read_size
+            try:
+                records = [
+                    (h.decode(), s.decode())
+                    for h, s in Fasta.read_fasta_records(io.BytesIO(FASTA))
+                ]
+                lengths = [
+                    (h.decode(), l)
+                    for h, l in Fasta.read_fasta_records(
+                        io.BytesIO(FASTA), sequences=False
+                    )
+                ]
+            finally:
+                Fasta.READ_SIZE = 1 << 22
+
+            self.assertEqual(records, EXPECTED, msg=read_size)
+            self.assertEqual(lengths, [(h, len(s)) for h, s in EXPECTED], msg=read_size)
+
+    def test_fasta_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "reference.fa.gz")
+            with gzip.open(path, "wb") as output_stream:
+                output_stream.write(FASTA)
+
+            entries = [(e.header, e.sequence) for e in FastaFile(path)]
+            self.assertEqual(entries, EXPECTED)
+
+            with FastaFile(path) as fasta:
+                self.assertEqual(dict(fasta.lengths())["first"], 9)
+
+            build_fasta_index(path)
+            indexed = IndexedFasta(path)
+            for header, sequence in EXPECTED:
+                self.assertEqual(indexed[header], sequence)
+            self.assertIsNone(indexed.get("missing"))
+
+
+class FastaEntryTestCase(SimpleTestCase):
+    def test_reverse_complement(self):
+        entry = FastaEntry("x", "AACGTNt")
+        entry.reverse_complement()
+        self.assertEqual(entry.sequence, "aNACGTT")
+
+        with self.assertRaises(IOError):
+            FastaEntry("x", "ACGU").reverse_complement()
+
+    def test_str(self):
+        sequence = "".join(random.choice("ACGT") for _ in range(120))
+        lines = str(FastaEntry("x", sequence)).split("\n")
+
+        self.assertEqual(lines[0], ">x")
+        self.assertEqual([len(l) for l in lines[1:]], [50, 50, 20])
+        self.assertEqual("".join(lines[1:]), sequence)
+        self.assertEqual(str(FastaEntry("x", "")), ">x")
@@ -0,0 +1,62 @@
+import random
+
+from django.test import SimpleTestCase
+
+from browser.gene_index import GeneIndex
+
+#####################################################################
+
+
+class GeneIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.names = [
+            "".join(rng.choice("ABCab-1") for _ in range(rng.randint(1, 8)))
+            + "-{}".format(i)
+            for i in range(500)
+        ]
+        self.counts = [rng.randrange(50) for _ in self.names]
+        self.index = GeneIndex(self.names, self.counts)
+
+    def brute_force(self, query, sort, match):
+        query = query.lower()
+        if match == "prefix":
+            matches = [n for n in self.names if n.lower().startswith(query)]
+        else:
+            matches = [n for n in self.names if query in n.lower()]
+        counts = dict(zip(self.names, self.counts))
+        order = list(range(len(self.names)))
+        if sort == "name":
+            order.sort(key=lambda i: self.names[i].lower())
+        else:
+            order.sort(key=lambda i: -self.counts[i])
+        position = {self.names[i]: p for p, i in enumerate(order)}
+        return sorted(matches, key=position.get), counts
+
+    def test_search_matches_brute_force(self):
+        for query in ("", "a", "ab", "B-1", "aba", "-1", "cab-", "zzz", "-49"):
+            for sort in ("count", "name"):
+                for match in ("substring", "prefix"):
+                    expected, counts = self.brute_force(query, sort, match)
+                    for offset, limit in ((0, 10), (5, 1000), (20, 7)):
+                        total, page = self.index.search(
+                            query, sort, match, offset, limit
+                        )
+                        result = self.index.page(page)
+                        self.assertEqual(total, len(expected))
+                        self.assertEqual(
+                            result["genes"],
+                            expected[offset : offset + limit],
+                            msg=(query, sort, match, offset, limit),
+                        )
+                        self.assertEqual(
+                            result["counts"].tolist(),
+                            [counts[n] for n in result["genes"]],
+                        )
+
+    def test_trigram_postings(self):
+        for trigram, posting in list(self.index.trigrams.items())[:50]:
+            self.assertEqual(
+                posting.tolist(),
+                [i for i, n in enumerate(self.names) if trigram in n.lower()],
+            )
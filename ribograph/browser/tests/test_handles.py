@@ -0,0 +1,117 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from browser.handles import RiboHandlePool
+from browser.tests.ribo_fixtures import make_ribo_file
+
+#####################################################################
+
+
+class RiboHandlePoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.tmp_dir.name, "{}.ribo".format(i))
+            make_ribo_file(path, experiments=("a", "b"), appris=True)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def use(self, pool, path, regex=""):
+        with pool.lease(path, regex) as ribo:
+            return ribo
+
+    def test_handles_are_shared(self):
+        pool = RiboHandlePool(max_open=2)
+
+        with pool.lease(self.paths[0]) as first, pool.lease(self.paths[0]) as second:
+            self.assertIs(first, second)
+        self.assertEqual(pool.stats()["opens"], 1)
+        self.assertEqual(pool.stats()["reuses"], 1)
+        self.assertEqual(pool.stats()["leased"], 0)
+        self.assertTrue(first._handle.id.valid)
+
+    def test_regex_is_part_of_the_key(self):
+        pool = RiboHandlePool(max_open=2)
+        regex = r"^(?:[^|]*\|){4}([^|]*)\|.*$"
+
+        plain = self.use(pool, self.paths[0])
+        aliased = self.use(pool, self.paths[0], regex)
+
+        self.assertIsNot(plain, aliased)
+        self.assertIsNone(plain.alias)
+        self.assertEqual(aliased.alias.aliases[0], "GENE0-201")
+
+    def test_lru_eviction_closes_handles(self):
+        pool = RiboHandlePool(max_open=2)
+
+        first = self.use(pool, self.paths[0])
+        self.use(pool, self.paths[1])
+        self.use(pool, self.paths[0])
+        self.use(pool, self.paths[2])
+
+        # paths[1] was the least recently used one
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.stats()["evictions"], 1)
+        self.assertTrue(first._handle.id.valid)
+        self.assertEqual(pool.stats()["opens"], 3)
+
+        self.use(pool, self.paths[1])
+        self.assertFalse(first._handle.id.valid)
+        self.assertEqual(pool.stats()["opens"], 4)
+
+    def test_evicted_handles_stay_open_while_leased(self):
+        pool = RiboHandlePool(max_open=1)
+
+        with pool.lease(self.paths[0]) as first:
+            self.use(pool, self.paths[1])
+            self.assertEqual(pool.stats()["evictions"], 1)
+            # still readable by its holder
+            self.assertTrue(first._handle.id.valid)
+            self.assertEqual(list(first.experiments), ["a", "b"])
+        self.assertFalse(first._handle.id.valid)
+
+    def test_concurrent_leases_with_eviction(self):
+        pool = RiboHandlePool(max_open=1)
+        errors = []
+        barrier = threading.Barrier(6)
+
+        def read(path):
+            barrier.wait()
+            for _ in range(20):
+                try:
+                    with pool.lease(path) as ribo:
+                        ribo._handle["experiments"]["a"].attrs["total_reads"]
+                except Exception as e:
+                    errors.append(e)
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(read, self.paths * 2))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(pool.stats()["leased"], 0)
+        pool.clear()
+
+    def test_discard(self):
+        pool = RiboHandlePool(max_open=2)
+        ribo = self.use(pool, self.paths[0])
+
+        pool.discard(self.paths[0])
+
+        self.assertEqual(len(pool), 0)
+        self.assertFalse(ribo._handle.id.valid)
+
+    def test_discard_waits_for_leases(self):
+        pool = RiboHandlePool(max_open=2)
+
+        with pool.lease(self.paths[0]) as ribo:
+            pool.discard(self.paths[0])
+            self.assertEqual(len(pool), 0)
+            self.assertTrue(ribo._handle.id.valid)
+        self.assertFalse(ribo._handle.id.valid)
@@ -0,0 +1,167 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+import browser.ingestion
+from browser.models import Project, Experiment
+from browser.ingestion import RiboIngestion, IngestionError, digest_reference
+from browser.handles import open_ribo, close_ribo
+from browser.jobs import claim_job, run_job
+from browser.summary import load_summary
+from browser.tests.ribo_fixtures import make_ribo_file
+
+#####################################################################
+
+
+class RiboIngestionTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_run_and_load(self):
+        path = os.path.join(self.tmp_dir.name, "test.ribo")
+        make_ribo_file(path, experiments=("exp1", "exp2"), appris=True)
+
+        ingestion = RiboIngestion.run(path)
+        loaded = RiboIngestion.load(path)
+
+        ribo = open_ribo(path)
+        self.assertEqual(loaded.experiments, ["exp1", "exp2"])
+        self.assertEqual(loaded.reference_digest, digest_reference(ribo))
+        self.assertEqual(loaded.transcript_regex, browser.ingestion.APPRIS_REGEX)
+        self.assertEqual(loaded.to_dict(), ingestion.to_dict())
+        self.assertIsNotNone(load_summary(path))
+        close_ribo(ribo)
+
+    def test_plain_names_have_no_regex(self):
+        path = os.path.join(self.tmp_dir.name, "test.ribo")
+        make_ribo_file(path, experiments=("exp1",))
+        self.assertEqual(RiboIngestion.run(path).transcript_regex, "")
+
+    def test_invalid_file(self):
+        path = os.path.join(self.tmp_dir.name, "test.ribo")
+        with open(path, "wb") as output_stream:
+            output_stream.write(b"not a ribo file")
+
+        with self.assertRaises(IngestionError):
+            RiboIngestion.run(path)
+        self.assertIsNone(RiboIngestion.load(path))
+
+
+class UploadPipelineTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        folders = {"ribo": (os.path.join(self.tmp_dir.name, "upload"), ".ribo")}
+        self.ribo_folder = os.path.join(self.tmp_dir.name, "ribo_files")
+        self.patches = [
+            mock.patch.dict("browser.uploads.UPLOAD_FOLDERS", folders),
+            mock.patch("browser.views.RIBO_FOLDER", self.ribo_folder),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        user = User.objects.create_user(username="owner", password="password")
+        self.project = Project.objects.create(name="project", owner=user)
+        self.c = Client()
+        self.c.login(username="owner", password="password")
+
+        self.ribo_path = os.path.join(self.tmp_dir.name, "test.ribo")
+        make_ribo_file(self.ribo_path, experiments=("exp1", "exp2"))
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_file_is_opened_once(self):
+        with mock.patch(
+            "browser.ingestion.Ribo", wraps=browser.ingestion.Ribo
+        ) as ribo_class:
+            with open(self.ribo_path, "rb") as ribo_file:
+                response = self.c.post(
+                    reverse("browser:project_details", args=[self.project.id]),
+                    {"ribo_file": ribo_file, "project_id": self.project.id},
+                )
+            confirm_url = response["Location"]
+
+            response = self.c.get(confirm_url)
+            self.assertEqual(response.context["experiments"], ["exp1", "exp2"])
+
+            self.c.post(
+                confirm_url,
+                {
+                    "form-TOTAL_FORMS": 2,
+                    "form-INITIAL_FORMS": 2,
+                    "form-0-experiment": "exp1",
+                    "form-0-selected": "on",
+                    "form-1-experiment": "exp2",
+                },
+            )
+
+        self.assertEqual(ribo_class.call_count, 1)
+
+        experiment = Experiment.objects.get(project=self.project)
+        self.assertEqual(experiment.name, "exp1")
+        self.assertTrue(experiment.ribo_file_path.startswith(self.ribo_folder))
+        self.assertIsNotNone(load_summary(experiment.ribo_file_path))
+
+    def test_invalid_upload(self):
+        invalid_path = os.path.join(self.tmp_dir.name, "invalid.ribo")
+        with open(invalid_path, "wb") as output_stream:
+            output_stream.write(b"not a ribo file")
+
+        with open(invalid_path, "rb") as ribo_file:
+            response = self.c.post(
+                reverse("browser:project_details", args=[self.project.id]),
+                {"ribo_file": ribo_file, "project_id": self.project.id},
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            "Invalid ribo file.", response.context["upload_form"].errors["ribo_file"]
+        )
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir.name, "upload")), [])
+
+    @mock.patch("browser.jobs.BACKGROUND_JOBS", True)
+    def test_background_ingestion(self):
+        with open(self.ribo_path, "rb") as ribo_file:
+            response = self.c.post(
+                reverse("browser:project_details", args=[self.project.id]),
+                {"ribo_file": ribo_file, "project_id": self.project.id},
+            )
+        confirm_url = response["Location"]
+        self.assertIn("?job=", confirm_url)
+
+        response = self.c.get(confirm_url)
+        self.assertTemplateUsed(response, "browser/job_progress.html")
+
+        run_job(claim_job("worker"))
+
+        response = self.c.get(confirm_url)
+        self.assertEqual(response.context["experiments"], ["exp1", "exp2"])
+
+    @mock.patch("browser.jobs.BACKGROUND_JOBS", True)
+    def test_confirm_needs_project_access(self):
+        with open(self.ribo_path, "rb") as ribo_file:
+            response = self.c.post(
+                reverse("browser:project_details", args=[self.project.id]),
+                {"ribo_file": ribo_file, "project_id": self.project.id},
+            )
+        confirm_url = response["Location"]
+
+        # logged out users are sent to the login page
+        response = Client().get(confirm_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response["Location"].startswith("/login?"))
+
+        # other users can neither confirm the file nor follow its job
+        User.objects.create_user(username="other", password="password")
+        other = Client()
+        other.login(username="other", password="password")
+        self.assertEqual(other.get(confirm_url).status_code, 403)
@@ -0,0 +1,93 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from browser.models import Job
+from browser.jobs import register_job, enqueue, claim_job, run_worker, fail_stale_jobs
+
+#####################################################################
+
+
+@register_job("test_add")
+def add(job, a, b):
+    job.set_progress(0.5, "adding")
+    return a + b
+
+
+@register_job("test_fail")
+def fail(job):
+    raise ValueError("broken")
+
+
+class JobTestCase(TestCase):
+    def test_inline_jobs(self):
+        job = enqueue("test_add", a=1, b=2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.progress), (Job.DONE, 3, 1))
+
+        with self.assertLogs("browser.jobs", "ERROR"):
+            job = enqueue("test_fail")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.message), (Job.FAILED, "broken"))
+
+        # optional jobs are skipped without workers
+        with self.assertLogs("browser.jobs", "INFO"):
+            self.assertIsNone(enqueue("test_add", inline=False, a=1, b=2))
+
+    def test_unknown_job(self):
+        with self.assertRaises(KeyError):
+            enqueue("no_such_job")
+
+    @mock.patch("browser.jobs.BACKGROUND_JOBS", True)
+    def test_queue(self):
+        first = enqueue("test_add", unique=True, a=1, b=2)
+        self.assertEqual(first.status, Job.QUEUED)
+        self.assertEqual(enqueue("test_add", unique=True, a=1, b=2).id, first.id)
+        second = enqueue("test_add", a=3, b=4)
+
+        claimed = claim_job("worker")
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual(Job.objects.get(id=first.id).status, Job.RUNNING)
+
+        # the first job is taken, so the remaining one is picked up by the worker
+        rounds = iter(range(2))
+        run_worker(poll_interval=0, should_stop=lambda: next(rounds, None) is None)
+
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.result), (Job.DONE, 7))
+        self.assertIsNone(claim_job("worker"))
+
+    @mock.patch("browser.jobs.BACKGROUND_JOBS", True)
+    def test_stale_jobs(self):
+        job = enqueue("test_add", unique=True, a=1, b=2)
+        self.assertEqual(claim_job("killed").id, job.id)
+        self.assertEqual(enqueue("test_add", unique=True, a=1, b=2).id, job.id)
+        self.assertEqual(fail_stale_jobs(timeout=3600), 0)
+
+        # the worker died long ago
+        Job.objects.filter(id=job.id).update(
+            start_date=timezone.now() - timedelta(hours=2)
+        )
+        with self.assertLogs("browser.jobs", "WARNING"):
+            self.assertEqual(fail_stale_jobs(timeout=3600), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertNotEqual(enqueue("test_add", unique=True, a=1, b=2).id, job.id)
+
+    def test_status_endpoint(self):
+        owner = User.objects.create_user(username="owner", password="password")
+        User.objects.create_user(username="other", password="password")
+        job = enqueue("test_add", owner=owner, a=1, b=2)
+
+        c = Client()
+        c.login(username="owner", password="password")
+        status = c.get("/jobs/{}".format(job.id)).json()
+        self.assertEqual((status["status"], status["result"]), ("done", 3))
+        self.assertEqual([x["id"] for x in c.get("/jobs").json()["jobs"]], [job.id])
+
+        c.login(username="other", password="password")
+        self.assertEqual(c.get("/jobs/{}".format(job.id)).status_code, 404)
@@ -0,0 +1,123 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from browser.models import Project, Experiment, Reference
+from browser.forms import ExperimentReferenceForm
+from browser.Fasta import fasta_index_paths
+from browser.ingestion import digest_reference
+from browser.handles import open_ribo, close_ribo
+from browser.manifest import (
+    digest_reference_file,
+    reference_manifest,
+    find_incompatibility,
+)
+from browser.jobs import enqueue
+from browser.tests.ribo_fixtures import make_ribo_file, make_reference_file
+
+#####################################################################
+
+
+class FindIncompatibilityTestCase(TestCase):
+    def test_compatible(self):
+        # extra transcripts and another order are fine
+        self.assertIsNone(
+            find_incompatibility(["a", "b"], [10, 20], ["c", "b", "a"], [5, 20, 10])
+        )
+
+    def test_missing_transcript(self):
+        message = find_incompatibility(["a", "b"], [10, 20], ["a"], [10])
+        self.assertIn("does not exist in reference: b", message)
+
+    def test_different_length(self):
+        message = find_incompatibility(["a", "b"], [10, 20], ["a", "b"], [10, 21])
+        self.assertEqual(
+            message, "The lengths of the transcript b do not match 20 vs 21"
+        )
+
+
+class ReferenceManifestTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ribo_path = os.path.join(self.tmp_dir.name, "test.ribo")
+        self.names, self.lengths = make_ribo_file(self.ribo_path, experiments=("exp1",))
+
+        ribo = open_ribo(self.ribo_path)
+        self.ribo_digest = digest_reference(ribo)
+        close_ribo(ribo)
+
+        self.owner = User.objects.create(username="owner")
+        project = Project.objects.create(name="project", owner=self.owner)
+        self.experiment = Experiment.objects.create(
+            name="exp1",
+            project=project,
+            ribo_file_path=self.ribo_path,
+            reference_digest=self.ribo_digest,
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def add_reference(self, name, names, lengths):
+        path = os.path.join(self.tmp_dir.name, name + ".gz")
+        make_reference_file(path, names, lengths)
+        reference = Reference.objects.create(
+            name=name, reference_file_path=path, owner=self.owner
+        )
+        enqueue("index_reference", reference_id=reference.id)
+        reference.refresh_from_db()
+        return reference
+
+    def test_manifest_digest_matches_ribo_digest(self):
+        reference = self.add_reference("matching", self.names, self.lengths)
+
+        names, lengths = reference_manifest(reference.reference_file_path)
+        self.assertEqual(names, list(self.names))
+        self.assertEqual(lengths.tolist(), list(self.lengths))
+        self.assertEqual(reference.transcript_digest, self.ribo_digest)
+        self.assertEqual(
+            digest_reference_file(reference.reference_file_path), self.ribo_digest
+        )
+
+    def test_form(self):
+        matching = self.add_reference("matching", self.names, self.lengths)
+        other = self.add_reference("other", self.names, [x + 1 for x in self.lengths])
+
+        form = ExperimentReferenceForm(instance=self.experiment)
+        self.assertEqual(list(form.fields["reference"].queryset), [matching])
+
+        # a matching digest does not need the ribo file
+        with mock.patch("browser.forms.Ribo") as ribo_class:
+            form = ExperimentReferenceForm(
+                {"reference": matching.id}, instance=self.experiment
+            )
+            self.assertTrue(form.is_valid())
+        ribo_class.assert_not_called()
+
+        # references are checked transcript by transcript when the digests differ
+        self.experiment.reference_digest = ""
+        form = ExperimentReferenceForm(
+            {"reference": other.id}, instance=self.experiment
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("do not match", form.errors["reference"][0])
+
+    def test_erase_reference_removes_index(self):
+        reference = self.add_reference("matching", self.names, self.lengths)
+        paths = [reference.reference_file_path]
+        paths.extend(fasta_index_paths(reference.reference_file_path))
+        for path in paths:
+            self.assertTrue(os.path.exists(path), msg=path)
+
+        client = Client()
+        client.force_login(self.owner)
+        response = client.get(reverse("browser:erase_reference", args=[reference.id]))
+
+        self.assertRedirects(response, reverse("browser:references"))
+        self.assertFalse(Reference.objects.filter(id=reference.id).exists())
+        for path in paths:
+            self.assertFalse(os.path.exists(path), msg=path)
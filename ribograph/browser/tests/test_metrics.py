@@ -0,0 +1,181 @@
+import os
+import re
+import socket
+import tempfile
+from unittest import mock
+
+from cachetools import TTLCache
+
+from django.test import SimpleTestCase, TestCase, Client
+from django.contrib.auth.models import User
+
+from browser import metrics
+from browser.cache import memoize
+from browser.metrics import API_PHASES, Histogram, RequestTimer
+from browser.models import Project, Experiment
+from browser.api import api_response_cache, ribo_handle_pool
+from browser.tests.ribo_fixtures import make_ribo_file
+
+#####################################################################
+
+
+def sample(text, name, **labels):
+    """
+    The value of the sample of a Prometheus text exposition having (at least)
+    the given labels, or None.
+    """
+    pattern = r"^{}(?:\{{(.*)\}})? (\S+)$".format(re.escape(name))
+    for match in re.finditer(pattern, text, re.MULTILINE):
+        sample_labels = dict(
+            re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(1) or "")
+        )
+        if all(sample_labels.get(k) == v for k, v in labels.items()):
+            return float(match.group(2))
+    return None
+
+
+class MetricsTestCase(SimpleTestCase):
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "A test.", ("endpoint",), (0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, "a")
+        text = "\n".join(histogram.collect())
+
+        self.assertIn("# TYPE test_seconds histogram", text)
+        self.assertEqual(sample(text, "test_seconds_bucket", endpoint="a", le="0.1"), 1)
+        self.assertEqual(sample(text, "test_seconds_bucket", endpoint="a", le="1.0"), 2)
+        self.assertEqual(
+            sample(text, "test_seconds_bucket", endpoint="a", le="+Inf"), 3
+        )
+        self.assertEqual(sample(text, "test_seconds_count", endpoint="a"), 3)
+        self.assertAlmostEqual(sample(text, "test_seconds_sum", endpoint="a"), 5.55)
+
+    def test_nested_phases(self):
+        # every call of the clock moves it by one second
+        clock = iter(range(100))
+        with mock.patch.object(metrics.time, "perf_counter", lambda: next(clock)):
+            timer = RequestTimer("test")
+            with timer.activate():
+                with metrics.phase("read"):  # 1 - 6
+                    with metrics.phase("transform"):  # 2 - 3
+                        pass
+                    with metrics.phase("transform"):  # 4 - 5
+                        pass
+                with metrics.phase("serialize"):  # 7 - 8
+                    pass
+        # read only keeps the time outside of its transforms
+        self.assertEqual(timer.phases, {"transform": 2, "read": 3, "serialize": 1})
+
+    def test_phase_outside_of_requests(self):
+        with metrics.phase("read"):
+            pass
+
+    def test_memoize_stats(self):
+        @memoize(TTLCache(maxsize=2, ttl=60))
+        def square(x):
+            return x * x
+
+        for x in (1, 1, 2, 3, 3, 1):
+            square(x)
+        stats = square.stats()
+        # 1 is evicted by 3 and computed again, which evicts 2
+        self.assertEqual(
+            (stats["hits"], stats["misses"], stats["evictions"]), (2, 4, 2)
+        )
+        self.assertEqual((stats["entries"], stats["max_size"]), (2, 2))
+
+
+@mock.patch("browser.views.METRICS_ENDPOINT", True)
+@mock.patch("browser.views.METRICS_TOKEN", "token")
+class MetricsEndpointTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ribo_path = os.path.join(self.tmp_dir.name, "test.ribo")
+        make_ribo_file(self.ribo_path)
+
+        user = User.objects.create(username="owner")
+        project = Project.objects.create(name="public", owner=user, public=True)
+        self.experiment = Experiment.objects.create(
+            name="exp1", project=project, ribo_file_path=self.ribo_path
+        )
+        api_response_cache.clear()
+        ribo_handle_pool.clear()
+        for histogram in metrics.registry.histograms:
+            histogram.clear()
+        self.c = Client()
+
+    def tearDown(self):
+        ribo_handle_pool.clear()
+        self.tmp_dir.cleanup()
+
+    def test_api_phases(self):
+        url = "/api/experiment/{}/getCoverage".format(self.experiment.id)
+        # the cache counters are not reset between tests
+        hits = api_response_cache.stats()["hits"]
+        for _ in range(2):
+            response = self.c.get(url, {"gene": "t1"}, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response.status_code, 200)
+
+        response = self.c.get("/metrics", HTTP_AUTHORIZATION="Bearer token")
+        self.assertEqual(response["Content-Type"], metrics.PROMETHEUS_CONTENT_TYPE)
+        text = response.content.decode()
+
+        # the second request is answered from the cache
+        self.assertEqual(
+            sample(text, "ribograph_api_request_seconds_count", endpoint="getCoverage"),
+            2,
+        )
+        for phase in API_PHASES:
+            self.assertEqual(
+                sample(
+                    text,
+                    "ribograph_api_phase_seconds_count",
+                    endpoint="getCoverage",
+                    phase=phase,
+                ),
+                1,
+                msg=phase,
+            )
+
+        self.assertEqual(sample(text, "ribograph_response_cache_hits_total"), hits + 1)
+        self.assertEqual(
+            sample(
+                text,
+                "ribograph_ribo_handles_open",
+                worker="{}:{}".format(socket.gethostname(), os.getpid()),
+            ),
+            1,
+        )
+        self.assertEqual(sample(text, "ribograph_ribo_handles_open"), 1)
+        self.assertIsNotNone(
+            sample(
+                text,
+                "ribograph_memoize_misses_total",
+                cache="browser.api.get_cds_range_lookup",
+            )
+        )
+
+    def test_access(self):
+        # the address of the request does not matter, behind nginx it is the proxy
+        self.assertEqual(
+            self.c.get("/metrics", REMOTE_ADDR="127.0.0.1").status_code, 404
+        )
+        self.assertEqual(
+            self.c.get("/metrics", HTTP_AUTHORIZATION="Bearer token").status_code,
+            200,
+        )
+        self.assertEqual(
+            self.c.get("/metrics", HTTP_AUTHORIZATION="Bearer other").status_code,
+            404,
+        )
+        with mock.patch("browser.views.METRICS_TOKEN", ""):
+            self.assertEqual(
+                self.c.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 404
+            )
+
+        User.objects.create_user(username="staff", password="password", is_staff=True)
+        self.c.login(username="staff", password="password")
+        self.assertEqual(self.c.get("/metrics").status_code, 200)
+
+        with mock.patch("browser.views.METRICS_ENDPOINT", False):
+            self.assertEqual(self.c.get("/metrics").status_code, 404)
@@ -0,0 +1,67 @@
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import User, AnonymousUser
+
+from browser.models import Project, Experiment
+from browser.context_processor import get_user_projects
+
+#####################################################################
+
+
+class NavigationTestCase(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        self.public = Project.objects.create(
+            name="public", owner=self.owner, public=True
+        )
+        self.private = Project.objects.create(name="private", owner=self.owner)
+        for project in (self.public, self.private):
+            for i in range(3):
+                Experiment.objects.create(
+                    name="exp{}".format(i), project=project, ribo_file_path="x"
+                )
+
+    def projects(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        return get_user_projects(request)["projects"]
+
+    def test_trees_per_auth_class(self):
+        with self.assertNumQueries(2):
+            public_tree = self.projects(AnonymousUser())
+        with self.assertNumQueries(2):
+            full_tree = self.projects(self.owner)
+
+        self.assertEqual(list(public_tree), [self.public])
+        self.assertEqual(list(full_tree), [self.public, self.private])
+        self.assertEqual(
+            [e.name for e in full_tree[self.private]], ["exp0", "exp1", "exp2"]
+        )
+
+        with self.assertNumQueries(0):
+            self.projects(AnonymousUser())
+            self.projects(self.owner)
+
+    def test_constant_number_of_queries(self):
+        for i in range(10):
+            project = Project.objects.create(
+                name="extra{}".format(i), owner=self.owner, public=True
+            )
+            Experiment.objects.create(name="exp", project=project, ribo_file_path="x")
+
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.projects(AnonymousUser())), 11)
+
+    def test_invalidation(self):
+        self.projects(AnonymousUser())
+
+        experiment = Experiment.objects.create(
+            name="new", project=self.public, ribo_file_path="x"
+        )
+        self.assertIn(experiment, self.projects(AnonymousUser())[self.public])
+
+        experiment.delete()
+        self.assertNotIn(experiment, self.projects(AnonymousUser())[self.public])
+
+        self.private.public = True
+        self.private.save()
+        self.assertIn(self.private, self.projects(AnonymousUser()))
@@ -0,0 +1,212 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from browser.models import Project, Experiment, Reference
+from browser.api import (
+    api_response_cache,
+    ribo_handle_pool,
+    register_experiment_api,
+    register_project_api,
+)
+from browser.context_processor import invalidate_navigation
+from browser.ingestion import RiboIngestion
+from browser.jobs import enqueue
+from browser.tests.ribo_fixtures import make_ribo_file, make_reference_file
+
+#####################################################################
+
+# Maximum number of queries of every view and API, with empty caches.
+# Logged in requests include two queries for the session and the user.
+
+# (url name, url arguments): budget
+ANONYMOUS_VIEW_BUDGETS = {
+    ("index", ()): 3,
+    ("project_details", ("project_id",)): 5,
+    ("experiment_details", ("experiment_id",)): 4,
+    ("coverage", ("experiment_id",)): 5,
+    ("offset", ("experiment_id",)): 4,
+    ("gene_correlation", ("project_id",)): 2,
+    ("gene_correlation", ("project_id", "reference_hash")): 5,
+    ("compare_experiments", ("project_id",)): 5,
+    ("download_ribo", ("experiment_id",)): 2,
+    ("metrics", ()): 0,
+}
+
+LOGGED_IN_VIEW_BUDGETS = {
+    ("index", ()): 5,
+    ("project_details", ("project_id",)): 6,
+    ("experiment_details", ("experiment_id",)): 5,
+    ("references", ()): 5,
+    ("reference_details", ("reference_id",)): 5,
+    ("download_reference", ("reference_id",)): 3,
+    ("add_project", ()): 4,
+    ("add_reference", ()): 4,
+    ("delete_experiment", ("experiment_id",)): 5,
+    ("delete_project", ("project_id",)): 5,
+    ("delete_reference", ("reference_id",)): 5,
+    ("edit_project_description", ("project_id",)): 5,
+    ("list_jobs", ()): 3,
+}
+
+EXPERIMENT_API_BUDGETS = {
+    "getMetadata": 1,
+    "getRegionPercentages": 1,
+    "getLengthDistribution": 1,
+    "getMetageneCounts": 1,
+    "listGenes": 1,
+    "searchGenes": 1,
+    "getCoverage": 1,
+    "getOffsetCoverage": 1,
+    "getAutoOffsets": 1,
+    "getCoverageBatch": 1,
+    "listExperiments": 2,
+}
+
+PROJECT_API_BUDGETS = {
+    "getExperimentsCoverage": 2,
+    "getGeneCorrelations": 2,
+}
+
+
+class QueryBudgetTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.ribo_path = os.path.join(cls.tmp_dir.name, "test.ribo")
+        cls.names, cls.lengths = make_ribo_file(
+            cls.ribo_path, experiments=("exp1", "exp2")
+        )
+        cls.ingestion = RiboIngestion.run(cls.ribo_path)
+        cls.reference_path = os.path.join(cls.tmp_dir.name, "reference.gz")
+        make_reference_file(cls.reference_path, cls.names, cls.lengths)
+
+    @classmethod
+    def tearDownClass(cls):
+        ribo_handle_pool.clear()
+        cls.tmp_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.reference = Reference.objects.create(
+            name="reference", reference_file_path=self.reference_path, owner=self.user
+        )
+        enqueue("index_reference", reference_id=self.reference.id)
+
+        self.project = Project.objects.create(
+            name="public", owner=self.user, public=True
+        )
+        self.experiments = [
+            Experiment.objects.create(
+                name=name,
+                project=self.project,
+                ribo_file_path=self.ribo_path,
+                reference=self.reference,
+                reference_digest=self.ingestion.reference_digest,
+            )
+            for name in ("exp1", "exp2")
+        ]
+        for i in range(5):
+            project = Project.objects.create(
+                name="extra{}".format(i), owner=self.user, public=i % 2 == 0
+            )
+            Experiment.objects.create(
+                name="exp1", project=project, ribo_file_path=self.ribo_path
+            )
+
+        self.c = Client()
+
+        # the vue pages would otherwise need the built bundle
+        patch = mock.patch.dict(os.environ, {"RUN_VUE_SERVER": "1"})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def assert_query_budget(self, budget, url, params=None, status=(200, 302)):
+        api_response_cache.clear()
+        invalidate_navigation()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.c.get(url, params or {})
+            if hasattr(response, "streaming_content"):
+                b"".join(response.streaming_content)
+
+        self.assertIn(response.status_code, status, msg=url)
+        queries = [q["sql"] for q in context.captured_queries]
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            msg="{} made {} queries:\n{}".format(url, len(queries), "\n".join(queries)),
+        )
+
+    def view_url(self, name, argument_names):
+        arguments = {
+            "project_id": self.project.id,
+            "experiment_id": self.experiments[0].id,
+            "reference_id": self.reference.id,
+            "reference_hash": self.ingestion.reference_digest,
+        }
+        return reverse(
+            "browser:" + name, kwargs={k: arguments[k] for k in argument_names}
+        )
+
+    @mock.patch("browser.views.METRICS_ENDPOINT", True)
+    @mock.patch("browser.views.METRICS_TOKEN", "token")
+    def test_anonymous_views(self):
+        self.c = Client(HTTP_AUTHORIZATION="Bearer token")
+        for (name, argument_names), budget in ANONYMOUS_VIEW_BUDGETS.items():
+            self.assert_query_budget(budget, self.view_url(name, argument_names))
+
+    def test_logged_in_views(self):
+        self.c.login(username="owner", password="password")
+        for (name, argument_names), budget in LOGGED_IN_VIEW_BUDGETS.items():
+            self.assert_query_budget(budget, self.view_url(name, argument_names))
+
+    def experiment_api_params(self):
+        return {
+            "getMetageneCounts": {"site": "start"},
+            "getCoverage": {"gene": "t1"},
+            "getOffsetCoverage": {
+                "gene": "t1",
+                "offsets": ",".join(
+                    ["12"] * (self.ingestion.length_max - self.ingestion.length_min + 1)
+                ),
+            },
+            "getCoverageBatch": {"gene": ["t1", "t2"]},
+        }
+
+    def test_experiment_apis(self):
+        self.assertEqual(set(EXPERIMENT_API_BUDGETS), set(register_experiment_api.all))
+        params = self.experiment_api_params()
+        for endpoint, budget in EXPERIMENT_API_BUDGETS.items():
+            url = "/api/experiment/{}/{}".format(self.experiments[0].id, endpoint)
+            self.assert_query_budget(budget, url, params.get(endpoint), status=(200,))
+
+    def test_project_apis(self):
+        self.assertEqual(set(PROJECT_API_BUDGETS), set(register_project_api.all))
+        params = {
+            "getExperimentsCoverage": {
+                "gene": "t1",
+                "experiment": [e.id for e in self.experiments],
+            },
+            "getGeneCorrelations": {
+                "referenceHash": self.ingestion.reference_digest,
+                "range_lower": 0,
+                "range_upper": 0,
+            },
+        }
+        for endpoint, budget in PROJECT_API_BUDGETS.items():
+            url = "/api/project/{}/{}".format(self.project.id, endpoint)
+            self.assert_query_budget(budget, url, params[endpoint], status=(200,))
+
+    def test_logged_in_apis(self):
+        self.c.login(username="owner", password="password")
+        url = "/api/experiment/{}/listExperiments".format(self.experiments[0].id)
+        self.assert_query_budget(4, url, status=(200,))
@@ -0,0 +1,194 @@
+import os
+import tempfile
+from datetime import timedelta
+from hashlib import md5
+from unittest import mock
+
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils import timezone
+
+from browser.models import Project, ChunkedUpload
+from browser.uploads import save_upload, expire_uploads, part_hashes
+from browser.tests.ribo_fixtures import make_ribo_file
+
+#####################################################################
+
+
+class UploadTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        folders = {
+            "ribo": (os.path.join(self.tmp_dir.name, "ribo"), ".ribo"),
+            "reference": (os.path.join(self.tmp_dir.name, "reference"), ".gz"),
+        }
+        self.patches = [
+            mock.patch.dict("browser.uploads.UPLOAD_FOLDERS", folders),
+            mock.patch(
+                "browser.uploads.PART_FOLDER", os.path.join(self.tmp_dir.name, "parts")
+            ),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.project = Project.objects.create(name="project", owner=self.user)
+        self.c = Client()
+        self.c.login(username="owner", password="password")
+
+        ribo_path = os.path.join(self.tmp_dir.name, "test.ribo")
+        make_ribo_file(ribo_path, experiments=("exp1",))
+        with open(ribo_path, "rb") as input_stream:
+            self.content = input_stream.read()
+        self.digest = md5(self.content).hexdigest()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def uploaded_path(self, kind, digest):
+        folder, extension = {
+            "ribo": ("ribo", ".ribo"),
+            "reference": ("reference", ".gz"),
+        }[kind]
+        return os.path.join(self.tmp_dir.name, folder, digest + extension)
+
+    def test_save_upload(self):
+        digest = save_upload(SimpleUploadedFile("test.ribo", self.content), "ribo")
+
+        self.assertEqual(digest, self.digest)
+        with open(self.uploaded_path("ribo", digest), "rb") as input_stream:
+            self.assertEqual(input_stream.read(), self.content)
+        self.assertEqual(
+            os.listdir(os.path.join(self.tmp_dir.name, "ribo")), [digest + ".ribo"]
+        )
+
+    def test_chunked_upload(self):
+        status = self.c.post(
+            "/upload/init",
+            {"kind": "ribo", "size": len(self.content), "project_id": self.project.id},
+        ).json()
+        url = "/upload/{}".format(status["uploadId"])
+        chunk_size = len(self.content) // 3 + 1
+
+        offset = 0
+        while offset < len(self.content):
+            chunk = self.content[offset : offset + chunk_size]
+            status = self.c.put(
+                url + "?offset={}".format(offset),
+                chunk,
+                content_type="application/octet-stream",
+            ).json()
+            offset += len(chunk)
+            self.assertEqual(status["offset"], offset)
+
+            # a chunk at the wrong offset is refused, the answer says where to resume
+            response = self.c.put(
+                url + "?offset=0", b"x", content_type="application/octet-stream"
+            )
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()["offset"], offset)
+
+        response = self.c.post(url + "/finalize").json()
+
+        self.assertEqual(response["digest"], self.digest)
+        self.assertEqual(
+            response["redirect"],
+            reverse("browser:confirm_ribo_file", args=[self.project.id, self.digest]),
+        )
+        with open(self.uploaded_path("ribo", self.digest), "rb") as input_stream:
+            self.assertEqual(input_stream.read(), self.content)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_chunks_hashed_by_another_process(self):
+        status = self.c.post(
+            "/upload/init",
+            {"kind": "ribo", "size": len(self.content), "project_id": self.project.id},
+        ).json()
+        url = "/upload/{}".format(status["uploadId"])
+        half = len(self.content) // 2
+
+        self.c.put(
+            url + "?offset=0",
+            self.content[:half],
+            content_type="application/octet-stream",
+        )
+        # the first chunk went to another worker: its hash state is not here
+        part_hashes.clear()
+        self.c.put(
+            url + "?offset={}".format(half),
+            self.content[half:],
+            content_type="application/octet-stream",
+        )
+
+        response = self.c.post(url + "/finalize").json()
+        self.assertEqual(response["digest"], self.digest)
+        self.assertNotIn(status["uploadId"], part_hashes)
+
+    def test_incomplete_upload_is_not_finalized(self):
+        status = self.c.post("/upload/init", {"kind": "reference", "size": 10}).json()
+        url = "/upload/{}".format(status["uploadId"])
+        self.c.put(url + "?offset=0", b"12345", content_type="application/octet-stream")
+
+        response = self.c.post(url + "/finalize")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.c.get(url).json()["offset"], 5)
+
+    def test_invalid_ribo_file(self):
+        status = self.c.post(
+            "/upload/init",
+            {"kind": "ribo", "size": 4, "project_id": self.project.id},
+        ).json()
+        url = "/upload/{}".format(status["uploadId"])
+        self.c.put(url + "?offset=0", b"1234", content_type="application/octet-stream")
+
+        response = self.c.post(url + "/finalize")
+        self.assertEqual(response.status_code, 400)
+
+    def part_paths(self):
+        return os.listdir(os.path.join(self.tmp_dir.name, "parts"))
+
+    def test_upload_to_a_project_of_another_user(self):
+        User.objects.create_user(username="other", password="password")
+        client = Client()
+        client.login(username="other", password="password")
+
+        response = client.post(
+            "/upload/init", {"kind": "ribo", "size": 4, "project_id": self.project.id}
+        )
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_abort_upload(self):
+        status = self.c.post("/upload/init", {"kind": "reference", "size": 10}).json()
+        url = "/upload/{}".format(status["uploadId"])
+        self.c.put(url + "?offset=0", b"12345", content_type="application/octet-stream")
+
+        response = self.c.delete(url)
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(self.part_paths(), [])
+        self.assertEqual(self.c.get(url).status_code, 404)
+
+    def test_expire_uploads(self):
+        old = self.c.post("/upload/init", {"kind": "reference", "size": 10}).json()
+        new = self.c.post("/upload/init", {"kind": "reference", "size": 10}).json()
+        ChunkedUpload.objects.filter(id=old["uploadId"]).update(
+            creation_date=timezone.now() - timedelta(days=2)
+        )
+        orphan = os.path.join(self.tmp_dir.name, "parts", "orphan.part")
+        open(orphan, "wb").close()
+        os.utime(orphan, (0, 0))
+
+        self.assertEqual(expire_uploads(24 * 3600), 1)
+
+        self.assertEqual(
+            [str(upload.id) for upload in ChunkedUpload.objects.all()],
+            [new["uploadId"]],
+        )
+        self.assertEqual(self.part_paths(), [new["uploadId"] + ".part"])
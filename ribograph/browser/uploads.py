@@ -0,0 +1,174 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from hashlib import md5
+
+from cachetools import TTLCache
+from django.utils import timezone
+
+from ribograph.settings import UPLOAD_EXPIRY
+from .models import ChunkedUpload
+
+# Uploaded files wait in these folders, named after their md5 digest,
+# until the user confirms them.
+UPLOAD_FOLDERS = {
+    "ribo": (os.path.join("/tmp", "ribo"), ".ribo"),
+    "reference": (os.path.join("/tmp", "reference"), ".gz"),
+}
+
+# Part files of chunked uploads
+PART_FOLDER = os.path.join("/tmp", "uploads")
+
+COPY_SIZE = 1 << 20
+
+# md5 of the data received so far, by upload id, as (end, hash object), for the
+# uploads whose chunks this process wrote. A process that has no state for an
+# upload, or only an older one, hashes the missing part of the part file.
+part_hashes = TTLCache(maxsize=1024, ttl=UPLOAD_EXPIRY)
+part_hashes_lock = threading.Lock()
+
+
+def save_upload(file, kind: str) -> str:
+    """
+    Write an uploaded file to its upload folder, computing its md5 digest
+    on the way, and return the digest.
+    The file is written under a temporary name and renamed once it is complete.
+    """
+    folder, extension = UPLOAD_FOLDERS[kind]
+    os.makedirs(folder, exist_ok=True)
+
+    file_hash = md5()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as output_stream:
+            for chunk in file.chunks():
+                file_hash.update(chunk)
+                output_stream.write(chunk)
+        digest = file_hash.hexdigest()
+        os.replace(tmp_path, os.path.join(folder, digest + extension))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return digest
+
+
+##########################################################################
+
+
+def part_path(upload) -> str:
+    return os.path.join(PART_FOLDER, str(upload.id) + ".part")
+
+
+def create_part(upload):
+    os.makedirs(PART_FOLDER, exist_ok=True)
+    open(part_path(upload), "wb").close()
+
+
+def part_hash(upload, end: int):
+    """
+    Take the md5 hash object of the first end bytes of the part file of an upload
+    out of part_hashes, completing it from the part file where needed.
+    """
+    with part_hashes_lock:
+        state = part_hashes.pop(str(upload.id), None)
+    if state is None or state[0] > end:
+        state = (0, md5())
+    start, file_hash = state
+
+    if start < end:
+        with open(part_path(upload), "rb") as input_stream:
+            input_stream.seek(start)
+            limit = end - start
+            while limit > 0:
+                chunk = input_stream.read(min(COPY_SIZE, limit))
+                if not chunk:
+                    break
+                file_hash.update(chunk)
+                limit -= len(chunk)
+
+    return file_hash
+
+
+def write_chunk(upload, stream, offset: int) -> int:
+    """
+    Write the body of a chunk request to the part file of an upload, starting at
+    offset, and hash it on the way. Bytes past the declared size of the upload
+    are not written. Must be called with the upload row locked.
+    Returns the new end of the received data.
+    """
+    file_hash = part_hash(upload, offset)
+    limit = upload.size - offset
+    with open(part_path(upload), "r+b") as output_stream:
+        output_stream.seek(offset)
+        while limit > 0:
+            chunk = stream.read(min(COPY_SIZE, limit))
+            if not chunk:
+                break
+            file_hash.update(chunk)
+            output_stream.write(chunk)
+            limit -= len(chunk)
+        end = output_stream.tell()
+        # drop whatever an interrupted earlier attempt left behind
+        output_stream.truncate(end)
+
+    with part_hashes_lock:
+        part_hashes[str(upload.id)] = (end, file_hash)
+    return end
+
+
+def finalize_part(upload) -> str:
+    """
+    Move a completely received upload to its upload folder.
+    Returns the md5 digest of the file.
+    """
+    path = part_path(upload)
+    digest = part_hash(upload, upload.size).hexdigest()
+
+    folder, extension = UPLOAD_FOLDERS[upload.kind]
+    os.makedirs(folder, exist_ok=True)
+    os.replace(path, os.path.join(folder, digest + extension))
+    return digest
+
+
+def remove_part(upload):
+    with part_hashes_lock:
+        part_hashes.pop(str(upload.id), None)
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def expire_uploads(max_age: float) -> int:
+    """
+    Remove the chunked uploads started more than max_age seconds ago and their
+    part files, as well as part files left without an upload.
+    Returns the number of removed uploads.
+    """
+    expired = ChunkedUpload.objects.filter(
+        creation_date__lt=timezone.now() - timedelta(seconds=max_age)
+    )
+    count = 0
+    for upload in expired:
+        remove_part(upload)
+        upload.delete()
+        count += 1
+
+    if os.path.isdir(PART_FOLDER):
+        live = {
+            str(upload_id) + ".part"
+            for upload_id in ChunkedUpload.objects.values_list("id", flat=True)
+        }
+        oldest = time.time() - max_age
+        for name in os.listdir(PART_FOLDER):
+            path = os.path.join(PART_FOLDER, name)
+            try:
+                if name not in live and os.path.getmtime(path) < oldest:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    return count
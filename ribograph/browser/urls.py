@@ -3,16 +3,25 @@ from django.urls import path
 from . import views
 from .api import register_experiment_api, register_project_api
 
+from ribograph.settings import ASYNC_API
+
 app_name = "browser"
 
+if ASYNC_API:
+    experiment_apis = register_experiment_api.async_all
+    project_apis = register_project_api.async_all
+else:
+    experiment_apis = register_experiment_api.all
+    project_apis = register_project_api.all
+
 apipatterns = [
     path(f"api/experiment/<int:experiment_id>/{endpoint}", func)
-    for endpoint, func in register_experiment_api.all.items()
+    for endpoint, func in experiment_apis.items()
 ]
 
 apipatterns += [
     path(f"api/project/<int:project_id>/{endpoint}", func)
-    for endpoint, func in register_project_api.all.items()
+    for endpoint, func in project_apis.items()
 ]
 
 urlpatterns = [
@@ -35,6 +44,15 @@ urlpatterns = [
     path("<int:experiment_id>/coverage", views.coverage, name="coverage"),
     path("<int:experiment_id>/offset", views.offset, name="offset"),
     path("references", views.references, name="references"),
+    path("jobs", views.list_jobs, name="list_jobs"),
+    path("jobs/<int:job_id>", views.job_details, name="job_details"),
+    path("upload/init", views.upload_init, name="upload_init"),
+    path("upload/<uuid:upload_id>", views.upload_chunk, name="upload_chunk"),
+    path(
+        "upload/<uuid:upload_id>/finalize",
+        views.upload_finalize,
+        name="upload_finalize",
+    ),
     path(
         "<str:reference_hash>/record_reference",
         views.record_reference,
@@ -100,5 +118,6 @@ urlpatterns = [
         views.erase_reference,
         name="erase_reference",
     ),
+    path("metrics", views.metrics, name="metrics"),
     *apipatterns,
 ]
@@ -1,10 +1,19 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse
+from django.http import (
+    HttpResponse,
+    HttpResponseRedirect,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    HttpResponseForbidden,
+    Http404,
+    JsonResponse,
+)
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
 from django.contrib.auth.models import User, Group
+from django.db import transaction
 
-from browser.models import Project, Experiment, Reference
+from browser.models import Project, Experiment, Reference, ChunkedUpload, Job
 from browser.forms import (
     ProjectForm,
     NewUserForm,
@@ -25,19 +34,35 @@ from django.contrib import messages
 
 from django_tables2 import RequestConfig
 
-from ribopy import Ribo
 
+import hmac
 import os
 
-from hashlib import md5
-
-from ribograph.settings import RIBO_FOLDER, REFERENCE_FOLDER
+from ribograph.settings import (
+    RIBO_FOLDER,
+    REFERENCE_FOLDER,
+    UPLOAD_CHUNK_SIZE,
+    METRICS_ENDPOINT,
+    METRICS_TOKEN,
+)
 
 import shutil
 
-from .Fasta import FastaFile
-
-import re
+from .downloads import file_response
+from .uploads import (
+    UPLOAD_FOLDERS,
+    save_upload,
+    create_part,
+    write_chunk,
+    finalize_part,
+    remove_part,
+)
+from .Fasta import FastaFile, fasta_index_paths
+from .api import ribo_handle_pool
+from .metrics import PROMETHEUS_CONTENT_TYPE, registry as metrics_registry
+from .summary import remove_summary
+from .jobs import enqueue, job_status
+from .ingestion import RiboIngestion, IngestionError
 
 #############################################################################
 
@@ -50,15 +75,39 @@ def index(request):
 
     # If there are no users, then the system is run for the first time.
     # So let them create an admin account.
-    if len(User.objects.all()) == 0:
+    if not User.objects.exists():
         return HttpResponseRedirect(reverse("browser:add_admin_user"))
 
     return render(request, "browser/index.html")
 
 
+def has_metrics_token(request) -> bool:
+    scheme, _, token = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    return (
+        bool(METRICS_TOKEN)
+        and scheme.lower() == "bearer"
+        and hmac.compare_digest(token.strip(), METRICS_TOKEN)
+    )
+
+
+def metrics(request):
+    """
+    The metrics of this process, in the Prometheus text format.
+    """
+    if not METRICS_ENDPOINT:
+        raise Http404
+    # the token is checked first, so that scrapes need no session lookup
+    if not (has_metrics_token(request) or request.user.is_staff):
+        raise Http404
+    return HttpResponse(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 def is_public_project(project_id: int):
-    public_projects = Project.objects.filter(public=True)
-    return project_id in [project.id for project in public_projects]
+    return Project.objects.filter(id=project_id, public=True).exists()
+
+
+def is_public_experiment(experiment_id: int):
+    return Experiment.objects.filter(id=experiment_id, project__public=True).exists()
 
 
 def verify_user_access(view_function):
@@ -70,11 +119,11 @@ def verify_user_access(view_function):
 
     def _wrapped_view(*args, **kwargs):
         request = args[0]
-        if request.method != "GET":
+        # logged in users see every project, so there is nothing to look up
+        if request.method != "GET" or request.user.is_authenticated:
             return login_required(view_function)(*args, **kwargs)
         if "experiment_id" in kwargs:
-            experiment = Experiment.objects.get(id=kwargs["experiment_id"])
-            if is_public_project(experiment.project.id):
+            if is_public_experiment(kwargs["experiment_id"]):
                 return view_function(*args, **kwargs)
         elif "project_id" in kwargs:
             if is_public_project(kwargs["project_id"]):
@@ -89,7 +138,7 @@ def verify_user_access(view_function):
 
 @verify_user_access
 def coverage(request, experiment_id):
-    this_experiment = Experiment.objects.get(id=experiment_id)
+    this_experiment = Experiment.objects.select_related("project").get(id=experiment_id)
     this_project = this_experiment.project
 
     reference_form = ExperimentReferenceForm(instance=this_experiment)
@@ -112,7 +161,7 @@ def coverage(request, experiment_id):
 
 @verify_user_access
 def offset(request, experiment_id):
-    this_experiment = Experiment.objects.get(id=experiment_id)
+    this_experiment = Experiment.objects.select_related("project").get(id=experiment_id)
     this_project = this_experiment.project
 
     context = {
@@ -197,7 +246,7 @@ def project_details(request, project_id):
 def add_admin_user(request):
 
     # If there are already registered users, then redirect to the index page.
-    if len(User.objects.all()) > 0:
+    if User.objects.exists():
         return HttpResponseRedirect(reverse("browser:index"))
 
     context = {}
@@ -234,19 +283,24 @@ def project_details(request, project_id):
         "experiments_exist": experiments_exist,
         "experiment_table": experiment_table,
         "upload_form": upload_form,
+        "upload_chunk_size": UPLOAD_CHUNK_SIZE,
     }
 
     if request.method == "POST":
         form = UploadRiboFileForm(request.POST, request.FILES)
         if form.is_valid():
-            os.makedirs(os.path.join("/tmp", "ribo"), exist_ok=True)
-
             file_digest = handle_uploaded_file(request.FILES["ribo_file"])
 
+            # open the file once and keep everything the next steps need
+            job = start_ribo_ingestion(request, file_digest)
+            if job.status == Job.FAILED:
+                form.add_error("ribo_file", job.message)
+                context["upload_form"] = form
+                return render(request, "browser/project_details.html", context)
+
             project_id = form.cleaned_data["project_id"]
-            project = Project.objects.get(id=project_id)
             return HttpResponseRedirect(
-                reverse("browser:confirm_ribo_file", args=[project_id, file_digest])
+                confirm_ribo_file_url(project_id, file_digest, job)
             )
 
         context["upload_form"] = form
@@ -255,87 +309,70 @@ def project_details(request, project_id):
     return render(request, "browser/project_details.html", context)
 
 
-def digest_reference(ribo_handle):
+def start_ribo_ingestion(request, file_digest):
     """
-    We take the transcript names and concatanate transcript lengths to them.
-    Then we hash the resulting value.
-    If the hashed values are same for two experiments, we can
-    assume that they come from the same reference.
+    Ingest an uploaded ribo file in a background job.
+    Without background jobs, the returned job has already finished.
     """
-    transcript_names = ribo_handle.transcript_names
-    transcript_lengths_dict = ribo_handle.transcript_lengths
-    transcript_lengths = [
-        str(transcript_lengths_dict[t_name]) for t_name in transcript_names
-    ]
-
-    transcript_names_string = ",".join(transcript_names)
-    transcript_lengths_string = ",".join(transcript_lengths)
-
-    string_to_be_digested = transcript_names_string + transcript_lengths_string
-    transcript_hash = md5()
-    transcript_hash.update(string_to_be_digested.encode("ascii"))
-
-    return transcript_hash.hexdigest()
-
-
-##########################################################################################
+    folder, extension = UPLOAD_FOLDERS["ribo"]
+    return enqueue(
+        "ingest_ribo",
+        owner=request.user,
+        ribo_file_path=os.path.join(folder, file_digest + extension),
+    )
 
 
-def determine_transcript_regex(ribo_path):
-    """
-    If the transcript name has many "|"s, then
-    our guess is it is coming from Appris.
-    So we will pick the names between 3rd and fourth "|"s.
-    If not, then we will return empty string.
-    """
-    this_handle = Ribo(ribo_path)
-    transcript_names = this_handle.transcript_names
+def confirm_ribo_file_url(project_id, file_digest, job):
+    url = reverse("browser:confirm_ribo_file", args=[project_id, file_digest])
+    if not job.finished:
+        url += "?job={}".format(job.id)
+    return url
 
-    number_of_bars = len(re.findall(r"\|", transcript_names[0]))
 
-    # If there are many bars, we assume that it is coming from the appris reference
-    # So we pich the 5th element which is
-    # GeneName-TranscriptNumber
-    # E.g.: Rfpl4-201
-    regex = ""
+@login_required
+def confirm_ribo_file(request, project_id, file_digest):
 
-    if number_of_bars > 8:
-        regex = "^(?:[^|]*\|){4}([^|]*)\|.*$"
+    folder, extension = UPLOAD_FOLDERS["ribo"]
+    file_path = os.path.join(folder, file_digest + extension)
+    this_project = get_object_or_404(Project, id=project_id)
+    if not may_upload_to(request.user, this_project):
+        return HttpResponseForbidden("You can not upload files to this project.")
+
+    # the results of inspecting the file at upload time
+    ingestion = RiboIngestion.load(file_path)
+    if ingestion is None:
+        job_id = request.GET.get("job", "")
+        job = (
+            Job.objects.filter(id=job_id, owner=request.user).first()
+            if job_id.isdigit()
+            else None
+        )
+        if job is not None and not job.finished:
+            return render(request, "browser/job_progress.html", {"job": job})
+        if job is not None and job.status == Job.FAILED:
+            return render_error(request, job.message)
 
-    # Mak sure the alias coming from the regular expression is accepted by ribo
-    if regex:
         try:
-            this_ribo = Ribo(ribo_path, alias=lambda x: re.search(regex, x).group(1))
-        except:
-            return ""
-
-    return regex
-
-
-def confirm_ribo_file(request, project_id, file_digest):
-
-    file_path = os.path.join("/tmp/ribo", file_digest + ".ribo")
-    this_project = Project.objects.get(id=project_id)
+            ingestion = RiboIngestion.run(file_path)
+        except IngestionError as e:
+            return render_error(request, str(e))
 
     if request.method == "POST":
         experiment_form_set = ExperimentPickFormSet(request.POST)
         if experiment_form_set.is_valid():
             os.makedirs(os.path.join(RIBO_FOLDER, this_project.name), exist_ok=True)
-            source_path = file_path
             target_path = os.path.join(
                 RIBO_FOLDER, this_project.name, file_digest + ".ribo"
             )
-            shutil.move(source_path, target_path)
-
-            this_ribo = Ribo(target_path)
-            this_ribo_reference_digest = digest_reference(this_ribo)
-            transcript_regex = determine_transcript_regex(target_path)
+            ingestion.move(target_path)
 
             ### Make sure that another experiment with the same name does not exist
 
             duplicate_experiment_names = []
-            existing_experiment_names = map(
-                lambda x: x.name, Experiment.objects.filter(project=this_project)
+            existing_experiment_names = set(
+                Experiment.objects.filter(project=this_project).values_list(
+                    "name", flat=True
+                )
             )
 
             for form in experiment_form_set:
@@ -350,7 +387,7 @@ def confirm_ribo_file(request, project_id, file_digest):
                     "The following experiments already exist in this project: "
                     + ", ".join(duplicate_experiment_names)
                 )
-                return erase_reference(request, error_message)
+                return render_error(request, error_message)
 
             for form in experiment_form_set:
                 experiment_name = form.cleaned_data.get("experiment")
@@ -360,18 +397,24 @@ def confirm_ribo_file(request, project_id, file_digest):
                         name=experiment_name,
                         project=this_project,
                         ribo_file_path=target_path,
-                        reference_digest=this_ribo_reference_digest,
-                        transcript_regex=transcript_regex,
+                        reference_digest=ingestion.reference_digest,
+                        transcript_regex=ingestion.transcript_regex,
                     )
                     this_experiment.save()
 
+            enqueue(
+                "warm_gene_correlations",
+                inline=False,
+                unique=True,
+                project_id=this_project.id,
+                reference_hash=ingestion.reference_digest,
+            )
+
         return HttpResponseRedirect(
             reverse("browser:project_details", args=[project_id])
         )
     else:
-        myribo = Ribo(file_path)
-
-        experiments = myribo.experiments
+        experiments = ingestion.experiments
         form_initial = [{"experiment": e, "selected": True} for e in experiments]
 
         experiment_form_set = ExperimentPickFormSet(initial=form_initial)
@@ -386,24 +429,7 @@ def confirm_ribo_file(request, project_id, file_digest):
 
 
 def handle_uploaded_file(file):
-    my_hash_raw = md5()
-    chunk = file.read(8192)
-    while chunk:
-        my_hash_raw.update(chunk)
-        chunk = file.read(8192)
-
-    file_name = "{}.ribo".format(my_hash_raw.hexdigest())
-    tmp_ribo_path = os.path.join("/tmp", "ribo", file_name)
-
-    file.seek(0)
-    with open(tmp_ribo_path, "wb") as output_stream:
-        output_stream.write(file.read())
-
-    return my_hash_raw.hexdigest()
-
-
-def validate_ribo_file(ribo_file):
-    return True
+    return save_upload(file, "ribo")
 
 
 ##########################################################################
@@ -411,7 +437,7 @@ def validate_ribo_file(ribo_file):
 
 @verify_user_access
 def experiment_details(request, experiment_id):
-    this_experiment = Experiment.objects.get(id=experiment_id)
+    this_experiment = Experiment.objects.select_related("project").get(id=experiment_id)
     this_project = this_experiment.project
 
     if request.method == "POST":
@@ -421,7 +447,7 @@ def experiment_details(request, experiment_id):
 
         if description_form.is_valid():
             description_form.save()
-            this_experiment = Experiment.objects.get(id=experiment_id)
+            this_experiment.refresh_from_db()
 
     description_form = ExperimentDescriptionForm(instance=this_experiment)
 
@@ -440,16 +466,12 @@ def experiment_details(request, experiment_id):
 @verify_user_access
 def download_ribo(request, experiment_id):
     this_experiment = Experiment.objects.get(id=experiment_id)
-    this_project = this_experiment.project
     file_path = this_experiment.ribo_file_path
 
     if os.path.exists(file_path):
-        with open(file_path, "rb") as fh:
-            response = HttpResponse(fh.read(), content_type="application/vnd.ms-excel")
-            response["Content-Disposition"] = (
-                "inline; filename=" + this_experiment.name + ".ribo"
-            )
-        return response
+        return file_response(
+            request, file_path, this_experiment.name + ".ribo", "application/x-hdf5"
+        )
 
     raise Http404
 
@@ -461,7 +483,7 @@ def download_ribo(request, experiment_id):
 def delete_experiment(request, experiment_id):
     context = dict()
 
-    this_experiment = Experiment.objects.get(id=experiment_id)
+    this_experiment = Experiment.objects.select_related("project").get(id=experiment_id)
     context["experiment"] = this_experiment
     context["project"] = this_experiment.project
 
@@ -481,6 +503,8 @@ def _erase_experiment(this_experiment):
     )
 
     if len(other_experiments_with_same_ribo_file) == 0:
+        ribo_handle_pool.discard(experiment_ribo_file)
+        remove_summary(experiment_ribo_file)
         os.remove(experiment_ribo_file)
 
 
@@ -488,7 +512,7 @@ def _erase_experiment(this_experiment):
 def erase_experiment(request, experiment_id):
     context = dict()
 
-    this_experiment = Experiment.objects.get(id=experiment_id)
+    this_experiment = Experiment.objects.select_related("project").get(id=experiment_id)
     this_project = this_experiment.project
 
     _erase_experiment(this_experiment)
@@ -584,12 +608,12 @@ def add_reference(request):
 
     context = {
         "form": form,
+        "upload_chunk_size": UPLOAD_CHUNK_SIZE,
     }
 
     if request.method == "POST":
         form = ReferenceUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            os.makedirs(os.path.join("/tmp", "reference"), exist_ok=True)
             file_digest = handle_reference_file(request.FILES["reference_file"])
 
             return HttpResponseRedirect(
@@ -631,6 +655,12 @@ def record_reference(request, reference_hash):
                 ),
             )
             this_reference.save()
+
+            # index the sequences so that single genes can be read without parsing
+            # the file, and record which experiments the reference fits
+            enqueue(
+                "index_reference", owner=request.user, reference_id=this_reference.id
+            )
             return HttpResponseRedirect(reverse("browser:references"))
 
         return render(request, "browser/list_references.html", {})
@@ -648,20 +678,127 @@ def record_reference(request, reference_hash):
 
 
 def handle_reference_file(file):
-    my_hash_raw = md5()
-    chunk = file.read(8192)
-    while chunk:
-        my_hash_raw.update(chunk)
-        chunk = file.read(8192)
+    return save_upload(file, "reference")
 
-    file_name = "{}.gz".format(my_hash_raw.hexdigest())
-    tmp_reference_path = os.path.join("/tmp", "reference", file_name)
 
-    file.seek(0)
-    with open(tmp_reference_path, "wb") as output_stream:
-        output_stream.write(file.read())
+##########################################################################
+# Chunked uploads
+#
+# init:     POST upload/init          kind, size, file_name (, project_id)
+# status:   GET  upload/<id>          offset to resume from
+# chunk:    PUT  upload/<id>?offset=  raw bytes of the next chunk
+# abort:    DELETE upload/<id>
+# finalize: POST upload/<id>/finalize
+#
+# Uploads that are never finalized or aborted are removed after UPLOAD_EXPIRY
+# seconds by `python manage.py expire_uploads`.
+##########################################################################
+
+
+def may_upload_to(user, project) -> bool:
+    return user.is_staff or project.owner_id == user.id
 
-    return my_hash_raw.hexdigest()
+
+def upload_status(upload):
+    return {
+        "uploadId": str(upload.id),
+        "offset": upload.offset,
+        "size": upload.size,
+        "chunkSize": UPLOAD_CHUNK_SIZE,
+    }
+
+
+@login_required
+def upload_init(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    kind = request.POST.get("kind")
+    try:
+        size = int(request.POST.get("size"))
+    except (TypeError, ValueError):
+        size = -1
+    if kind not in UPLOAD_FOLDERS or size < 0:
+        return HttpResponseBadRequest("kind and size must be provided")
+
+    project = None
+    if kind == "ribo":
+        project = get_object_or_404(Project, id=request.POST.get("project_id"))
+        if not may_upload_to(request.user, project):
+            return HttpResponseForbidden("You can not upload files to this project.")
+
+    upload = ChunkedUpload.objects.create(
+        kind=kind,
+        size=size,
+        file_name=request.POST.get("file_name", "")[:255],
+        project=project,
+        owner=request.user,
+    )
+    create_part(upload)
+
+    return JsonResponse(upload_status(upload))
+
+
+@login_required
+def upload_chunk(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, owner=request.user)
+
+    if request.method == "GET":
+        return JsonResponse(upload_status(upload))
+
+    if request.method == "DELETE":
+        remove_part(upload)
+        upload.delete()
+        return HttpResponse(status=204)
+
+    if request.method not in ("PUT", "POST"):
+        return HttpResponseNotAllowed(["GET", "PUT", "POST", "DELETE"])
+
+    try:
+        offset = int(request.GET.get("offset"))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("offset must be provided")
+
+    # the row lock serializes the requests for one upload, so that two of them
+    # can not both write at the same offset
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().get(id=upload.id)
+
+        # chunks are appended in order, the client resumes from the returned offset
+        if offset != upload.offset:
+            return JsonResponse(upload_status(upload), status=409)
+
+        upload.offset = write_chunk(upload, request, offset)
+        upload.save(update_fields=["offset"])
+
+    return JsonResponse(upload_status(upload))
+
+
+@login_required
+def upload_finalize(request, upload_id):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    with transaction.atomic():
+        upload = get_object_or_404(
+            ChunkedUpload.objects.select_for_update(), id=upload_id, owner=request.user
+        )
+        if upload.offset != upload.size:
+            return JsonResponse(upload_status(upload), status=409)
+
+        file_digest = finalize_part(upload)
+        upload.delete()
+
+    if upload.kind == "ribo":
+        job = start_ribo_ingestion(request, file_digest)
+        if job.status == Job.FAILED:
+            return HttpResponseBadRequest(job.message)
+
+        redirect = confirm_ribo_file_url(upload.project_id, file_digest, job)
+    else:
+        redirect = reverse("browser:record_reference", args=[file_digest])
+
+    return JsonResponse({"digest": file_digest, "redirect": redirect})
 
 
 @login_required
@@ -672,6 +809,21 @@ def finalize_reference(request):
 #########################################################################
 
 
+@login_required
+def job_details(request, job_id):
+    job = get_object_or_404(Job, id=job_id, owner=request.user)
+    return JsonResponse(job_status(job))
+
+
+@login_required
+def list_jobs(request):
+    jobs = Job.objects.filter(owner=request.user).order_by("-id")[:50]
+    return JsonResponse({"jobs": [job_status(job) for job in jobs]})
+
+
+#########################################################################
+
+
 @login_required
 def reference_details(request, reference_id):
 
@@ -700,12 +852,9 @@ def download_reference(request, reference_id):
     file_path = reference.reference_file_path
 
     if os.path.exists(file_path):
-        with open(file_path, "rb") as fh:
-            response = HttpResponse(fh.read(), content_type="application/vnd.ms-excel")
-            response["Content-Disposition"] = (
-                "inline; filename=" + reference.name + ".fa.gz"
-            )
-        return response
+        return file_response(
+            request, file_path, reference.name + ".fa.gz", "application/gzip"
+        )
 
     raise Http404
 
@@ -730,6 +879,9 @@ def delete_reference(request, reference_id):
 def erase_reference(request, reference_id):
     reference = get_object_or_404(Reference, id=reference_id)
     os.remove(reference.reference_file_path)
+    for index_path in fasta_index_paths(reference.reference_file_path):
+        if os.path.exists(index_path):
+            os.remove(index_path)
     reference.delete()
 
     return HttpResponseRedirect(reverse("browser:references"))
@@ -739,7 +891,7 @@ def erase_reference(request, reference_id):
 
 
 @login_required
-def erase_reference(request, error_message):
+def render_error(request, error_message):
 
     context = {"error_message": error_message}
     return render(request, "browser/error_page.html", context)
@@ -0,0 +1,270 @@
+import json
+import struct
+import importlib.util
+
+import numpy as np
+
+from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_vary_headers
+
+# Content types of the encodings an API client can ask for, either with the
+# Accept header or with a "format" url parameter (json, binary or arrow).
+JSON_CONTENT_TYPE = "application/json"
+BINARY_CONTENT_TYPE = "application/vnd.ribograph.binary"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+FORMATS = {
+    "json": JSON_CONTENT_TYPE,
+    "binary": BINARY_CONTENT_TYPE,
+    "arrow": ARROW_CONTENT_TYPE,
+}
+
+BINARY_MAGIC = b"RGB1"
+BINARY_ALIGNMENT = 8
+
+
+def arrow_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def split(data, index, columns) -> dict:
+    """
+    A 2D array with labelled rows and columns, laid out as the split dict of pandas.
+    The array is kept as is, so that it can be sent as a packed buffer, and
+    consecutive integer labels are kept as ranges, so they cost nothing to send.
+    """
+    return {
+        "index": _compact_axis(index),
+        "columns": _compact_axis(columns),
+        "data": np.asarray(data),
+    }
+
+
+def split_frame(df) -> dict:
+    return split(df.to_numpy(), df.index, df.columns)
+
+
+def _compact_axis(values):
+    if isinstance(values, range):
+        return values
+    values = np.asarray(values)
+    if (
+        values.ndim == 1
+        and len(values) > 0
+        and values.dtype.kind in "iu"
+        and np.array_equal(values, np.arange(values[0], values[0] + len(values)))
+    ):
+        return range(int(values[0]), int(values[0]) + len(values))
+    return values.tolist()
+
+
+def compact_array(array: np.ndarray) -> np.ndarray:
+    """
+    Counts in the ribo files are unsigned integers of various widths.
+    They are sent in the smallest of uint16 / uint32 that holds them
+    (or as float64, which is exact up to 2^53 and readable in every browser).
+    """
+    array = np.asarray(array)
+    if array.dtype.kind in "iu":
+        low = int(array.min()) if array.size else 0
+        high = int(array.max()) if array.size else 0
+        if low >= 0 and high <= np.iinfo(np.uint16).max:
+            return array.astype("<u2", copy=False)
+        if low >= 0 and high <= np.iinfo(np.uint32).max:
+            return array.astype("<u4", copy=False)
+        if low >= np.iinfo(np.int32).min and high <= np.iinfo(np.int32).max:
+            return array.astype("<i4", copy=False)
+    return array.astype("<f8", copy=False)
+
+
+##########################################################################
+
+
+def negotiate_format(request):
+    """
+    The encoding a request asks for: "json" (the default), "binary" or "arrow".
+    Returns None if the request can not be served in the asked encoding.
+    """
+    name = request.GET.get("format")
+    if name is None:
+        accepted = [
+            part.split(";")[0].strip()
+            for part in request.META.get("HTTP_ACCEPT", "").split(",")
+        ]
+        name = next(
+            (n for n, t in FORMATS.items() if t in accepted and n != "json"), "json"
+        )
+        if name == "arrow" and not arrow_available():
+            # fall back rather than fail when the client merely accepts arrow
+            name = "json"
+
+    if name not in FORMATS or (name == "arrow" and not arrow_available()):
+        return None
+    return name
+
+
+class WireJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        if isinstance(o, range):
+            return list(o)
+        return super().default(o)
+
+
+def _extract_buffers(value, buffers):
+    """
+    Replace the arrays of a response by references to a list of buffers.
+    """
+    if isinstance(value, np.ndarray):
+        buffers.append(compact_array(value))
+        return {"$array": len(buffers) - 1}
+    if isinstance(value, range):
+        return {"$range": [value.start, value.stop, value.step]}
+    if isinstance(value, dict):
+        return {k: _extract_buffers(v, buffers) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_extract_buffers(v, buffers) for v in value]
+    return value
+
+
+def _padding(size: int) -> int:
+    return -size % BINARY_ALIGNMENT
+
+
+def encode_binary(result) -> bytes:
+    """
+    Layout, all little-endian:
+
+        4 bytes   magic, "RGB1"
+        4 bytes   uint32 length of the header
+        header    utf-8 JSON, space padded to a multiple of 8 bytes
+        buffers   the raw arrays (C order), each starting at a multiple of 8 bytes
+
+    The header is {"data": ..., "buffers": [{"dtype", "shape", "offset", "byteLength"}]},
+    where data is the response with its arrays replaced by {"$array": i},
+    integer ranges by {"$range": [start, stop, step]}, and offsets are relative
+    to the end of the header.
+    """
+    buffers = []
+    data = _extract_buffers(result, buffers)
+
+    descriptions, offset = [], 0
+    for buffer in buffers:
+        descriptions.append(
+            {
+                "dtype": buffer.dtype.name,
+                "shape": list(buffer.shape),
+                "offset": offset,
+                "byteLength": buffer.nbytes,
+            }
+        )
+        offset += buffer.nbytes + _padding(buffer.nbytes)
+
+    header = json.dumps(
+        {"data": data, "buffers": descriptions},
+        cls=WireJSONEncoder,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    header += b" " * _padding(len(header))
+
+    parts = [BINARY_MAGIC, struct.pack("<I", len(header)), header]
+    for buffer in buffers:
+        parts.append(np.ascontiguousarray(buffer).tobytes())
+        parts.append(b"\0" * _padding(buffer.nbytes))
+    return b"".join(parts)
+
+
+def decode_binary(content: bytes):
+    """
+    The inverse of encode_binary, with the arrays as numpy arrays.
+    browser/src/utils.ts has the decoder used by the frontend.
+    """
+    if content[:4] != BINARY_MAGIC:
+        raise ValueError("Not a binary API response")
+    (header_length,) = struct.unpack("<I", content[4:8])
+    header = json.loads(content[8 : 8 + header_length].decode("utf-8"))
+    start = 8 + header_length
+
+    arrays = [
+        np.frombuffer(
+            content,
+            dtype=np.dtype(b["dtype"]).newbyteorder("<"),
+            count=int(np.prod(b["shape"])),
+            offset=start + b["offset"],
+        ).reshape(b["shape"])
+        for b in header["buffers"]
+    ]
+
+    def revive(value):
+        if isinstance(value, dict):
+            if "$array" in value:
+                return arrays[value["$array"]]
+            if "$range" in value:
+                return range(*value["$range"])
+            return {k: revive(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [revive(v) for v in value]
+        return value
+
+    return revive(header["data"])
+
+
+def encode_arrow(result) -> bytes:
+    """
+    An Arrow IPC stream of a single row. Column "b<i>" holds buffer i, flattened,
+    and the JSON header of the binary encoding is kept in the schema metadata.
+    """
+    import pyarrow as pa
+
+    buffers = []
+    data = _extract_buffers(result, buffers)
+
+    columns = [
+        pa.LargeListArray.from_arrays([0, b.size], pa.array(b.ravel())) for b in buffers
+    ]
+    header = json.dumps(
+        {
+            "data": data,
+            "buffers": [
+                {"dtype": b.dtype.name, "shape": list(b.shape)} for b in buffers
+            ],
+        },
+        cls=WireJSONEncoder,
+    )
+    batch = pa.RecordBatch.from_arrays(
+        columns, names=["b{}".format(i) for i in range(len(buffers))]
+    )
+    batch = batch.replace_schema_metadata({"ribograph": header})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_response(result, wire_format: str = "json") -> HttpResponse:
+    """
+    Encode the result of an API in the negotiated format.
+    """
+    if wire_format == "binary":
+        response = HttpResponse(encode_binary(result), content_type=BINARY_CONTENT_TYPE)
+    elif wire_format == "arrow":
+        response = HttpResponse(encode_arrow(result), content_type=ARROW_CONTENT_TYPE)
+    else:
+        response = HttpResponse(
+            json.dumps(result, cls=WireJSONEncoder), content_type=JSON_CONTENT_TYPE
+        )
+    patch_vary_headers(response, ("Accept",))
+    return response
+
+
+def not_acceptable() -> HttpResponse:
+    return HttpResponse(
+        "format must be one of "
+        + ", ".join(n for n in FORMATS if n != "arrow" or arrow_available()),
+        status=406,
+    )
@@ -144,6 +144,92 @@ STATIC_URL = "/static/"
 RIBO_FOLDER = "/data/ribo_files"
 REFERENCE_FOLDER = "/data/reference_files"
 
+# When set, file downloads are handed to nginx through X-Accel-Redirect after
+# the permission checks. Each folder maps to an internal location in
+# Docker/nginx/default.conf.
+DOWNLOAD_ACCEL_REDIRECT = bool(int(os.environ.get("DOWNLOAD_ACCEL_REDIRECT", 0)))
+DOWNLOAD_ACCEL_LOCATIONS = {
+    RIBO_FOLDER: "/protected/ribo_files/",
+    REFERENCE_FOLDER: "/protected/reference_files/",
+}
+
+# Size of the chunks of resumable uploads. Each chunk is one request,
+# so this has to stay below client_max_body_size of nginx.
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 64 * 1024 * 1024))
+
+# Seconds after which `python manage.py expire_uploads` removes a resumable
+# upload that was never finalized, together with its part file.
+UPLOAD_EXPIRY = int(os.environ.get("UPLOAD_EXPIRY", 7 * 24 * 3600))
+
+# Seconds the project / experiment navigation tree is cached by each process.
+# Changes made in the same process invalidate it right away.
+NAVIGATION_CACHE_TTL = int(os.environ.get("NAVIGATION_CACHE_TTL", 60))
+
+# Run ingestion, summaries and cache warming in background jobs picked up by
+# `python manage.py worker`. When this is off, jobs that have to happen run
+# right away in the request and the optional ones (cache warming) are skipped.
+BACKGROUND_JOBS = bool(int(os.environ.get("BACKGROUND_JOBS", 0)))
+
+# Seconds an idle worker waits before looking for new jobs again.
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+
+# Seconds after which a running job is marked as failed, e.g. because its
+# worker was killed. This has to be longer than the slowest ingestion.
+JOB_TIMEOUT = float(os.environ.get("JOB_TIMEOUT", 6 * 3600))
+
+# Number of processes started by `python manage.py worker`.
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", 2))
+
+# Maximum number of ribo (hdf5) files kept open by each worker process.
+RIBO_HANDLE_POOL_SIZE = int(os.environ.get("RIBO_HANDLE_POOL_SIZE", 64))
+
+# Maximum number of genes in one getCoverageBatch request.
+COVERAGE_BATCH_LIMIT = int(os.environ.get("COVERAGE_BATCH_LIMIT", 500))
+
+# Number of threads reading coverage from different ribo files
+# for a single getExperimentsCoverage request.
+COVERAGE_READ_WORKERS = int(os.environ.get("COVERAGE_READ_WORKERS", 4))
+
+# Default and largest page size of the searchGenes API.
+GENE_SEARCH_LIMIT = int(os.environ.get("GENE_SEARCH_LIMIT", 100))
+GENE_SEARCH_MAX_LIMIT = int(os.environ.get("GENE_SEARCH_MAX_LIMIT", 1000))
+
+# Serve the experiment and project APIs with async views (under ASGI).
+# Their ribopy reads run on ASYNC_API_WORKERS threads, at most
+# ASYNC_API_PER_FILE at a time for the same ribo file, and a request
+# gets a 504 response after API_DEADLINE seconds.
+ASYNC_API = bool(int(os.environ.get("ASYNC_API", 0)))
+ASYNC_API_WORKERS = int(os.environ.get("ASYNC_API_WORKERS", 16))
+ASYNC_API_PER_FILE = int(os.environ.get("ASYNC_API_PER_FILE", 4))
+API_DEADLINE = float(os.environ.get("API_DEADLINE", 30))
+
+# Where the CPU heavy parts of the project APIs (gene correlations) run:
+# "inline" (in the web worker) or "process" (on a pool of COMPUTE_PROCESSES
+# worker processes). A job taking longer than COMPUTE_TIMEOUT seconds fails.
+COMPUTE_BACKEND = os.environ.get("COMPUTE_BACKEND", "inline")
+COMPUTE_PROCESSES = int(os.environ.get("COMPUTE_PROCESSES", 2))
+COMPUTE_TIMEOUT = float(os.environ.get("COMPUTE_TIMEOUT", 120))
+
+# Serve the API timings and the cache and handle statistics of each process
+# at /metrics, in the Prometheus text format. Only staff users and requests
+# with an "Authorization: Bearer <METRICS_TOKEN>" header (e.g. from the
+# Prometheus server) get them. The address of a request can not be used for
+# this, behind nginx every request comes from the proxy.
+METRICS_ENDPOINT = bool(int(os.environ.get("METRICS_ENDPOINT", 0)))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Response cache of the experiment and project APIs.
+# BACKEND is one of "local" (per worker process), "sqlite" (on-disk, shared
+# by all workers on the host) or "redis" (LOCATION is then a redis:// url).
+API_CACHE = {
+    "BACKEND": os.environ.get("API_CACHE_BACKEND", "local"),
+    "LOCATION": os.environ.get(
+        "API_CACHE_LOCATION", "/tmp/ribograph/api_cache.sqlite3"
+    ),
+    "MAX_BYTES": int(os.environ.get("API_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    "TTL": int(os.environ.get("API_CACHE_TTL", 600)),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 